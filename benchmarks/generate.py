@@ -0,0 +1,68 @@
+"""Generate synthetic mchy programs of a controllable shape for compiler benchmarking"""
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+
+
+@dataclass(frozen=True)
+class ProgramShape:
+    functions: int = 10  # Number of generated functions, each calls the previous one
+    nesting_depth: int = 2  # Depth of nested if statements in each function
+    loops: int = 1  # Number of while loops in the innermost block of each function
+    chain_length: int = 3  # Number of links in each selector chain (e.g. `.with_tag("t0")`)
+    recursion: bool = False  # Include a directly recursive function called from every generated function
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _indent(lines: List[str], depth: int) -> List[str]:
+    return [("    " * depth) + line for line in lines]
+
+
+def _gen_function(ix: int, shape: ProgramShape) -> List[str]:
+    inner: List[str] = []
+    for loop_ix in range(shape.loops):
+        inner.extend([
+            f"var i{loop_ix}: int = 0",
+            f"while i{loop_ix} < n {{",
+            f"    acc = acc + i{loop_ix}",
+            f"    i{loop_ix} = i{loop_ix} + 1",
+            "}",
+        ])
+    selector = "".join(f'.with_tag("t{link_ix}")' for link_ix in range(shape.chain_length))
+    inner.append(f"let g: Group[Entity] = world.get_entities(){selector}.find()")
+    inner.append("acc = acc + 1")
+
+    body = inner
+    for depth in reversed(range(shape.nesting_depth)):
+        body = [f"if acc > {depth} {{", *_indent(body, 1), "} else {", "    acc = acc - 1", "}"]
+
+    lines: List[str] = [f"def f{ix}(n: int) -> int {{", "    var acc: int = n"]
+    lines.extend(_indent(body, 1))
+    if shape.recursion:
+        lines.append("    acc = acc + rec(n)")
+    if ix >= 1:
+        lines.append(f"    acc = acc + f{ix - 1}(n - 1)")
+    lines.extend(["    return acc", "}", ""])
+    return lines
+
+
+def generate_program(shape: ProgramShape) -> str:
+    lines: List[str] = []
+    if shape.recursion:
+        lines.extend([
+            "def rec(n: int) -> int {",
+            "    if n <= 0 {",
+            "        return 0",
+            "    }",
+            "    return n + rec(n - 1)",
+            "}",
+            "",
+        ])
+    for ix in range(shape.functions):
+        lines.extend(_gen_function(ix, shape))
+    if shape.functions >= 1:
+        lines.append(f"print(f{shape.functions - 1}(3))")
+    else:
+        lines.append("var x: int = 0")
+    return "\n".join(lines) + "\n"
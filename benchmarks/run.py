@@ -0,0 +1,139 @@
+"""Time every compiler stage over a matrix of generated programs, store the results as JSON & compare against a baseline
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --baseline results.json
+
+Stage names follow `CompileReport`: parse (`mchy_parse`), contextual (`contextual.generation.convert`), statement (`stmnt.generation.convert`),
+virtual (`virtual.generation.convert`) and write (`write_to_disk`).  Exits with status 1 if any stage regressed beyond `--threshold`.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from benchmarks.generate import ProgramShape, generate_program
+from mchy.cmdln.main import main_by_arg
+from mchy.common._raw_data import VERSION_STR
+from mchy.common.com_logger import ComLogger
+from mchy.common.config import Config
+
+
+RESULTS_VERSION = 1
+
+# Each dimension is scaled independently from the base shape so the cause of any super-linear growth is visible
+BASE_SHAPE = ProgramShape(functions=5, nesting_depth=1, loops=1, chain_length=2, recursion=False)
+SCALING: Dict[str, List[int]] = {
+    "functions": [5, 20, 80],
+    "nesting_depth": [1, 4, 16],
+    "loops": [1, 4, 16],
+    "chain_length": [2, 8, 32],
+}
+QUICK_SCALING: Dict[str, List[int]] = {"functions": [5, 20], "nesting_depth": [1, 4], "loops": [1, 4], "chain_length": [2, 8]}
+RECURSION_LIMITS: List[int] = [8, 32, 128]
+QUICK_RECURSION_LIMITS: List[int] = [8, 32]
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    name: str
+    shape: ProgramShape
+    recursion_limit: int
+
+
+def build_cases(quick: bool = False) -> List[BenchCase]:
+    cases: List[BenchCase] = []
+    for dimension, values in (QUICK_SCALING if quick else SCALING).items():
+        for value in values:
+            shape = ProgramShape(**{**BASE_SHAPE.to_json(), dimension: value})
+            cases.append(BenchCase(f"{dimension}={value}", shape, Config.DEFAULT_RECURSION_LIMIT))
+    for recursion_limit in (QUICK_RECURSION_LIMITS if quick else RECURSION_LIMITS):
+        shape = ProgramShape(**{**BASE_SHAPE.to_json(), "recursion": True})
+        cases.append(BenchCase(f"recursion_limit={recursion_limit}", shape, recursion_limit))
+    return cases
+
+
+def run_case(case: BenchCase, repeats: int, logger: ComLogger) -> Dict[str, float]:
+    """Compile the case `repeats` times (each into a fresh output folder) returning the median wall time of each stage"""
+    source = generate_program(case.shape)
+    samples: Dict[str, List[float]] = {}
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as output_path:
+            config = Config(
+                project_name="Bench", project_namespace="bench", recursion_limit=case.recursion_limit, logger=logger, output_path=output_path,
+                verbosity=Config.Verbosity.QUIET, do_backup=False
+            )
+            report = main_by_arg(source, config)
+        if not report.success:
+            raise RuntimeError(f"Benchmark case `{case.name}` failed to compile")
+        for stage, duration in report.stage_times.items():
+            samples.setdefault(stage, []).append(duration)
+    return {stage: statistics.median(durations) for stage, durations in samples.items()}
+
+
+def run_all(cases: List[BenchCase], repeats: int, verbose: bool = True) -> Dict[str, Any]:
+    logger = ComLogger(ComLogger.Level.Error, "BENCHMARK")
+    results: List[Dict[str, Any]] = []
+    for case in cases:
+        stages = run_case(case, repeats, logger)
+        results.append({"case": case.name, "shape": case.shape.to_json(), "recursion_limit": case.recursion_limit, "stages": stages})
+        if verbose:
+            print(f"{case.name:<24} " + "  ".join(f"{stage}: {duration*1000:8.1f}ms" for stage, duration in stages.items()), flush=True)
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {"mchy_version": VERSION_STR, "python": platform.python_version(), "platform": platform.platform(), "repeats": repeats},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_duration: float = 0.001) -> List[Tuple[str, str, float, float]]:
+    """Get every (case, stage, baseline time, current time) where the stage became more than `threshold` times slower
+
+    Stages faster than `min_duration` seconds in both runs are ignored as they are dominated by noise.
+    """
+    baseline_lookup: Dict[str, Dict[str, float]] = {result["case"]: result["stages"] for result in baseline["results"]}
+    regressions: List[Tuple[str, str, float, float]] = []
+    for result in current["results"]:
+        base_stages: Optional[Dict[str, float]] = baseline_lookup.get(result["case"])
+        if base_stages is None:
+            continue
+        for stage, duration in result["stages"].items():
+            base_duration = base_stages.get(stage)
+            if base_duration is None or max(base_duration, duration) < min_duration:
+                continue
+            if duration > base_duration * threshold:
+                regressions.append((result["case"], stage, base_duration, duration))
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the mchy compiler stages on generated programs")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare the results against a previous results JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio counted as a regression.  Defaults to 1.25.")
+    parser.add_argument("--repeats", type=int, default=3, help="Compilations per case, the median is reported.  Defaults to 3.")
+    parser.add_argument("--quick", action="store_true", help="Run a reduced matrix of cases")
+    pargs = parser.parse_args(args)
+
+    current = run_all(build_cases(pargs.quick), pargs.repeats)
+    if pargs.output is not None:
+        with open(pargs.output, "w") as output_file:
+            json.dump(current, output_file, indent=2)
+    if pargs.baseline is not None:
+        with open(pargs.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(current, baseline, pargs.threshold)
+        for case_name, stage, base_duration, duration in regressions:
+            print(f"REGRESSION {case_name} {stage}: {base_duration*1000:.1f}ms -> {duration*1000:.1f}ms ({duration/base_duration:.2f}x)")
+        if len(regressions) >= 1:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
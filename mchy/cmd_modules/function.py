@@ -49,6 +49,9 @@ class CtxIFunc(AbsCtxFunc):
     def get_return_type(self) -> ComType:
         return self._ifunc.get_return_type()
 
+    def is_pure(self) -> bool:
+        return self._ifunc.is_pure()
+
     def get_signature_loc(self) -> ComLoc:
         return ComLoc()
 
@@ -94,6 +97,12 @@ class IFunc:
     def get_return_type(self) -> ComType:
         ...
 
+    def is_pure(self) -> bool:
+        """Return True if calling this function has no effect other than producing its return value (e.g. it only queries the world)
+
+        Calls to pure functions may be skipped by the compiler when their result is not needed."""
+        return False
+
     @abstractmethod
     def stmnt_conv(
                 self, executor: 'SmtAtom',
@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Optional, Sequence
+from mchy.common._raw_data import VERSION_STR
+from mchy.common.com_inclusion import FileInclusion
+from mchy.common.config import Config
+from mchy.virtual.file_inc import get_resource_path
+from mchy.virtual.to_disk import collect_files, collect_folders
+from mchy.virtual.vir_dirs import VirFolder, VirRawFile
+from os import path as os_path
+import hashlib
+import json
+import os
+
+
+_ENTRY_VERSION = 1
+_UNCACHEABLE_MARKERS = ("compile_time", )  # Source using these produces different output every compilation
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _digest_path(path: str) -> Optional[str]:
+    """Get a digest covering the names & contents of every file at or below `path`, None if it does not exist"""
+    if os_path.isfile(path):
+        with open(path, mode="rb") as file:
+            return _hash(file.read())
+    elif os_path.isdir(path):
+        digest = hashlib.sha256()
+        for child in sorted(os.listdir(path)):
+            digest.update(json.dumps([child, _digest_path(os_path.join(path, child))]).encode("utf-8"))
+        return digest.hexdigest()
+    else:
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    part_path = path + ".part"
+    with open(part_path, mode="wb") as file:
+        file.write(data)
+    os.replace(part_path, path)
+
+
+class BuildCache:
+    """Content-addressed cache of whole compilations
+
+    Entries are keyed by `get_key` and record the generated folders, the hash of every generated file and the digest of every included
+    resource.  File contents are stored once per unique hash under `objects/` so unchanged files are shared between entries.
+    """
+
+    def __init__(self, cache_path: str, config: Config) -> None:
+        self._cache_path: str = cache_path
+        self._config: Config = config
+
+    @staticmethod
+    def get_key(file_text: str, config: Config) -> Optional[str]:
+        """Get the cache key of compiling `file_text` under `config`, None if the output cannot be cached"""
+        if any(marker in file_text for marker in _UNCACHEABLE_MARKERS):
+            return None
+        key_data = {
+            "compiler_version": VERSION_STR,
+            "source": file_text,
+            "project_name": config.project_name,
+            "project_namespace": config.project_namespace,
+            "recursion_limit": config.recursion_limit,
+            "testing_comments": config.testing_comments,
+            "debug_mode": config.debug_mode,
+            "optimisation": config.optimisation.name,
+            "storage_stack": config.storage_stack,
+            "target_version": list(config.target_version),
+            "inclusion_path": config.inclusion_path,
+        }
+        return _hash(json.dumps(key_data, sort_keys=True).encode("utf-8"))
+
+    def _entry_path(self, key: str) -> str:
+        return os_path.join(self._cache_path, "entries", key + ".json")
+
+    def _object_path(self, file_hash: str) -> str:
+        return os_path.join(self._cache_path, "objects", file_hash[:2], file_hash[2:])
+
+    def _load_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._entry_path(key)) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != _ENTRY_VERSION:
+            return None
+        return entry
+
+    def get_inclusions(self, key: str) -> List[str]:
+        """The paths of the resources included by the program stored under `key`"""
+        entry = self._load_entry(key)
+        if entry is None:
+            return []
+        return list(entry["inclusions"].keys())
+
+    def lookup(self, key: str) -> Optional[VirFolder]:
+        """Rebuild the datapack root folder stored under `key`, None if there is no valid entry"""
+        entry = self._load_entry(key)
+        if entry is None:
+            return None
+        for resource_path, resource_digest in entry["inclusions"].items():
+            if _digest_path(resource_path) != resource_digest:
+                self._config.logger.very_verbose(f"CACHE: Included resource '{resource_path}' has changed since entry was made")
+                return None
+
+        root = VirFolder(self._config.project_name)
+        folders: Dict[str, VirFolder] = {"": root}
+        for folder_path in entry["folders"]:
+            parent_path, _, name = folder_path.rpartition("/")
+            folders[folder_path] = VirFolder(name, folders[parent_path])
+        for file_path, file_hash in entry["files"].items():
+            try:
+                with open(self._object_path(file_hash), mode="rb") as object_file:
+                    data = object_file.read()
+            except OSError:
+                return None
+            if _hash(data) != file_hash:
+                self._config.logger.warn(f"Build cache object for '{file_path}' is corrupt, ignoring cache entry")
+                return None
+            parent_path, _, name = file_path.rpartition("/")
+            VirRawFile(name, folders[parent_path], data.decode("utf-8"))
+        return root
+
+    def store(self, key: str, root: VirFolder, inclusions: Sequence[FileInclusion]) -> None:
+        """Store the datapack root folder `root` under `key`"""
+        files: Dict[str, str] = {}
+        for file_path, data in collect_files(root):
+            file_hash = _hash(data)
+            object_path = self._object_path(file_hash)
+            if not os_path.exists(object_path):
+                os.makedirs(os_path.dirname(object_path), exist_ok=True)
+                _write_atomic(object_path, data)
+            files[file_path] = file_hash
+        inclusion_digests: Dict[str, Optional[str]] = {}
+        for inclusion in inclusions:
+            resource_path = get_resource_path(inclusion, self._config)
+            inclusion_digests[resource_path] = _digest_path(resource_path)
+        folders: List[str] = collect_folders(root)
+        os.makedirs(os_path.dirname(self._entry_path(key)), exist_ok=True)
+        _write_atomic(self._entry_path(key), json.dumps(
+            {"version": _ENTRY_VERSION, "inclusions": inclusion_digests, "folders": folders, "files": files}, indent=1, sort_keys=True
+        ).encode("utf-8"))
@@ -73,10 +73,51 @@ def parse_args(args: Optional[List[str]] = None) -> Tuple[str, Config]:
         "--force-backup", action="store_true",
         help="Force backup creation. Only required to counteract --no-backup flag set by json config."
     )
+    group_zip = parser.add_mutually_exclusive_group()
+    group_zip.add_argument(
+        "-z", "--zip", action="store_true",
+        help="Write the datapack as a single '.zip' archive instead of a folder.  Usually much faster than writing many small files."
+    )
+    group_zip.add_argument(
+        "--no-zip", action="store_true",
+        help="Write the datapack as a folder.  Only required to counteract --zip flag set by json config."
+    )
+    group_build_cache = parser.add_mutually_exclusive_group()
+    group_build_cache.add_argument(
+        "--build-cache", default=None, metavar="CACHE_DIR",
+        help="Cache compiled datapacks in CACHE_DIR so that recompiling unchanged source skips compilation and restores the output from the cache."
+    )
+    group_build_cache.add_argument(
+        "--no-build-cache", action="store_true",
+        help="Disable the build cache.  Only required to counteract --build-cache set by json config."
+    )
+    parser.add_argument(
+        "--profile", default=None, metavar="PROFILE_DIR",
+        help="Dump cProfile statistics (.pstats) for every compilation stage into PROFILE_DIR and print a report of each stage's time & memory use."
+    )
     parser.add_argument(
         '--recursion-limit', type=int, default=None,
         help='The maximum level of recursion. Default is 32. Large values may cause slow compilations.'
     )
+    group_stack = parser.add_mutually_exclusive_group()
+    group_stack.add_argument(
+        "--storage-stack", action="store_true",
+        help=(
+            "Save the variables of recursive functions to an nbt storage stack during recursive calls so every function is only generated once.  " +
+            "Recursive calls become slower but the datapack is much smaller & faster to load."
+        )
+    )
+    group_stack.add_argument(
+        "--no-storage-stack", action="store_true",
+        help="Generate a copy of every function for each stack level it runs at.  Only required to counteract --storage-stack set by json config."
+    )
+    parser.add_argument(
+        "--target-version", default=None, metavar="VERSION",
+        help=(
+            "The minecraft version the datapack is for (e.g. 1.20.4).  Sets the pack format & allows commands added in newer versions to be used " +
+            "where they are faster.  Defaults to 1.19.4, the oldest supported version."
+        )
+    )
 
     pargs: argparse.Namespace = parser.parse_args(args)
 
@@ -247,6 +288,46 @@ def parse_args(args: Optional[List[str]] = None) -> Tuple[str, Config]:
         else:
             do_backup = Config.DEFAULT_DO_BACKUP
 
+    # === Get output as zip
+    output_zip: bool
+    if pargs.zip:
+        output_zip = True
+    elif pargs.no_zip:
+        output_zip = False
+    else:
+        if "zip" in json_dict.keys() or "z" in json_dict.keys():
+            output_zip = True
+        elif "no_zip" in json_dict.keys() or "no-zip" in json_dict.keys():
+            output_zip = False
+        else:
+            output_zip = Config.DEFAULT_OUTPUT_ZIP
+
+    # === Get build cache location
+    _build_cache: Optional[str]
+    if pargs.no_build_cache:
+        _build_cache = None
+    elif pargs.build_cache is not None:
+        _build_cache = pargs.build_cache
+    else:
+        if "no_build_cache" in json_dict.keys() or "no-build-cache" in json_dict.keys():
+            _build_cache = None
+        elif "build_cache" in json_dict.keys():
+            _build_cache = json_dict["build_cache"]
+        elif "build-cache" in json_dict.keys():
+            _build_cache = json_dict["build-cache"]
+        else:
+            _build_cache = Config.DEFAULT_BUILD_CACHE_PATH
+    build_cache_path: Optional[str] = (os_path.abspath(_build_cache) if _build_cache is not None else None)
+    logger.very_verbose(f"Build cache '{_build_cache}' requested, absolute path is '{build_cache_path}'")
+
+    # === Get profiling location
+    _profile: Optional[str]
+    if pargs.profile is not None:
+        _profile = pargs.profile
+    else:
+        _profile = json_dict.get("profile", Config.DEFAULT_PROFILE_PATH)
+    profile_path: Optional[str] = (os_path.abspath(_profile) if _profile is not None else None)
+
     # === Get recursion limit
     recursion_limit: int
     if pargs.recursion_limit is not None:
@@ -259,6 +340,40 @@ def parse_args(args: Optional[List[str]] = None) -> Tuple[str, Config]:
         else:
             recursion_limit = Config.DEFAULT_RECURSION_LIMIT
 
+    # === Get stack calling convention
+    storage_stack: bool
+    if pargs.storage_stack:
+        storage_stack = True
+    elif pargs.no_storage_stack:
+        storage_stack = False
+    else:
+        if "storage_stack" in json_dict.keys() or "storage-stack" in json_dict.keys():
+            storage_stack = True
+        elif "no_storage_stack" in json_dict.keys() or "no-storage-stack" in json_dict.keys():
+            storage_stack = False
+        else:
+            storage_stack = Config.DEFAULT_STORAGE_STACK
+
+    # === Get target minecraft version
+    _target_version: Optional[str]
+    if pargs.target_version is not None:
+        _target_version = pargs.target_version
+    else:
+        if "target_version" in json_dict.keys():
+            _target_version = str(json_dict["target_version"])
+        elif "target-version" in json_dict.keys():
+            _target_version = str(json_dict["target-version"])
+        else:
+            _target_version = None
+    target_version: Tuple[int, int, int] = Config.DEFAULT_TARGET_VERSION
+    if _target_version is not None:
+        try:
+            target_version = Config.parse_target_version(_target_version)
+        except ValueError as error:
+            logger.error(f"Invalid-Target-Version: {error}")
+            sys.exit(1)
+    logger.very_verbose(f"Target version '{_target_version}' requested, targeting {'.'.join(str(part) for part in target_version)}")
+
     # === Get mchy file
     _mchy_file = pargs.file
     mchy_file_path = os_path.abspath(_mchy_file)
@@ -285,4 +400,9 @@ def parse_args(args: Optional[List[str]] = None) -> Tuple[str, Config]:
         optimisation=optimization,
         do_backup=do_backup,
         inclusion_path=os_path.dirname(mchy_file_path),
+        output_zip=output_zip,
+        build_cache_path=build_cache_path,
+        profile_path=profile_path,
+        storage_stack=storage_stack,
+        target_version=target_version,
     ))
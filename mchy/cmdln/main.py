@@ -1,5 +1,8 @@
 
 import traceback
+from typing import Optional
+from mchy.cmdln.build_cache import BuildCache
+from mchy.cmdln.report import CompileReport, StageRecorder, count_ast_nodes, count_ctx_stmnts, record_smt_module, record_vir_counts, record_vir_dp
 from mchy.cmdln.late_err_intercepts import perform_intercepts
 from mchy.contextual.struct.module import CtxModule
 from mchy.errors import ConversionError
@@ -13,7 +16,9 @@ from mchy.common.config import Config
 from os import path as os_path
 
 from mchy.stmnt.struct.module import SmtModule
-from mchy.virtual.vir_dp import VirDP
+from mchy.virtual.file_inc import get_resource_path
+from mchy.virtual.vir_dirs import VirFolder
+from mchy.virtual.vir_dp import VirDP, write_datapack
 
 
 def main_by_cmdln():
@@ -28,35 +33,89 @@ def main_by_cmdln():
     return main_by_arg(file_text, config)
 
 
-def main_by_arg(file_text: str, config: Config):
-    """The main entry point for the program when called directly from code"""
+def main_by_arg(file_text: str, config: Config, measure_memory: bool = False) -> CompileReport:
+    """The main entry point for the program when called directly from code
+
+    Returns a report of the compilation including the wall & cpu time of every stage ran.  Peak memory use of each stage is only measured
+    (with tracemalloc, which slows compilation) if `measure_memory` is set or profiling is enabled in the config.
+    """
+    report = CompileReport()
+    recorder = StageRecorder(report, measure_memory=(measure_memory or config.profile_path is not None), profile_path=config.profile_path)
+    _compile(file_text, config, report, recorder)
+    if config.profile_path is not None:
+        config.logger.print(report.render())
+    return report
+
+
+def _compile(file_text: str, config: Config, report: CompileReport, recorder: StageRecorder) -> None:
     config.logger.verbose_print(f"Compiling Project '{config.project_name}'" + (" with debug enabled" if config.debug_mode else ""))
     config.logger.very_verbose(f"src code: {repr(file_text)}")
     try:  # Nested try's as ConversionError handling may fail and need to be caught by the outer try-except
         try:
+            build_cache: Optional[BuildCache] = None
+            cache_key: Optional[str] = None
+            if config.build_cache_path is not None:
+                build_cache = BuildCache(config.build_cache_path, config)
+                cache_key = BuildCache.get_key(file_text, config)
+                if cache_key is None:
+                    config.logger.verbose("CACHE: Source output varies between compilations, build cache not used")
+                else:
+                    with recorder.stage("cache"):
+                        cached_root: Optional[VirFolder] = build_cache.lookup(cache_key)
+                    if cached_root is not None:
+                        report.cache_hit = True
+                        report.included_files = build_cache.get_inclusions(cache_key)
+                        record_vir_counts(report, cached_root)
+                        config.logger.verbose_print("(1/6) Build cache hit, skipping compilation")
+                        config.logger.verbose_print("(5/6) Writing to disk")
+                        with recorder.stage("write"):
+                            report.files_written = write_datapack(cached_root, config)
+                        if config.verbosity.value >= config.Verbosity.VERBOSE.value:
+                            config.logger.verbose_print("")  # Print an empty line to aid readability in verbose mode
+                        config.logger.print("Compilation Successful!")
+                        report.success = True
+                        return
+
             config.logger.verbose_print("(1/6) Beginning Compilation")
             # TEXT -> AST
-            ast_root_node: ASTRoot = mchy_parse(file_text, config)
+            with recorder.stage("parse"):
+                ast_root_node: ASTRoot = mchy_parse(file_text, config)
+            report.ast_nodes = count_ast_nodes(ast_root_node)
 
             config.logger.verbose_print("(2/6) Resolving Contextual Information")
             # AST -> CST
-            ctx_module: CtxModule = conv_ast_cst(ast_root_node, config=config)
+            with recorder.stage("contextual"):
+                ctx_module: CtxModule = conv_ast_cst(ast_root_node, config=config)
+            report.ctx_statements = count_ctx_stmnts(ctx_module)
 
             config.logger.verbose_print("(3/6) Statement Linking")
             # CST -> SmtRep
-            smt_module: SmtModule = conv_cst_smt(ctx_module, config=config)
+            with recorder.stage("statement"):
+                smt_module: SmtModule = conv_cst_smt(ctx_module, config=config)
+            record_smt_module(report, smt_module)
+            report.included_files = [get_resource_path(inclusion, config) for inclusion in smt_module.file_inclusions]
 
             config.logger.verbose_print("(4/6) Generating Virtual Commands")
             # SmtRep -> VirtualDP
-            vir_dp: VirDP = conv_smt_vir(smt_module, config=config)
+            with recorder.stage("virtual"):
+                vir_dp: VirDP = conv_smt_vir(smt_module, config=config)
+            record_vir_dp(report, vir_dp)
 
             config.logger.verbose_print("(5/6) Writing to disk")
             # write DP to disk
-            vir_dp.write_to_disk()
+            with recorder.stage("write"):
+                report.files_written = vir_dp.write_to_disk()
+
+            if build_cache is not None and cache_key is not None:
+                try:
+                    build_cache.store(cache_key, vir_dp.root, smt_module.file_inclusions)
+                except OSError as err:
+                    config.logger.warn(f"Failed to update build cache: {err}")
 
             if config.verbosity.value >= config.Verbosity.VERBOSE.value:
                 config.logger.verbose_print("")  # Print an empty line to aid readability in verbose mode
             config.logger.print("Compilation Successful!")
+            report.success = True
         except ConversionError as err:
             perform_intercepts(
                 err,
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import cProfile
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+from mchy.contextual.struct.module import CtxModule
+from mchy.contextual.struct.stmnt import CtxForLoop, CtxIfStmnt, CtxStmnt, CtxWhileLoop
+from mchy.mchy_ast.nodes import Node as ASTNode
+from mchy.stmnt.struct.function import SmtFunc
+from mchy.stmnt.struct.module import SmtModule
+from mchy.virtual.to_disk import collect_files
+from mchy.virtual.vir_dirs import VirFolder
+from mchy.virtual.vir_dp import VirDP
+from os import path as os_path
+import os
+
+
+@dataclass
+class StageReport:
+    name: str
+    wall_time: float  # Seconds
+    cpu_time: float  # Seconds
+    peak_memory: Optional[int] = None  # Bytes, only measured if requested
+
+
+@dataclass
+class CompileReport:
+    success: bool = False
+    cache_hit: bool = False
+    stages: List[StageReport] = field(default_factory=list)
+    ast_nodes: int = 0
+    ctx_statements: int = 0
+    smt_commands: Dict[str, int] = field(default_factory=dict)  # function name -> number of statement layer commands
+    vir_files: int = 0
+    vir_lines: int = 0
+    bytes_generated: int = 0
+    files_written: int = 0
+    optimisation_passes: Dict[str, int] = field(default_factory=dict)  # optimisation name -> times it changed the datapack
+    included_files: List[str] = field(default_factory=list)  # Absolute paths of the resources the program includes
+
+    @property
+    def stage_times(self) -> Dict[str, float]:
+        return {stage.name: stage.wall_time for stage in self.stages}
+
+    @property
+    def total_wall_time(self) -> float:
+        return sum(stage.wall_time for stage in self.stages)
+
+    def render(self) -> str:
+        lines: List[str] = [f"Compile report ({'success' if self.success else 'failed'}{', cache hit' if self.cache_hit else ''}):"]
+        for stage in self.stages:
+            memory = f", peak {stage.peak_memory/1024:.0f}KiB" if stage.peak_memory is not None else ""
+            lines.append(f"    {stage.name:<12} wall {stage.wall_time*1000:8.1f}ms, cpu {stage.cpu_time*1000:8.1f}ms{memory}")
+        lines.append(f"    {'total':<12} wall {self.total_wall_time*1000:8.1f}ms")
+        lines.append(f"    AST nodes: {self.ast_nodes}, CTX statements: {self.ctx_statements}, SMT commands: {sum(self.smt_commands.values())}")
+        lines.append(
+            f"    VIR files: {self.vir_files}, lines: {self.vir_lines}, bytes: {self.bytes_generated}, files written: {self.files_written}"
+        )
+        if len(self.optimisation_passes) >= 1:
+            lines.append("    Optimisations applied: " + ", ".join(f"{name} x{hits}" for name, hits in self.optimisation_passes.items()))
+        return "\n".join(lines)
+
+
+class StageRecorder:
+    """Records the cost of each compilation stage into a `CompileReport`"""
+
+    def __init__(self, report: CompileReport, measure_memory: bool = False, profile_path: Optional[str] = None) -> None:
+        self._report: CompileReport = report
+        self._measure_memory: bool = measure_memory
+        self._profile_path: Optional[str] = profile_path
+        if profile_path is not None:
+            os.makedirs(profile_path, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started_tracing = False
+        if self._measure_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        profiler: Optional[cProfile.Profile] = (cProfile.Profile() if self._profile_path is not None else None)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            stage_report = StageReport(name, time.perf_counter() - start_wall, time.process_time() - start_cpu)
+            if self._measure_memory:
+                stage_report.peak_memory = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            if profiler is not None and self._profile_path is not None:
+                profiler.dump_stats(os_path.join(self._profile_path, f"{len(self._report.stages)+1}_{name}.pstats"))
+            self._report.stages.append(stage_report)
+
+
+def count_ast_nodes(root: ASTNode) -> int:
+    count = 0
+    stack: List[ASTNode] = [root]
+    while len(stack) >= 1:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def _count_ctx_stmnts(stmnts: List[CtxStmnt]) -> int:
+    count = 0
+    for stmnt in stmnts:
+        count += 1
+        if isinstance(stmnt, (CtxForLoop, CtxWhileLoop)):
+            count += _count_ctx_stmnts(stmnt.exec_body)
+        elif isinstance(stmnt, CtxIfStmnt):
+            for branch in stmnt.branches:
+                count += _count_ctx_stmnts(branch.exec_body)
+    return count
+
+
+def count_ctx_stmnts(ctx_module: CtxModule) -> int:
+    return _count_ctx_stmnts(ctx_module.exec_body) + sum(_count_ctx_stmnts(func.exec_body) for func in ctx_module.get_mchy_functions())
+
+
+def _count_smt_cmds(func: SmtFunc) -> int:
+    return sum(len(frag.body) for frag in [func.func_frag] + func.fragments)
+
+
+def count_smt_cmds(smt_module: SmtModule) -> Dict[str, int]:
+    counts: Dict[str, int] = {
+        "setup": _count_smt_cmds(smt_module.setup_function),
+        "import_ns": _count_smt_cmds(smt_module.import_ns_function),
+        "initial": _count_smt_cmds(smt_module.initial_function),
+        "ticking": _count_smt_cmds(smt_module.ticking_function),
+    }
+    for name, pub_func in smt_module.public_functions.items():
+        counts[f"public/{name}"] = _count_smt_cmds(pub_func)
+    for mchy_func in smt_module.get_smt_mchy_funcs():
+        counts[mchy_func.get_unique_ident()] = _count_smt_cmds(mchy_func)
+    return counts
+
+
+def record_smt_module(report: CompileReport, smt_module: SmtModule) -> None:
+    report.smt_commands = count_smt_cmds(smt_module)
+    report.optimisation_passes.update({name: stats.hits for name, stats in smt_module.optimisation_stats.items()})
+
+
+def record_vir_counts(report: CompileReport, root: VirFolder) -> None:
+    files = collect_files(root)
+    report.vir_files = len(files)
+    report.bytes_generated = sum(len(data) for _, data in files)
+    report.vir_lines = sum(data.count(b"\n") for path, data in files if path.endswith(".mcfunction"))
+
+
+def record_vir_dp(report: CompileReport, vir_dp: VirDP) -> None:
+    record_vir_counts(report, vir_dp.root)
+    report.optimisation_passes.update({name: stats.hits for name, stats in vir_dp.optimisation_stats.items()})
@@ -0,0 +1,129 @@
+"""Long running compiler modes that keep the compiler (ANTLR, the generated parser & the std library) loaded between builds
+
+`watch` recompiles a single program every time its source, json config or a file it includes changes.  `serve` reads one JSON request per
+line from stdin and replies with one JSON line on stdout for each:
+
+    request:  {"args": ["file.mchy", "-o", "out/"]}  ->  response: {"ok": true, "timings": {"parse": 0.01, ...}, "total": 0.05, "included_files": [...]}
+    request:  {"command": "exit"}                      ->  response: {"ok": true}  (and the server stops)
+
+The args of a request are the same as those accepted by the normal command line program.
+"""
+import argparse
+from contextlib import redirect_stdout
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, IO, List, Optional
+from mchy.cmdln.cmdln_arg_parser import parse_args
+from mchy.cmdln.main import main_by_arg
+from mchy.common.com_logger import ComLogger
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.virtual.generation import convert as conv_smt_vir
+from os import path as os_path
+
+
+def warm_up() -> None:
+    """Run a trivial program through every in-memory stage so the first real build doesn't pay for lazy loading"""
+    config = Config(logger=ComLogger(ComLogger.Level.Error, "WARM-UP"), verbosity=Config.Verbosity.QUIET)
+    conv_smt_vir(conv_cst_smt(conv_ast_cst(mchy_parse("var warm_up: int = 0", config), config=config), config=config), config=config)
+
+
+def render_timings(stage_times: Dict[str, float]) -> str:
+    return f"{sum(stage_times.values())*1000:.0f}ms (" + ", ".join(f"{stage}: {duration*1000:.0f}ms" for stage, duration in stage_times.items()) + ")"
+
+
+def compile_once(args: List[str]) -> Dict[str, Any]:
+    """Compile the program described by command line `args`, returning a JSON-able result including per-stage timings"""
+    filename, config = parse_args(args)
+    with open(filename) as file:
+        file_text = file.read()
+    report = main_by_arg(file_text, config)
+    return {"ok": report.success, "timings": report.stage_times, "total": report.total_wall_time, "included_files": report.included_files}
+
+
+def _get_mtime(path: str) -> Optional[float]:
+    try:
+        return os_path.getmtime(path)
+    except OSError:
+        return None
+
+
+def watch(args: List[str], poll_interval: float = 0.5, should_stop: Callable[[], bool] = (lambda: False)) -> None:
+    """Recompile the program described by command line `args` every time the source file, json config or an included file changes"""
+    filename, _ = parse_args(args)
+    json_config_path = os_path.abspath(_get_json_config_arg(args))
+    watched = [filename, json_config_path]
+    last_mtimes: List[Optional[float]] = []
+    while not should_stop():
+        mtimes = [_get_mtime(path) for path in watched]
+        if mtimes != last_mtimes:
+            last_watched = watched
+            result = compile_once(args)
+            if result["ok"]:  # A failed build may not have got far enough to find the included files, keep watching the old ones
+                watched = [filename, json_config_path] + [path for path in result["included_files"] if path not in (filename, json_config_path)]
+            seen_mtimes = dict(zip(last_watched, mtimes))  # Changes made during the build must still trigger the next one
+            last_mtimes = [seen_mtimes[path] if path in seen_mtimes else _get_mtime(path) for path in watched]
+            print(("Rebuilt" if result["ok"] else "Rebuild failed") + " in " + render_timings(result["timings"]), flush=True)
+        else:
+            time.sleep(poll_interval)
+
+
+def _get_json_config_arg(args: List[str]) -> str:
+    for flag in ("-j", "--json-config"):
+        if flag in args and args.index(flag) + 1 < len(args):
+            return args[args.index(flag) + 1]
+    return "./mchy_config.json"
+
+
+def serve(inp: IO[str], oup: IO[str]) -> None:
+    """Handle JSON compile requests, one per line, from `inp` writing one JSON response line per request to `oup`"""
+    for line in inp:
+        if line.strip() == "":
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            if request.get("command") == "exit":
+                oup.write(json.dumps({"ok": True}) + "\n")
+                oup.flush()
+                return
+            request_args = request.get("args")
+            if not isinstance(request_args, list) or not all(isinstance(arg, str) for arg in request_args):
+                raise ValueError("Request `args` must be a list of strings")
+            with redirect_stdout(sys.stderr):  # Keep compiler output out of the response stream
+                response = compile_once(request_args)
+        except (ValueError, OSError) as err:
+            response = {"ok": False, "error": str(err)}
+        except SystemExit:  # Argument errors & refusal to overwrite exit, the server should not
+            response = {"ok": False, "error": "Compilation stopped, see stderr for details"}
+        oup.write(json.dumps(response) + "\n")
+        oup.flush()
+
+
+def main_server(args: Optional[List[str]] = None) -> None:
+    if args is None:
+        args = sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Keep the mchy compiler loaded and recompile on request or on change")
+    sub_parsers = parser.add_subparsers(dest="mode", required=True)
+    watch_parser = sub_parsers.add_parser("watch", help="Recompile a file every time it changes")
+    watch_parser.add_argument("--interval", type=float, default=0.5, help="Seconds between checks for changes.  Defaults to 0.5.")
+    watch_parser.add_argument("compile_args", nargs=argparse.REMAINDER, help="The normal compiler arguments, e.g. `file.mchy -o out/`")
+    sub_parsers.add_parser("serve", help="Compile requests read as JSON lines from stdin")
+    pargs = parser.parse_args(args)
+
+    warm_up()
+    if pargs.mode == "watch":
+        try:
+            watch(pargs.compile_args, pargs.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        serve(sys.stdin, sys.stdout)
+
+
+if __name__ == "__main__":
+    main_server()
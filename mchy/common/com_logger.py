@@ -43,6 +43,8 @@ class ComLogger:
         if unique_name in ComLogger._INITIALIZED_LOGGERS:
             raise ValueError(f"Logging wrapper with unique name `{unique_name}` double initialized")
         self._logger = logging.getLogger(f"MCHY-{unique_name}")
+        for old_handler in list(self._logger.handlers):  # Re-creating a logger (e.g. once per rebuild) must not duplicate its output
+            self._logger.removeHandler(old_handler)
         self._logger.setLevel(ComLogger.Level.VeryVerbose.value if logging_file_path is not None else std_out_level.value)
         logging.addLevelName(9, 'VERBOSE')
         logging.addLevelName(5, 'VV')
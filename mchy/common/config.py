@@ -1,6 +1,7 @@
 
 
 from enum import Enum
+from typing import List, Optional, Tuple
 from mchy.common.com_logger import ComLogger
 from os import path as os_path
 
@@ -19,6 +20,24 @@ class Config():
         VERBOSE = 1
         VV = 2
 
+    class Feature(Enum):
+        """Commands & datapack layouts only available from some minecraft version, the value is the first version supporting it"""
+        MACROS = (1, 20, 2)  # `$` macro lines & `function ... with ...`
+        RETURN_RUN = (1, 20, 3)  # `return run ...`, from 1.20.3 it returns even if the command run doesn't return a value
+        SINGULAR_FOLDERS = (1, 21, 0)  # `function` & `tags/function` folders rather than `functions` & `tags/functions`
+
+    # The first version of each pack format (ascending), the pack format of a version is that of the last entry not after it
+    PACK_FORMATS: List[Tuple[Tuple[int, int, int], int]] = [
+        ((1, 19, 4), 12),
+        ((1, 20, 0), 15),
+        ((1, 20, 2), 18),
+        ((1, 20, 3), 26),
+        ((1, 20, 5), 41),
+        ((1, 21, 0), 48),
+        ((1, 21, 2), 57),
+        ((1, 21, 4), 61),
+    ]
+
     DEFAULT_PROJECT_NAME: str = "Project Name"
     DEFAULT_NAMESPACE: str = "prj_ns"
     DEFAULT_RECURSION_LIMIT: int = 32
@@ -30,6 +49,11 @@ class Config():
     DEFAULT_OPTIMISATION: Optimize = Optimize.NOTHING
     DEFAULT_DO_BACKUP: bool = True
     DEFAULT_INCLUSION_PATH: str = os_path.abspath(f"./")
+    DEFAULT_OUTPUT_ZIP: bool = False
+    DEFAULT_BUILD_CACHE_PATH: Optional[str] = None  # No build cache
+    DEFAULT_PROFILE_PATH: Optional[str] = None  # No profiling
+    DEFAULT_STORAGE_STACK: bool = False  # Recursive calls save the caller's variables to nbt storage rather than using per stack level copies
+    DEFAULT_TARGET_VERSION: Tuple[int, int, int] = (1, 19, 4)  # The oldest supported version, no newer commands are used
 
     def __init__(
             self,
@@ -43,7 +67,12 @@ class Config():
             verbosity: Verbosity = DEFAULT_VERBOSITY,
             optimisation: Optimize = DEFAULT_OPTIMISATION,
             do_backup: bool = DEFAULT_DO_BACKUP,
-            inclusion_path: str = DEFAULT_INCLUSION_PATH
+            inclusion_path: str = DEFAULT_INCLUSION_PATH,
+            output_zip: bool = DEFAULT_OUTPUT_ZIP,
+            build_cache_path: Optional[str] = DEFAULT_BUILD_CACHE_PATH,
+            profile_path: Optional[str] = DEFAULT_PROFILE_PATH,
+            storage_stack: bool = DEFAULT_STORAGE_STACK,
+            target_version: Tuple[int, int, int] = DEFAULT_TARGET_VERSION
             ) -> None:
         self._project_name: str = project_name
         self._project_namespace: str = project_namespace
@@ -56,6 +85,11 @@ class Config():
         self._optimisation: Config.Optimize = optimisation
         self._do_backup: bool = do_backup
         self._inclusion_path: str = inclusion_path
+        self._output_zip: bool = output_zip
+        self._build_cache_path: Optional[str] = build_cache_path
+        self._profile_path: Optional[str] = profile_path
+        self._storage_stack: bool = storage_stack
+        self._target_version: Tuple[int, int, int] = target_version
 
     @property
     def project_name(self) -> str:
@@ -100,3 +134,46 @@ class Config():
     @property
     def inclusion_path(self) -> str:
         return self._inclusion_path
+
+    @property
+    def output_zip(self) -> bool:
+        return self._output_zip
+
+    @property
+    def build_cache_path(self) -> Optional[str]:
+        return self._build_cache_path
+
+    @property
+    def profile_path(self) -> Optional[str]:
+        return self._profile_path
+
+    @property
+    def storage_stack(self) -> bool:
+        return self._storage_stack
+
+    @property
+    def target_version(self) -> Tuple[int, int, int]:
+        return self._target_version
+
+    @property
+    def pack_format(self) -> int:
+        pack_format = Config.PACK_FORMATS[0][1]
+        for first_version, version_pack_format in Config.PACK_FORMATS:
+            if first_version <= self._target_version:
+                pack_format = version_pack_format
+        return pack_format
+
+    def supports(self, feature: 'Config.Feature') -> bool:
+        """Check if the target minecraft version has `feature`"""
+        return self._target_version >= feature.value
+
+    @staticmethod
+    def parse_target_version(version: str) -> Tuple[int, int, int]:
+        """Parse a minecraft version such as `1.20.4` or `1.21`, raises ValueError if it is invalid or older than the oldest supported version"""
+        parts = version.strip().split(".")
+        if not (2 <= len(parts) <= 3) or not all(part.isdigit() for part in parts):
+            raise ValueError(f"Invalid minecraft version `{version}`, expected a version of the form `1.20.4`")
+        major, minor, patch = int(parts[0]), int(parts[1]), (int(parts[2]) if len(parts) == 3 else 0)
+        if (major, minor, patch) < Config.DEFAULT_TARGET_VERSION:
+            raise ValueError(f"Minecraft version `{version}` is not supported, the oldest supported version is {'.'.join(str(part) for part in Config.DEFAULT_TARGET_VERSION)}")
+        return (major, minor, patch)
@@ -1,3 +1,4 @@
+import re
 from typing import Dict, Tuple, Union
 from mchy.cmd_modules.name_spaces import Namespace
 from mchy.common.com_diff import DID_YOU_MEAN, did_you_mean_str
@@ -165,7 +166,8 @@ def convert_include(
 
 def apply_decorators(func: CtxMchyFunc, marker: MarkerDeclFunc, decorators: List[Decorator], module: CtxModule, var_scopes: List[VarScope]) -> Tuple[CtxMchyFunc, MarkerDeclFunc]:
     for dec in decorators:
-        if dec.dec_name == "ticking":
+        ticking_match = re.fullmatch(r"ticking(?:_every_([0-9]+))?", dec.dec_name)
+        if ticking_match is not None:
             if not matches_type(func.get_executor(), ExecType(ExecCoreTypes.WORLD, False)):
                 raise ConversionError(
                     f"Ticking functions can only execute as world, not `{func.get_executor().render()}`.  Consider deleting executor type " +
@@ -177,7 +179,31 @@ def apply_decorators(func: CtxMchyFunc, marker: MarkerDeclFunc, decorators: List
                     f"Ticking functions cannot return anything.  Consider deleting return type: " +
                     f"`def {func.get_name()}() -> {func.get_return_type().render()}{'{'}...{'}'}` ---> `def {func.get_name()}(){'{'}...{'}'}`"
                 ).with_loc(func.return_loc)
-            module.register_as_ticking(func)
+            # `@ticking_every_N` runs the function once every N ticks rather than every tick
+            period = 1 if ticking_match.group(1) is None else int(ticking_match.group(1))
+            if period <= 0:
+                raise ConversionError(
+                    f"Ticking functions cannot run every {period} ticks, there must be at least 1 tick between runs: `@{dec.dec_name}` ---> `@ticking`"
+                ).with_loc(dec.decorator_name_ident.loc)
+            module.register_as_ticking(func, period)
+        elif (slicing_match := re.fullmatch(r"iterations_per_tick_([0-9]+)", dec.dec_name)) is not None:
+            # `@iterations_per_tick_N` spreads the function's loops over as many ticks as needed, running at most N iterations per tick
+            if not matches_type(func.get_executor(), ExecType(ExecCoreTypes.WORLD, False)):
+                raise ConversionError(
+                    f"Time sliced functions can only execute as world, not `{func.get_executor().render()}`.  Consider deleting executor type " +
+                    f"(`def {func.get_executor().render()} {func.get_name()}...` ---> `def {func.get_name()}...`)"
+                ).with_loc(func.executor_loc)
+            if not matches_type(InertType(InertCoreTypes.NULL), func.get_return_type()):
+                raise ConversionError(
+                    f"Time sliced functions cannot return anything as they may finish on a later tick.  Consider deleting return type: " +
+                    f"`def {func.get_name()}(...) -> {func.get_return_type().render()}{'{'}...{'}'}` ---> `def {func.get_name()}(...){'{'}...{'}'}`"
+                ).with_loc(func.return_loc)
+            iterations = int(slicing_match.group(1))
+            if iterations <= 0:
+                raise ConversionError(
+                    f"Time sliced functions must run at least 1 loop iteration per tick: `@{dec.dec_name}` ---> `@iterations_per_tick_1`"
+                ).with_loc(dec.decorator_name_ident.loc)
+            module.register_as_time_sliced(func, iterations)
         elif dec.dec_name == "public":
             _assert_no_params(func, "Published")
             module.register_as_public(func)
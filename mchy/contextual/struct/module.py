@@ -1,6 +1,6 @@
 
 
-from typing import List, Optional, Sequence, Tuple, TypeGuard, Union
+from typing import Dict, List, Optional, Sequence, Tuple, TypeGuard, Union
 from mchy.cmd_modules.chains import IChain, IChainLink
 from mchy.cmd_modules.function import CtxIFunc
 from mchy.cmd_modules.name_spaces import Namespace
@@ -20,6 +20,10 @@ from mchy.errors import ConversionError
 
 class CtxModule:
 
+    # Namespaces (by name, with the exact function, prop, chain link & struct objects they held) already known to import cleanly into an
+    # empty module.  Members are compared by identity so a namespace that is re-registered or gains/swaps members is re-checked
+    _CLEAN_NAMESPACES: Dict[str, Tuple[object, ...]] = {}
+
     def __init__(self, config: Config) -> None:
         self._config: Config = config
         self.global_var_scope: VarScope = VarScope()
@@ -29,6 +33,8 @@ class CtxModule:
         self._chain_links: List[IChainLink] = []
         self._structs: List[CtxPyStruct] = []
         self._ticking_funcs: List[CtxMchyFunc] = []
+        self._ticking_periods: Dict[CtxMchyFunc, int] = {}
+        self._iterations_per_tick: Dict[CtxMchyFunc, int] = {}
         self._public_funcs: List[CtxMchyFunc] = []
         self._inclusions: List[FileInclusion] = []
 
@@ -84,8 +90,16 @@ class CtxModule:
                 ).with_loc(new_func.get_signature_loc())
         self._functions.append(new_func)
 
-    def register_as_ticking(self, func: CtxMchyFunc) -> None:
+    def register_as_ticking(self, func: CtxMchyFunc, period: int = 1) -> None:
+        if func in self._ticking_periods.keys():
+            raise ConversionError(f"Function `{func.render()}` is already ticking, a function can only have one ticking decorator").with_loc(func.get_signature_loc())
         self._ticking_funcs.append(func)
+        self._ticking_periods[func] = period
+
+    def register_as_time_sliced(self, func: CtxMchyFunc, iterations: int) -> None:
+        if func in self._iterations_per_tick.keys():
+            raise ConversionError(f"Function `{func.render()}` is already time sliced, a function can only have one iterations per tick decorator").with_loc(func.get_signature_loc())
+        self._iterations_per_tick[func] = iterations
 
     def register_as_public(self, new_pfunc: CtxMchyFunc) -> None:
         for pfunc in self._public_funcs:
@@ -98,6 +112,14 @@ class CtxModule:
     def get_ticking_funcs(self) -> List[CtxMchyFunc]:
         return self._ticking_funcs
 
+    def get_ticking_period(self, func: CtxMchyFunc) -> int:
+        """Get the number of ticks between each run of the ticking function `func`"""
+        return self._ticking_periods[func]
+
+    def get_iterations_per_tick(self, func: CtxMchyFunc) -> Optional[int]:
+        """Get the most loop iterations the time sliced function `func` runs per tick, None if `func` is not time sliced"""
+        return self._iterations_per_tick.get(func, None)
+
     def get_public_funcs(self) -> List[CtxMchyFunc]:
         return self._public_funcs
 
@@ -197,7 +219,19 @@ class CtxModule:
                 raise ConversionError(f"Struct of name `{new_struct.get_name()}` is already defined as `{new_struct.render()}` cannot define it as `{existing_struct.render()}`")
         self._structs.append(new_struct)
 
+    def _is_empty(self) -> bool:
+        return len(self._functions) == 0 and len(self._props) == 0 and len(self._chain_links) == 0 and len(self._structs) == 0
+
     def import_ns(self, ns: Namespace) -> None:
+        ns_members: Tuple[object, ...] = (*ns.ifuncs, *ns.iprops, *ns.ichain_links, *ns.istructs)
+        if self._is_empty() and CtxModule._same_members(CtxModule._CLEAN_NAMESPACES.get(ns.render()), ns_members):
+            # This exact namespace has already been imported into an empty module without clashes, skip the (quadratic) clash checks
+            self._functions.extend(function.get_ctx_func() for function in ns.ifuncs)
+            self._props.extend(ns.iprops)
+            self._chain_links.extend(ns.ichain_links)
+            self._structs.extend(CtxPyStruct(struct) for struct in ns.istructs)
+            return
+        was_empty = self._is_empty()
         for function in ns.ifuncs:
             self.add_function(function.get_ctx_func())
         for prop in ns.iprops:
@@ -206,6 +240,12 @@ class CtxModule:
             self.add_chain_link(chain)
         for struct in ns.istructs:
             self.add_struct(CtxPyStruct(struct))
+        if was_empty:
+            CtxModule._CLEAN_NAMESPACES[ns.render()] = ns_members
+
+    @staticmethod
+    def _same_members(known: Optional[Tuple[object, ...]], members: Tuple[object, ...]) -> bool:
+        return known is not None and len(known) == len(members) and all(old is new for old, new in zip(known, members))
 
     def get_cont_of_clink(self, chain_link: IChainLink) -> List[IChainLink]:
         return [
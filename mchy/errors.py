@@ -91,3 +91,7 @@ class StatementRepError(Exception):
 
 class VirtualRepError(Exception):
     """An error in the generation of the virtual datapack from the code statements -> this generally should not be caught and indicates a mistake in mchy not in user code"""
+
+
+class SimulationError(Exception):
+    """An error simulating a generated datapack -> usually indicates the datapack would misbehave (or fail to load) in game"""
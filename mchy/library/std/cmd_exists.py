@@ -86,6 +86,9 @@ class CmdBlockExists(IFunc):
     def get_return_type(self) -> ComType:
         return InertType(InertCoreTypes.BOOL)
 
+    def is_pure(self) -> bool:
+        return True
+
     def stmnt_conv(
                 self, executor: SmtAtom, param_binding: Dict[str, SmtAtom], extra_binding: List['SmtAtom'], module: SmtModule, function: SmtFunc, config: Config, loc: ComLoc
             ) -> Tuple[List[SmtCmd], 'SmtAtom']:
@@ -114,6 +117,9 @@ class CmdEntityExists(IFunc):
     def get_return_type(self) -> ComType:
         return InertType(InertCoreTypes.BOOL)
 
+    def is_pure(self) -> bool:
+        return True
+
     def stmnt_conv(
                 self, executor: SmtAtom, param_binding: Dict[str, SmtAtom], extra_binding: List['SmtAtom'], module: SmtModule, function: SmtFunc, config: Config, loc: ComLoc
             ) -> Tuple[List[SmtCmd], 'SmtAtom']:
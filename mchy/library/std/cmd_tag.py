@@ -185,6 +185,9 @@ class CmdTagCount(IFunc):
     def get_return_type(self) -> ComType:
         return InertType(InertCoreTypes.INT)
 
+    def is_pure(self) -> bool:
+        return True
+
     def stmnt_conv(
                 self, executor: SmtAtom, param_binding: Dict[str, SmtAtom], extra_binding: List['SmtAtom'], module: SmtModule, function: SmtFunc, config: Config, loc: ComLoc
             ) -> Tuple[List[SmtCmd], 'SmtAtom']:
@@ -209,6 +212,9 @@ class CmdHasTag(IFunc):
     def get_return_type(self) -> ComType:
         return InertType(InertCoreTypes.BOOL)
 
+    def is_pure(self) -> bool:
+        return True
+
     def stmnt_conv(
                 self, executor: SmtAtom, param_binding: Dict[str, SmtAtom], extra_binding: List['SmtAtom'], module: SmtModule, function: SmtFunc, config: Config, loc: ComLoc
             ) -> Tuple[List[SmtCmd], 'SmtAtom']:
@@ -0,0 +1,33 @@
+"""Simulate a generated datapack & report the commands it runs
+
+Usage (from the repository root):
+
+    python -m mchy.sim "out/My Project" --ticks 100 --player Steve
+"""
+import argparse
+import sys
+from typing import List, Optional
+from mchy.sim.interpreter import Simulator
+
+
+def main_sim(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a datapack in the mchy simulator and report the commands executed")
+    parser.add_argument("datapack", help="The datapack folder (containing pack.mcmeta) or zip")
+    parser.add_argument("--ticks", type=int, default=20, help="Number of ticks to simulate after loading.  Defaults to 20.")
+    parser.add_argument("--player", action="append", default=[], help="Add a player with this name to the world, can be repeated")
+    parser.add_argument("--top", type=int, default=10, help="Number of functions to list, most expensive first.  Defaults to 10.")
+    pargs = parser.parse_args(args)
+
+    simulator = Simulator.from_disk(pargs.datapack)
+    for name in pargs.player:
+        simulator.world.add_player(name)
+    simulator.load()
+    simulator.tick(pargs.ticks)
+    for message in simulator.world.chat:
+        print(f"CHAT: {message}")
+    print(simulator.stats.render(pargs.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_sim())
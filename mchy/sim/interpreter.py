@@ -0,0 +1,781 @@
+"""Execute generated datapacks in-process to measure their runtime cost without a Minecraft server
+
+Only the commands (and command forms) that datapacks generated by mchy rely on are modelled, see `Simulator`.  Commands that only affect
+the unmodelled parts of the world (particles, blocks, effects, ...) are counted but otherwise ignored.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+import copy
+import json
+import re
+import zipfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from mchy.errors import SimulationError
+from mchy.sim.nbt import get_list_targets, get_path, parse_snbt, remove_path, render_snbt, set_path, to_int
+from mchy.sim.selectors import in_range, parse_range, resolve_entities, resolve_score_holders
+from mchy.sim.world import INT_MAX, INT_MIN, SimEntity, SimWorld, namespaced, wrap_int
+from mchy.virtual.to_disk import collect_files
+from mchy.virtual.vir_dirs import VirFolder
+from mchy.virtual.vir_dp import VirDP
+from os import path as os_path
+import os
+
+
+MAX_COMMAND_CHAIN_LENGTH = 65536  # The default of the `maxCommandChainLength` gamerule
+
+_FUNCTION_PATH = re.compile(r"data/([^/]+)/functions?/(.+)\.mcfunction")
+_FUNCTION_TAG_PATH = re.compile(r"data/([^/]+)/tags/functions?/(.+)\.json")
+_MACRO_ARG = re.compile(r"\$\(([A-Za-z0-9_]+)\)")
+_TIME_UNITS = {"t": 1, "s": 20, "d": 24000}
+
+ResultCallback = Callable[[Optional[int]], None]  # Receives a command's result, None if the command failed
+
+
+def _ignore_result(result: Optional[int]) -> None:
+    pass
+
+
+def _tokenize(line: str) -> List[str]:
+    """Split a command on spaces that aren't inside brackets (selectors, nbt, json) or strings"""
+    tokens: List[str] = []
+    current: List[str] = []
+    depth = 0
+    quote: Optional[str] = None
+    escaped = False
+    for char in line:
+        if quote is not None:
+            current.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'" and (depth > 0 or len(current) == 0):
+            quote = char
+            current.append(char)
+        elif char == " " and depth == 0:
+            if len(current) >= 1:
+                tokens.append("".join(current))
+                current = []
+        else:
+            if char in "[{(":
+                depth += 1
+            elif char in "]})":
+                depth -= 1
+            current.append(char)
+    if len(current) >= 1:
+        tokens.append("".join(current))
+    return tokens
+
+
+@dataclass
+class SimStats:
+    commands: int = 0
+    load_commands: int = 0
+    tick_commands: List[int] = field(default_factory=list)  # Commands run during each simulated tick, including scheduled functions
+    function_commands: Counter = field(default_factory=Counter)  # function id -> commands run directly in its body
+    function_calls: Counter = field(default_factory=Counter)  # function id -> times it was called
+    unmodelled_commands: Counter = field(default_factory=Counter)  # command name -> times it was run without any simulated effect
+    failed_commands: Counter = field(default_factory=Counter)  # error message -> times a command failed with it in game (e.g. unknown objective)
+    chain_limit_hits: int = 0
+
+    def render(self, top: int = 10) -> str:
+        lines: List[str] = [f"Simulated {self.commands} commands ({self.load_commands} during load)"]
+        if len(self.tick_commands) >= 1:
+            lines.append(
+                f"    {len(self.tick_commands)} ticks: mean {sum(self.tick_commands)/len(self.tick_commands):.1f}, max {max(self.tick_commands)} commands per tick"
+            )
+        if self.chain_limit_hits >= 1:
+            lines.append(f"    Command chain limit reached {self.chain_limit_hits} times")
+        if len(self.unmodelled_commands) >= 1:
+            lines.append("    Unmodelled commands: " + ", ".join(f"{name} x{count}" for name, count in self.unmodelled_commands.most_common()))
+        if len(self.failed_commands) >= 1:
+            lines.append("    Failed commands: " + ", ".join(f"{message} x{count}" for message, count in self.failed_commands.most_common()))
+        if len(self.function_commands) >= 1:
+            lines.append(f"    {'commands':>9} {'calls':>7}  function")
+            for function_id, commands in self.function_commands.most_common(top):
+                lines.append(f"    {commands:>9} {self.function_calls[function_id]:>7}  {function_id}")
+        return "\n".join(lines)
+
+
+class _ChainLimitReached(Exception):
+    pass
+
+
+class _CommandFailed(Exception):
+    """A command error that is only detected at runtime in game, the command does nothing but the function continues"""
+
+
+class _Frame:
+    """A function being executed, the position of the next line & what to do with its result once it finishes"""
+
+    def __init__(self, function_id: str, lines: List[Tuple[int, str]], executor: Optional[SimEntity], on_return: ResultCallback) -> None:
+        self.function_id: str = function_id
+        self.lines: List[Tuple[int, str]] = lines
+        self.executor: Optional[SimEntity] = executor
+        self.on_return: ResultCallback = on_return
+        self.index: int = 0
+        self.result: Optional[int] = None
+        self.returned: bool = False
+
+
+class Simulator:
+    """Runs the functions of a datapack against a `SimWorld` counting every command executed
+
+    Function calls are executed depth first on an explicit stack (so deep recursion is fine) & every top-level call (each function of the
+    load/tick tags, each scheduled function & each `run_function`) is limited to `max_command_chain_length` commands, as in game.
+    Modelled: `scoreboard`, `execute` (as, at, positioned, rotated, facing, anchored, align, in, summon, if/unless score/entity/data/block/
+    function, store result/success score/storage & run), `function` (including tags & macros), `return`, `schedule`, `tag`, `team`,
+    `data ... storage`, `summon`, `kill`, `tellraw` & `say`.
+    """
+
+    def __init__(
+            self, functions: Dict[str, List[str]], function_tags: Optional[Dict[str, List[str]]] = None, world: Optional[SimWorld] = None,
+            max_command_chain_length: int = MAX_COMMAND_CHAIN_LENGTH
+            ) -> None:
+        self.functions: Dict[str, List[Tuple[int, str]]] = {
+            namespaced(function_id): [(lineno, line.strip()) for lineno, line in enumerate(lines, 1) if line.strip() != "" and not line.strip().startswith("#")]
+            for function_id, lines in functions.items()
+        }
+        self.function_tags: Dict[str, List[str]] = {namespaced(tag): values for tag, values in (function_tags if function_tags is not None else {}).items()}
+        self.world: SimWorld = world if world is not None else SimWorld()
+        self.max_command_chain_length: int = max_command_chain_length
+        self.stats: SimStats = SimStats()
+        self._stack: List[_Frame] = []
+        self._pending: List[_Frame] = []  # Frames called by the current line, pushed once it finishes so they run in call order
+        self._chain_length: int = 0
+        self._token_cache: Dict[str, List[str]] = {}
+
+    # ===== Loading =====
+
+    @staticmethod
+    def from_files(files: Iterable[Tuple[str, bytes]], world: Optional[SimWorld] = None) -> 'Simulator':
+        """Build a simulator from the (relative path, data) of every file in a datapack"""
+        functions: Dict[str, List[str]] = {}
+        function_tags: Dict[str, List[str]] = {}
+        for rel_path, data in files:
+            function_match = _FUNCTION_PATH.fullmatch(rel_path)
+            if function_match is not None:
+                functions[f"{function_match.group(1)}:{function_match.group(2)}"] = data.decode("utf-8").splitlines()
+                continue
+            tag_match = _FUNCTION_TAG_PATH.fullmatch(rel_path)
+            if tag_match is not None:
+                values = json.loads(data.decode("utf-8")).get("values", [])
+                function_tags[f"{tag_match.group(1)}:{tag_match.group(2)}"] = [(value["id"] if isinstance(value, dict) else value) for value in values]
+        return Simulator(functions, function_tags, world)
+
+    @staticmethod
+    def from_vir_folder(root: VirFolder, world: Optional[SimWorld] = None) -> 'Simulator':
+        return Simulator.from_files(collect_files(root), world)
+
+    @staticmethod
+    def from_vir_dp(vir_dp: VirDP, world: Optional[SimWorld] = None) -> 'Simulator':
+        return Simulator.from_vir_folder(vir_dp.root, world)
+
+    @staticmethod
+    def from_disk(datapack_path: str, world: Optional[SimWorld] = None) -> 'Simulator':
+        """Build a simulator from a datapack folder (the one containing `pack.mcmeta`) or zip"""
+        files: List[Tuple[str, bytes]] = []
+        if os_path.isfile(datapack_path):
+            with zipfile.ZipFile(datapack_path) as archive:
+                files = [(name, archive.read(name)) for name in archive.namelist() if not name.endswith("/")]
+        else:
+            for dir_path, _, file_names in os.walk(datapack_path):
+                for file_name in file_names:
+                    full_path = os_path.join(dir_path, file_name)
+                    with open(full_path, "rb") as file:
+                        files.append((os_path.relpath(full_path, datapack_path).replace(os_path.sep, "/"), file.read()))
+        return Simulator.from_files(files, world)
+
+    # ===== Running =====
+
+    def load(self) -> None:
+        """Run the functions of the `minecraft:load` tag, as on world load or `/reload`"""
+        start = self.stats.commands
+        for function_id in self._resolve_tag("minecraft:load"):
+            self._run_top_level(function_id, None)
+        self.stats.load_commands += self.stats.commands - start
+
+    def tick(self, count: int = 1) -> None:
+        """Simulate `count` game ticks: the `minecraft:tick` tag functions followed by any scheduled functions that are due"""
+        for _ in range(count):
+            start = self.stats.commands
+            self.world.game_time += 1
+            for function_id in self._resolve_tag("minecraft:tick"):
+                self._run_top_level(function_id, None)
+            due = [function_id for due_time, function_id in self.world.scheduled if due_time <= self.world.game_time]
+            self.world.scheduled = [(due_time, function_id) for due_time, function_id in self.world.scheduled if due_time > self.world.game_time]
+            for function_id in due:
+                self._run_top_level(function_id, None)
+            self.stats.tick_commands.append(self.stats.commands - start)
+
+    def run_function(self, function_id: str, executor: Optional[SimEntity] = None) -> Optional[int]:
+        """Run a single function (or `#tag`) as if by `/function`, returning the value it returned"""
+        results: List[Optional[int]] = [None]
+
+        def set_result(result: Optional[int]) -> None:
+            results[0] = result
+
+        self._run_top_level(function_id, executor, set_result)
+        return results[0]
+
+    def get_score(self, holder: str, objective: str) -> Optional[int]:
+        return self.world.get_score(holder, objective)
+
+    def _run_top_level(self, function_id: str, executor: Optional[SimEntity], on_return: ResultCallback = _ignore_result) -> None:
+        self._chain_length = 0
+        try:
+            self._call(function_id, executor, on_return)
+            self._flush_pending()
+            self._drive()
+        except _ChainLimitReached:
+            self.stats.chain_limit_hits += 1
+        finally:
+            self._stack.clear()
+            self._pending.clear()
+
+    def _resolve_tag(self, tag: str) -> List[str]:
+        function_ids: List[str] = []
+        for value in self.function_tags.get(namespaced(tag), []):
+            if value.startswith("#"):
+                function_ids.extend(self._resolve_tag(value[1:]))
+            else:
+                function_ids.append(namespaced(value))
+        return function_ids
+
+    def _call(self, function_id: str, executor: Optional[SimEntity], on_return: ResultCallback, macro_args: Optional[Dict[str, Any]] = None) -> None:
+        if function_id.startswith("#"):
+            if namespaced(function_id[1:]) not in self.function_tags:
+                raise SimulationError(f"Unknown function tag `{function_id}`")
+            for tagged_function_id in self._resolve_tag(function_id[1:]):
+                self._call(tagged_function_id, executor, on_return, macro_args)
+            return
+        function_id = namespaced(function_id)
+        lines = self.functions.get(function_id)
+        if lines is None:
+            raise SimulationError(f"Unknown function `{function_id}`")
+        if macro_args is not None:
+            lines = [((lineno, self._expand_macro(line[1:], macro_args)) if line.startswith("$") else (lineno, line)) for lineno, line in lines]
+        self.stats.function_calls[function_id] += 1
+        self._pending.append(_Frame(function_id, lines, executor, on_return))
+
+    @staticmethod
+    def _expand_macro(line: str, macro_args: Dict[str, Any]) -> str:
+        def replace(match: 're.Match[str]') -> str:
+            if match.group(1) not in macro_args:
+                raise SimulationError(f"Missing macro argument `{match.group(1)}`")
+            value = macro_args[match.group(1)]
+            return value if isinstance(value, str) else render_snbt(value)
+        return _MACRO_ARG.sub(replace, line)
+
+    def _flush_pending(self) -> None:
+        self._stack.extend(reversed(self._pending))
+        self._pending.clear()
+
+    def _drive(self) -> None:
+        while len(self._stack) >= 1:
+            frame = self._stack[-1]
+            if frame.returned or frame.index >= len(frame.lines):
+                self._stack.pop()
+                try:
+                    frame.on_return(frame.result)  # May continue the rest of an `execute` waiting on this function
+                except _CommandFailed as failure:
+                    self.stats.failed_commands[str(failure)] += 1
+                self._flush_pending()
+                continue
+            lineno, line = frame.lines[frame.index]
+            frame.index += 1
+            self._chain_length += 1
+            if self._chain_length > self.max_command_chain_length:
+                raise _ChainLimitReached()
+            self.stats.commands += 1
+            self.stats.function_commands[frame.function_id] += 1
+            try:
+                if line.startswith("$"):
+                    raise SimulationError("Macro line in a function called without macro arguments")
+                tokens = self._token_cache.get(line)
+                if tokens is None:
+                    tokens = _tokenize(line)
+                    self._token_cache[line] = tokens
+                self._run(tokens, 0, frame.executor, frame, _ignore_result)
+            except _CommandFailed as failure:
+                self.stats.failed_commands[str(failure)] += 1
+            except SimulationError as err:
+                raise SimulationError(f"{err} (in `{frame.function_id}` line {lineno}: `{line}`)") from err
+            self._flush_pending()
+
+    # ===== Commands =====
+
+    @staticmethod
+    def _token(tokens: List[str], pos: int) -> str:
+        if pos >= len(tokens):
+            raise SimulationError(f"Incomplete command, expected an argument after `{' '.join(tokens)}`")
+        return tokens[pos]
+
+    @staticmethod
+    def _int(text: str) -> int:
+        try:
+            value = int(text)
+        except ValueError:
+            raise SimulationError(f"Expected an integer, got `{text}`")
+        if not INT_MIN <= value <= INT_MAX:
+            raise SimulationError(f"Integer `{text}` is out of range")
+        return value
+
+    def _objective(self, name: str) -> str:
+        if name not in self.world.objectives:
+            raise _CommandFailed(f"Unknown scoreboard objective `{name}`")
+        return name
+
+    def _storage(self, storage_id: str) -> Dict[str, Any]:
+        return self.world.storage.setdefault(namespaced(storage_id), {})
+
+    def _run(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        command = self._token(tokens, pos)
+        handler = self._HANDLERS.get(command)
+        if handler is None:
+            self.stats.unmodelled_commands[command] += 1
+            done(1)
+            return
+        handler(self, tokens, pos + 1, executor, frame, done)
+
+    def _cmd_scoreboard(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        group, action = self._token(tokens, pos), self._token(tokens, pos + 1)
+        if group == "objectives":
+            if action == "add":
+                name = self._token(tokens, pos + 2)
+                if name in self.world.objectives:
+                    done(None)
+                    return
+                self.world.objectives.add(name)
+                done(len(self.world.objectives))
+            elif action == "remove":
+                self.world.objectives.remove(self._objective(self._token(tokens, pos + 2)))
+                self.world.scores.pop(tokens[pos + 2], None)
+                done(len(self.world.objectives))
+            else:  # setdisplay, modify & list have no effect on the simulation
+                done(0)
+            return
+        if group != "players":
+            raise SimulationError(f"Unknown scoreboard subcommand `{group}`")
+        if action in ("set", "add", "remove"):
+            holders = resolve_score_holders(self._token(tokens, pos + 2), self.world, executor)
+            objective = self._objective(self._token(tokens, pos + 3))
+            amount = self._int(self._token(tokens, pos + 4))
+            result: Optional[int] = None
+            for holder in holders:
+                current = self.world.get_score(holder, objective)
+                current = current if current is not None else 0
+                self.world.set_score(holder, objective, amount if action == "set" else (current + amount if action == "add" else current - amount))
+                result = self.world.get_score(holder, objective)
+            done(result)
+        elif action == "get":
+            holders = resolve_score_holders(self._token(tokens, pos + 2), self.world, executor)
+            objective = self._objective(self._token(tokens, pos + 3))
+            done(self.world.get_score(holders[0], objective) if len(holders) == 1 else None)
+        elif action == "reset":
+            target = self._token(tokens, pos + 2)
+            objective = self._objective(tokens[pos + 3]) if len(tokens) > pos + 3 else None
+            if target == "*":
+                holders = sorted({holder for obj_holders in self.world.scores.values() for holder in obj_holders})
+            else:
+                holders = resolve_score_holders(target, self.world, executor)
+            for holder in holders:
+                self.world.reset_score(holder, objective)
+            done(len(holders) if len(holders) >= 1 else None)
+        elif action == "operation":
+            self._score_operation(tokens, pos + 2, executor, done)
+        elif action in ("enable", "list", "display"):
+            done(0)
+        else:
+            raise SimulationError(f"Unknown scoreboard players subcommand `{action}`")
+
+    def _score_operation(self, tokens: List[str], pos: int, executor: Optional[SimEntity], done: ResultCallback) -> None:
+        targets = resolve_score_holders(self._token(tokens, pos), self.world, executor)
+        target_obj = self._objective(self._token(tokens, pos + 1))
+        operation = self._token(tokens, pos + 2)
+        sources = resolve_score_holders(self._token(tokens, pos + 3), self.world, executor)
+        source_obj = self._objective(self._token(tokens, pos + 4))
+        result: Optional[int] = None
+        for target in targets:
+            for source in sources:
+                value = self.world.get_score(target, target_obj)
+                value = value if value is not None else 0
+                other = self.world.get_score(source, source_obj)
+                if other is None:
+                    done(None)  # Reading an unset score fails the command
+                    return
+                if operation == "=":
+                    value = other
+                elif operation == "+=":
+                    value = value + other
+                elif operation == "-=":
+                    value = value - other
+                elif operation == "*=":
+                    value = value * other
+                elif operation == "/=":
+                    value = (value // other) if other != 0 else value  # Floor division, division by zero is ignored
+                elif operation == "%=":
+                    value = (value % other) if other != 0 else value  # Floor modulo (sign of divisor), modulo by zero is ignored
+                elif operation == "<":
+                    value = min(value, other)
+                elif operation == ">":
+                    value = max(value, other)
+                elif operation == "><":
+                    self.world.set_score(source, source_obj, value)
+                    value = other
+                else:
+                    raise SimulationError(f"Unknown scoreboard operation `{operation}`")
+                self.world.set_score(target, target_obj, value)
+                result = wrap_int(value)
+        done(result)
+
+    def _cmd_execute(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        sub = self._token(tokens, pos)
+        if sub == "run":
+            self._run(tokens, pos + 1, executor, frame, done)
+        elif sub == "as":
+            for entity in resolve_entities(self._token(tokens, pos + 1), self.world, executor):
+                self._cmd_execute(tokens, pos + 2, entity, frame, done)
+        elif sub == "at":
+            for _ in resolve_entities(self._token(tokens, pos + 1), self.world, executor):
+                self._cmd_execute(tokens, pos + 2, executor, frame, done)
+        elif sub in ("positioned", "rotated", "facing"):
+            mode = self._token(tokens, pos + 1)
+            if mode in ("as", "entity"):
+                next_pos = pos + (3 if mode == "as" else 4)
+                for _ in resolve_entities(self._token(tokens, pos + 2), self.world, executor):
+                    self._cmd_execute(tokens, next_pos, executor, frame, done)
+                return
+            next_pos = pos + (3 if mode == "over" else (3 if sub == "rotated" else 4))
+            self._cmd_execute(tokens, next_pos, executor, frame, done)
+        elif sub in ("anchored", "align", "in"):
+            self._cmd_execute(tokens, pos + 2, executor, frame, done)
+        elif sub == "summon":
+            self._cmd_execute(tokens, pos + 2, self.world.summon(self._token(tokens, pos + 1)), frame, done)
+        elif sub in ("if", "unless"):
+            self._condition(tokens, pos + 1, sub == "if", executor, frame, done)
+        elif sub == "store":
+            self._store(tokens, pos + 1, executor, frame, done)
+        else:
+            raise SimulationError(f"Unsupported execute subcommand `{sub}`")
+
+    def _condition(self, tokens: List[str], pos: int, expected: bool, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        kind = self._token(tokens, pos)
+        result = 1
+        if kind == "score":
+            holders = resolve_score_holders(self._token(tokens, pos + 1), self.world, executor)
+            objective = self._objective(self._token(tokens, pos + 2))
+            value = self.world.get_score(holders[0], objective) if len(holders) == 1 else None
+            comparison = self._token(tokens, pos + 3)
+            if comparison == "matches":
+                passed = value is not None and in_range(value, parse_range(self._token(tokens, pos + 4)))
+                next_pos = pos + 5
+            else:
+                sources = resolve_score_holders(self._token(tokens, pos + 4), self.world, executor)
+                other = self.world.get_score(sources[0], self._objective(self._token(tokens, pos + 5))) if len(sources) == 1 else None
+                if comparison not in ("<", "<=", "=", ">=", ">"):
+                    raise SimulationError(f"Unknown score comparison `{comparison}`")
+                passed = value is not None and other is not None and {
+                    "<": value < other, "<=": value <= other, "=": value == other, ">=": value >= other, ">": value > other
+                }[comparison]
+                next_pos = pos + 6
+        elif kind == "entity":
+            result = len(resolve_entities(self._token(tokens, pos + 1), self.world, executor))
+            passed = result >= 1
+            next_pos = pos + 2
+        elif kind == "data":
+            if self._token(tokens, pos + 1) != "storage":
+                raise SimulationError(f"Unsupported execute condition `{kind} {tokens[pos + 1]}`, only storage data is modelled")
+            result = len(get_path(self._storage(self._token(tokens, pos + 2)), self._token(tokens, pos + 3)))
+            passed = result >= 1
+            next_pos = pos + 4
+        elif kind == "block":
+            passed = namespaced(self._token(tokens, pos + 4).split("[")[0]) == "minecraft:air"  # The simulated world is empty
+            next_pos = pos + 5
+        elif kind == "blocks":
+            passed = True  # Every region of an empty world matches every other
+            next_pos = pos + 11
+        elif kind == "function":
+            def after_function(function_result: Optional[int]) -> None:
+                passed = function_result is not None and function_result != 0
+                self._after_condition(tokens, pos + 2, passed == expected, 1, executor, frame, done)
+            self._call(self._token(tokens, pos + 1), executor, after_function)
+            return
+        else:
+            raise SimulationError(f"Unsupported execute condition `{kind}`")
+        self._after_condition(tokens, next_pos, passed == expected, (result if expected else 1), executor, frame, done)
+
+    def _after_condition(
+            self, tokens: List[str], next_pos: int, passed: bool, result: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback
+            ) -> None:
+        if next_pos >= len(tokens):
+            done(result if passed else None)
+        elif passed:
+            self._cmd_execute(tokens, next_pos, executor, frame, done)
+        else:
+            done(None)
+
+    def _store(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        store_success = self._token(tokens, pos) == "success"
+        target_kind = self._token(tokens, pos + 1)
+
+        def stored_value(result: Optional[int]) -> int:
+            if store_success:
+                return 0 if result is None else 1
+            return 0 if result is None else result
+
+        if target_kind == "score":
+            holders = resolve_score_holders(self._token(tokens, pos + 2), self.world, executor)
+            objective = self._objective(self._token(tokens, pos + 3))
+            next_pos = pos + 4
+
+            def store(result: Optional[int]) -> None:
+                for holder in holders:
+                    self.world.set_score(holder, objective, stored_value(result))
+                done(result)
+        elif target_kind == "storage":
+            root = self._storage(self._token(tokens, pos + 2))
+            nbt_path = self._token(tokens, pos + 3)
+            nbt_type = self._token(tokens, pos + 4)
+            scale = float(self._token(tokens, pos + 5))
+            next_pos = pos + 6
+
+            def store(result: Optional[int]) -> None:
+                value = stored_value(result) * scale
+                set_path(root, nbt_path, float(value) if nbt_type in ("float", "double") else int(value))
+                done(result)
+        elif target_kind in ("entity", "block", "bossbar"):
+            self.stats.unmodelled_commands[f"execute store {target_kind}"] += 1
+            next_pos = pos + {"entity": 6, "block": 8, "bossbar": 4}[target_kind]
+            store = done
+        else:
+            raise SimulationError(f"Unknown execute store target `{target_kind}`")
+        self._cmd_execute(tokens, next_pos, executor, frame, store)
+
+    def _cmd_function(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        function_id = self._token(tokens, pos)
+        macro_args: Optional[Dict[str, Any]] = None
+        if len(tokens) > pos + 1:
+            if tokens[pos + 1] == "with":
+                if self._token(tokens, pos + 2) != "storage":
+                    raise SimulationError("Only storage can be used as the source of macro arguments")
+                root = self._storage(self._token(tokens, pos + 3))
+                values = get_path(root, tokens[pos + 4]) if len(tokens) > pos + 4 else [root]
+                if len(values) != 1 or not isinstance(values[0], dict):
+                    raise SimulationError("Macro arguments must be a single compound")
+                macro_args = values[0]
+            else:
+                macro_args = parse_snbt(" ".join(tokens[pos + 1:]))
+                if not isinstance(macro_args, dict):
+                    raise SimulationError("Macro arguments must be a compound")
+        self._call(function_id, executor, done, macro_args)
+
+    def _cmd_return(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        value = self._token(tokens, pos)
+        frame.returned = True
+        if value == "run":
+            def finish(result: Optional[int]) -> None:
+                frame.result = result
+            self._run(tokens, pos + 1, executor, frame, finish)
+        elif value == "fail":
+            frame.result = None
+        else:
+            frame.result = self._int(value)
+        done(frame.result)
+
+    def _cmd_schedule(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        action = self._token(tokens, pos)
+        function_id = namespaced(self._token(tokens, pos + 1))
+        if action == "clear":
+            cleared = len([entry for entry in self.world.scheduled if entry[1] == function_id])
+            self.world.scheduled = [entry for entry in self.world.scheduled if entry[1] != function_id]
+            done(cleared if cleared >= 1 else None)
+            return
+        if action != "function":
+            raise SimulationError(f"Unknown schedule subcommand `{action}`")
+        if function_id not in self.functions:
+            raise SimulationError(f"Unknown function `{function_id}`")
+        time = self._token(tokens, pos + 2)
+        try:
+            delay = round(float(time[:-1]) * _TIME_UNITS[time[-1]]) if time[-1] in _TIME_UNITS else int(time)
+        except ValueError:
+            raise SimulationError(f"Invalid schedule time `{time}`")
+        if delay <= 0:
+            raise SimulationError("Schedule time must be at least 1 tick")
+        if len(tokens) <= pos + 3 or tokens[pos + 3] == "replace":
+            self.world.scheduled = [entry for entry in self.world.scheduled if entry[1] != function_id]
+        self.world.scheduled.append((self.world.game_time + delay, function_id))
+        done(self.world.game_time + delay)
+
+    def _cmd_tag(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        entities = resolve_entities(self._token(tokens, pos), self.world, executor)
+        action = self._token(tokens, pos + 1)
+        if action == "list":
+            done(len({tag for entity in entities for tag in entity.tags}))
+            return
+        tag = self._token(tokens, pos + 2)
+        changed = 0
+        for entity in entities:
+            if action == "add" and tag not in entity.tags:
+                entity.tags.add(tag)
+                changed += 1
+            elif action == "remove" and tag in entity.tags:
+                entity.tags.remove(tag)
+                changed += 1
+            elif action not in ("add", "remove"):
+                raise SimulationError(f"Unknown tag subcommand `{action}`")
+        done(changed if changed >= 1 else None)
+
+    def _cmd_team(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        action = self._token(tokens, pos)
+        if action == "join":
+            team = self._token(tokens, pos + 1)
+            entities = resolve_entities(tokens[pos + 2], self.world, executor) if len(tokens) > pos + 2 else ([executor] if executor is not None else [])
+        elif action == "leave":
+            team = None
+            entities = resolve_entities(self._token(tokens, pos + 1), self.world, executor)
+        else:  # Team creation & options don't change which entities are in a team
+            done(0)
+            return
+        for entity in entities:
+            entity.team = team
+        done(len(entities) if len(entities) >= 1 else None)
+
+    def _cmd_data(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        action = self._token(tokens, pos)
+        if self._token(tokens, pos + 1) != "storage":
+            self.stats.unmodelled_commands[f"data {action} {tokens[pos + 1]}"] += 1
+            done(0)
+            return
+        root = self._storage(self._token(tokens, pos + 2))
+        if action == "get":
+            values = get_path(root, tokens[pos + 3]) if len(tokens) > pos + 3 else [root]
+            scale = float(tokens[pos + 4]) if len(tokens) > pos + 4 else 1
+            done(to_int(values[0], scale) if len(values) == 1 else None)
+        elif action == "remove":
+            removed = remove_path(root, self._token(tokens, pos + 3))
+            done(removed if removed >= 1 else None)
+        elif action == "merge":
+            compound = parse_snbt(" ".join(tokens[pos + 3:]))
+            if not isinstance(compound, dict):
+                raise SimulationError("data merge requires a compound")
+            root.update(compound)
+            done(1)
+        elif action == "modify":
+            self._data_modify(root, tokens, pos + 3, done)
+        else:
+            raise SimulationError(f"Unknown data subcommand `{action}`")
+
+    def _data_modify(self, root: Dict[str, Any], tokens: List[str], pos: int, done: ResultCallback) -> None:
+        nbt_path = self._token(tokens, pos)
+        operation = self._token(tokens, pos + 1)
+        index = self._int(self._token(tokens, pos + 2)) if operation == "insert" else None
+        source_pos = pos + (3 if operation == "insert" else 2)
+        source = self._token(tokens, source_pos)
+        if source == "value":
+            values = [parse_snbt(" ".join(tokens[source_pos + 1:]))]
+        elif source in ("from", "string"):
+            if self._token(tokens, source_pos + 1) != "storage":
+                raise SimulationError(f"Unsupported data modify source `{source} {tokens[source_pos + 1]}`, only storage data is modelled")
+            source_root = self._storage(self._token(tokens, source_pos + 2))
+            values = get_path(source_root, tokens[source_pos + 3]) if len(tokens) > source_pos + 3 else [source_root]
+            if source == "string":
+                values = [(value if isinstance(value, str) else render_snbt(value)) for value in values]
+        else:
+            raise SimulationError(f"Unknown data modify source `{source}`")
+        if len(values) == 0:
+            done(None)
+            return
+        if operation == "set":
+            changed = set_path(root, nbt_path, copy.deepcopy(values[0]))
+        elif operation == "merge":
+            changed = 0
+            for target in get_path(root, nbt_path):
+                if isinstance(target, dict) and isinstance(values[0], dict):
+                    target.update(copy.deepcopy(values[0]))
+                    changed += 1
+        elif operation in ("append", "prepend", "insert"):
+            changed = 0
+            for target_list in get_list_targets(root, nbt_path):
+                insert_at = len(target_list) if operation == "append" else (0 if operation == "prepend" else index)
+                target_list[insert_at:insert_at] = copy.deepcopy(values)
+                changed += len(values)
+        else:
+            raise SimulationError(f"Unknown data modify operation `{operation}`")
+        done(changed if changed >= 1 else None)
+
+    def _cmd_summon(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        entity = self.world.summon(self._token(tokens, pos))
+        if len(tokens) > pos + 4:
+            nbt = parse_snbt(" ".join(tokens[pos + 4:]))
+            if isinstance(nbt, dict):
+                entity.tags.update(str(tag) for tag in nbt.get("Tags", []))
+                if "CustomName" in nbt:
+                    entity.name = self._render_text(self._parse_text(str(nbt["CustomName"])), executor)
+        done(1)
+
+    def _cmd_kill(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        entities = resolve_entities(tokens[pos], self.world, executor) if len(tokens) > pos else ([executor] if executor is not None else [])
+        for entity in entities:
+            self.world.kill(entity)
+        done(len(entities) if len(entities) >= 1 else None)
+
+    def _cmd_tellraw(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        self._token(tokens, pos + 1)
+        self.world.chat.append(self._render_text(self._parse_text(" ".join(tokens[pos + 1:])), executor))
+        done(1)
+
+    def _cmd_say(self, tokens: List[str], pos: int, executor: Optional[SimEntity], frame: _Frame, done: ResultCallback) -> None:
+        self.world.chat.append(f"[{executor.display_name if executor is not None else 'Server'}] " + " ".join(tokens[pos:]))
+        done(1)
+
+    # ===== Text components =====
+
+    @staticmethod
+    def _parse_text(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    def _render_text(self, component: Any, executor: Optional[SimEntity]) -> str:
+        if isinstance(component, str):
+            return component
+        if isinstance(component, list):
+            return "".join(self._render_text(child, executor) for child in component)
+        if not isinstance(component, dict):
+            return json.dumps(component)
+        text = ""
+        if "text" in component:
+            text = str(component["text"])
+        elif "score" in component:
+            name = component["score"].get("name", "")
+            holders = [executor.score_holder] if name == "*" and executor is not None else resolve_score_holders(name, self.world, executor)
+            value = self.world.get_score(holders[0], component["score"].get("objective", "")) if len(holders) >= 1 else None
+            text = str(value) if value is not None else ""
+        elif "selector" in component:
+            text = ", ".join(entity.display_name for entity in resolve_entities(component["selector"], self.world, executor))
+        elif "storage" in component and "nbt" in component:
+            text = ", ".join(render_snbt(value) for value in get_path(self._storage(component["storage"]), component["nbt"]))
+        elif "translate" in component:
+            text = str(component["translate"])
+        elif "keybind" in component:
+            text = str(component["keybind"])
+        return text + "".join(self._render_text(extra, executor) for extra in component.get("extra", []))
+
+    _HANDLERS: Dict[str, Callable[['Simulator', List[str], int, Optional[SimEntity], _Frame, ResultCallback], None]] = {
+        "scoreboard": _cmd_scoreboard,
+        "execute": _cmd_execute,
+        "function": _cmd_function,
+        "return": _cmd_return,
+        "schedule": _cmd_schedule,
+        "tag": _cmd_tag,
+        "team": _cmd_team,
+        "data": _cmd_data,
+        "summon": _cmd_summon,
+        "kill": _cmd_kill,
+        "tellraw": _cmd_tellraw,
+        "say": _cmd_say,
+    }
@@ -0,0 +1,246 @@
+"""Just enough SNBT & NBT path handling to model `data ... storage` commands
+
+Compounds are dicts, lists & typed arrays are lists, numbers are int/float (the type suffix is dropped) and strings are str.
+"""
+import json
+import math
+import re
+from typing import Any, Dict, List, Union
+from mchy.errors import SimulationError
+
+
+_UNQUOTED_CHARS = re.compile(r"[A-Za-z0-9_\-.+]+")
+_INT_PATTERN = re.compile(r"[-+]?[0-9]+[bBsSlL]?")
+_FLOAT_PATTERN = re.compile(r"[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?[fFdD]?")
+
+PathNode = Union[str, int, None]  # compound key, list index or None for every element of a list
+
+
+class _SnbtReader:
+
+    def __init__(self, text: str) -> None:
+        self.text: str = text
+        self.pos: int = 0
+
+    def _error(self, message: str) -> SimulationError:
+        return SimulationError(f"Invalid SNBT `{self.text}`: {message} at index {self.pos}")
+
+    def skip_ws(self) -> None:
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self) -> str:
+        self.skip_ws()
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self._error(f"expected `{char}`")
+        self.pos += 1
+
+    def read_string(self) -> str:
+        quote = self.text[self.pos]
+        self.pos += 1
+        chars: List[str] = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            self.pos += 1
+            if char == "\\" and self.pos < len(self.text):
+                chars.append(self.text[self.pos])
+                self.pos += 1
+            elif char == quote:
+                return "".join(chars)
+            else:
+                chars.append(char)
+        raise self._error("unterminated string")
+
+    def read_unquoted(self) -> str:
+        self.skip_ws()
+        match = _UNQUOTED_CHARS.match(self.text, self.pos)
+        if match is None:
+            raise self._error("expected a value")
+        self.pos = match.end()
+        return match.group()
+
+    def read_value(self) -> Any:
+        char = self.peek()
+        if char == "{":
+            self.pos += 1
+            compound: Dict[str, Any] = {}
+            while self.peek() != "}":
+                key = self.read_string() if self.peek() in ("\"", "'") else self.read_unquoted()
+                self.expect(":")
+                compound[key] = self.read_value()
+                if self.peek() != ",":
+                    break
+                self.pos += 1
+            self.expect("}")
+            return compound
+        elif char == "[":
+            self.pos += 1
+            if re.match(r"[BIL];", self.text[self.pos:self.pos + 2]):
+                self.pos += 2
+            elements: List[Any] = []
+            while self.peek() != "]":
+                elements.append(self.read_value())
+                if self.peek() != ",":
+                    break
+                self.pos += 1
+            self.expect("]")
+            return elements
+        elif char in ("\"", "'"):
+            return self.read_string()
+        word = self.read_unquoted()
+        if _INT_PATTERN.fullmatch(word):
+            return int(word.rstrip("bBsSlL"))
+        if _FLOAT_PATTERN.fullmatch(word):
+            return float(word.rstrip("fFdD"))
+        if word in ("true", "false"):
+            return int(word == "true")
+        return word
+
+
+def parse_snbt(text: str) -> Any:
+    reader = _SnbtReader(text)
+    value = reader.read_value()
+    if reader.peek() != "":
+        raise reader._error("unexpected trailing data")
+    return value
+
+
+def render_snbt(value: Any) -> str:
+    if isinstance(value, dict):
+        return "{" + ",".join(
+            (key if _UNQUOTED_CHARS.fullmatch(key) else json.dumps(key)) + ":" + render_snbt(val) for key, val in value.items()
+        ) + "}"
+    elif isinstance(value, list):
+        return "[" + ",".join(render_snbt(elem) for elem in value) + "]"
+    elif isinstance(value, str):
+        return json.dumps(value)
+    elif isinstance(value, float):
+        return repr(value) + "d"
+    return str(value)
+
+
+def to_int(value: Any, scale: float = 1) -> int:
+    """The result of `data get` on `value`: numbers are scaled & floored, other values give their size"""
+    if isinstance(value, (int, float)):
+        return math.floor(value * scale)
+    return len(value)
+
+
+def parse_path(path: str) -> List[PathNode]:
+    nodes: List[PathNode] = []
+    pos = 0
+    while pos < len(path):
+        char = path[pos]
+        if char == ".":
+            pos += 1
+        elif char == "[":
+            end = path.find("]", pos)
+            if end == -1:
+                raise SimulationError(f"Invalid NBT path `{path}`: unterminated `[`")
+            index = path[pos + 1:end].strip()
+            if index.startswith("{"):
+                raise SimulationError(f"Invalid NBT path `{path}`: list element filters are not supported")
+            try:
+                nodes.append(int(index) if index != "" else None)
+            except ValueError:
+                raise SimulationError(f"Invalid NBT path `{path}`: bad list index `{index}`")
+            pos = end + 1
+        elif char in ("\"", "'"):
+            reader = _SnbtReader(path)
+            reader.pos = pos
+            nodes.append(reader.read_string())
+            pos = reader.pos
+        elif char == "{":
+            raise SimulationError(f"Invalid NBT path `{path}`: compound filters are not supported")
+        else:
+            end = pos
+            while end < len(path) and path[end] not in ".[{":
+                end += 1
+            nodes.append(path[pos:end])
+            pos = end
+    if len(nodes) == 0:
+        raise SimulationError(f"Invalid NBT path `{path}`: empty path")
+    return nodes
+
+
+def _children(value: Any, node: PathNode) -> List[Any]:
+    if isinstance(node, str):
+        return [value[node]] if isinstance(value, dict) and node in value else []
+    if not isinstance(value, list):
+        return []
+    if node is None:
+        return list(value)
+    if -len(value) <= node < len(value):
+        return [value[node]]
+    return []
+
+
+def get_path(root: Dict[str, Any], path: str) -> List[Any]:
+    """Get every value matched by the NBT `path`"""
+    values: List[Any] = [root]
+    for node in parse_path(path):
+        values = [child for value in values for child in _children(value, node)]
+    return values
+
+
+def _parents(root: Dict[str, Any], nodes: List[PathNode], create: bool) -> List[Any]:
+    values: List[Any] = [root]
+    for node, next_node in zip(nodes[:-1], nodes[1:]):
+        if create and isinstance(node, str):
+            for value in values:
+                if isinstance(value, dict) and node not in value:
+                    value[node] = [] if isinstance(next_node, int) or next_node is None else {}
+        values = [child for value in values for child in _children(value, node)]
+    return values
+
+
+def set_path(root: Dict[str, Any], path: str, new_value: Any) -> int:
+    """Set every value matched by the NBT `path`, creating missing compounds, returning the number of values changed"""
+    nodes = parse_path(path)
+    last = nodes[-1]
+    changed = 0
+    for parent in _parents(root, nodes, create=True):
+        if isinstance(last, str) and isinstance(parent, dict):
+            changed += int(parent.get(last) != new_value)
+            parent[last] = new_value
+        elif isinstance(parent, list):
+            indices = range(len(parent)) if last is None else ([last] if isinstance(last, int) and -len(parent) <= last < len(parent) else [])
+            for index in indices:
+                changed += int(parent[index] != new_value)
+                parent[index] = new_value
+    return changed
+
+
+def remove_path(root: Dict[str, Any], path: str) -> int:
+    """Remove every value matched by the NBT `path` returning the number removed"""
+    nodes = parse_path(path)
+    last = nodes[-1]
+    removed = 0
+    for parent in _parents(root, nodes, create=False):
+        if isinstance(last, str) and isinstance(parent, dict) and last in parent:
+            del parent[last]
+            removed += 1
+        elif isinstance(parent, list) and not isinstance(last, str):
+            if last is None:
+                removed += len(parent)
+                parent.clear()
+            elif -len(parent) <= last < len(parent):
+                del parent[last]
+                removed += 1
+    return removed
+
+
+def get_list_targets(root: Dict[str, Any], path: str) -> List[List[Any]]:
+    """Get (creating if needed) the lists matched by the NBT `path` for append/prepend/insert"""
+    nodes = parse_path(path)
+    last = nodes[-1]
+    targets: List[List[Any]] = []
+    for parent in _parents(root, nodes, create=True):
+        if isinstance(last, str) and isinstance(parent, dict) and last not in parent:
+            parent[last] = []
+        targets.extend(child for child in _children(parent, last) if isinstance(child, list))
+    return targets
+
@@ -0,0 +1,135 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from mchy.errors import SimulationError
+from mchy.sim.world import SimEntity, SimWorld, namespaced
+
+
+IntRange = Tuple[Optional[int], Optional[int]]
+
+
+def parse_range(text: str) -> IntRange:
+    """Parse an integer range such as `5`, `1..`, `..0` or `2..7` into inclusive (min, max) bounds"""
+    try:
+        if ".." not in text:
+            return int(text), int(text)
+        low, high = text.split("..", 1)
+        return (int(low) if low != "" else None), (int(high) if high != "" else None)
+    except ValueError:
+        raise SimulationError(f"Invalid integer range `{text}`")
+
+
+def in_range(value: int, bounds: IntRange) -> bool:
+    return (bounds[0] is None or value >= bounds[0]) and (bounds[1] is None or value <= bounds[1])
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts: List[str] = []
+    depth = 0
+    current: List[str] = []
+    for char in text:
+        if char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip() != "":
+        parts.append("".join(current))
+    return parts
+
+
+@dataclass
+class Selector:
+    variable: str  # One of `p`, `r`, `a`, `e` & `s`
+    arguments: List[Tuple[str, str]] = field(default_factory=list)
+
+    @staticmethod
+    def parse(text: str) -> 'Selector':
+        if len(text) < 2 or text[0] != "@" or text[1] not in "praes":
+            raise SimulationError(f"Invalid selector `{text}`")
+        selector = Selector(text[1])
+        arg_text = text[2:]
+        if arg_text == "":
+            return selector
+        if arg_text[0] != "[" or arg_text[-1] != "]":
+            raise SimulationError(f"Invalid selector `{text}`")
+        for arg in _split_top_level(arg_text[1:-1]):
+            if "=" not in arg:
+                raise SimulationError(f"Invalid selector argument `{arg.strip()}` in `{text}`")
+            key, value = arg.split("=", 1)
+            selector.arguments.append((key.strip(), value.strip()))
+        return selector
+
+    def _matches(self, entity: SimEntity, world: SimWorld) -> bool:
+        for key, value in self.arguments:
+            negated = value.startswith("!")
+            plain = value[1:] if negated else value
+            if key == "tag":
+                if plain == "":
+                    matched = len(entity.tags) >= 1 if negated else len(entity.tags) == 0
+                    if not matched:
+                        return False
+                    continue
+                result = plain in entity.tags
+            elif key == "type":
+                result = entity.entity_type == namespaced(plain)
+            elif key == "name":
+                result = entity.name == plain.strip("\"'")
+            elif key == "team":
+                result = (entity.team is not None) if plain == "" else (entity.team == plain)
+            elif key == "scores":
+                result = self._scores_match(plain, entity, world)
+            else:
+                continue  # Positional, nbt & other unmodelled arguments match everything
+            if result == negated:
+                return False
+        return True
+
+    @staticmethod
+    def _scores_match(scores: str, entity: SimEntity, world: SimWorld) -> bool:
+        for score in _split_top_level(scores.strip()[1:-1]):
+            objective, bounds = score.split("=", 1)
+            value = world.get_score(entity.score_holder, objective.strip())
+            if value is None or not in_range(value, parse_range(bounds.strip())):
+                return False
+        return True
+
+    def select(self, world: SimWorld, executor: Optional[SimEntity]) -> List[SimEntity]:
+        if self.variable == "s":
+            candidates = [executor] if executor is not None and (executor.is_player or executor in world.entities) else []
+        elif self.variable == "e":
+            candidates = list(world.entities)
+        else:
+            candidates = [entity for entity in world.entities if entity.is_player]
+        selected = [entity for entity in candidates if self._matches(entity, world)]
+        args: Dict[str, str] = dict(self.arguments)
+        sort = args.get("sort", {"p": "nearest", "r": "random"}.get(self.variable, "arbitrary"))
+        if sort == "furthest":
+            selected.reverse()  # Every entity is at the same position, so treat spawn order as distance
+        elif sort == "random":
+            world.random.shuffle(selected)
+        if "limit" in args:
+            try:
+                selected = selected[:int(args["limit"])]
+            except ValueError:
+                raise SimulationError(f"Invalid selector limit `{args['limit']}`")
+        elif self.variable in "pr":
+            selected = selected[:1]
+        return selected
+
+
+def resolve_entities(target: str, world: SimWorld, executor: Optional[SimEntity]) -> List[SimEntity]:
+    """Get the entities referenced by a selector, player name or UUID"""
+    if target.startswith("@"):
+        return Selector.parse(target).select(world, executor)
+    return [entity for entity in world.entities if (entity.is_player and entity.name == target) or entity.uuid == target]
+
+
+def resolve_score_holders(target: str, world: SimWorld, executor: Optional[SimEntity]) -> List[str]:
+    """Get the score holder names referenced by a selector or a literal (possibly fake) player name"""
+    if target.startswith("@"):
+        return [entity.score_holder for entity in Selector.parse(target).select(world, executor)]
+    return [target]
@@ -0,0 +1,100 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+import itertools
+import random
+
+
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+
+
+def wrap_int(value: int) -> int:
+    """Wrap `value` to a signed 32 bit integer, as every scoreboard value is"""
+    return ((value - INT_MIN) % 2**32) + INT_MIN
+
+
+def namespaced(resource: str) -> str:
+    """Add the implicit `minecraft:` namespace to a resource location if it doesn't have one"""
+    return resource if ":" in resource else "minecraft:" + resource
+
+
+@dataclass(eq=False)
+class SimEntity:
+    entity_type: str
+    uuid: str
+    name: Optional[str] = None
+    tags: Set[str] = field(default_factory=set)
+    team: Optional[str] = None
+
+    @property
+    def is_player(self) -> bool:
+        return self.entity_type == "minecraft:player"
+
+    @property
+    def score_holder(self) -> str:
+        """The name this entity's scores are stored under"""
+        if self.is_player and self.name is not None:
+            return self.name
+        return self.uuid
+
+    @property
+    def display_name(self) -> str:
+        if self.name is not None:
+            return self.name
+        return self.entity_type.split(":", 1)[1].replace("_", " ").title()
+
+
+class SimWorld:
+    """An in-memory stand in for the parts of a world the generated datapack can observe: entities, scores & storage
+
+    Positions, blocks & everything else are not modelled - every entity is treated as being in the same place and every block is air.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.entities: List[SimEntity] = []
+        self.objectives: Set[str] = set()
+        self.scores: Dict[str, Dict[str, int]] = {}  # objective -> score holder -> value
+        self.storage: Dict[str, Dict[str, Any]] = {}  # storage id -> compound
+        self.chat: List[str] = []  # Every message sent (tellraw, say, ...) whether or not a player would have received it
+        self.game_time: int = 0
+        self.scheduled: List[Tuple[int, str]] = []  # (due game time, function id) in order of scheduling
+        self.random: random.Random = random.Random(seed)
+        self._uuid_counter = itertools.count(1)
+
+    def _new_uuid(self) -> str:
+        return f"00000000-0000-0000-0000-{next(self._uuid_counter):012x}"
+
+    def add_player(self, name: str) -> SimEntity:
+        player = SimEntity("minecraft:player", self._new_uuid(), name)
+        self.entities.append(player)
+        return player
+
+    def summon(self, entity_type: str, tags: Optional[List[str]] = None, name: Optional[str] = None) -> SimEntity:
+        entity = SimEntity(namespaced(entity_type), self._new_uuid(), name, set(tags if tags is not None else []))
+        self.entities.append(entity)
+        return entity
+
+    def kill(self, entity: SimEntity) -> None:
+        """Remove an entity & its scores from the world, players are considered to instantly respawn and so are left in place"""
+        if entity.is_player or entity not in self.entities:
+            return
+        self.entities.remove(entity)
+        for holders in self.scores.values():
+            holders.pop(entity.score_holder, None)
+
+    def get_player(self, name: str) -> Optional[SimEntity]:
+        for entity in self.entities:
+            if entity.is_player and entity.name == name:
+                return entity
+        return None
+
+    def get_score(self, holder: str, objective: str) -> Optional[int]:
+        return self.scores.get(objective, {}).get(holder)
+
+    def set_score(self, holder: str, objective: str, value: int) -> None:
+        self.scores.setdefault(objective, {})[holder] = wrap_int(value)
+
+    def reset_score(self, holder: str, objective: Optional[str] = None) -> None:
+        for obj_name, holders in self.scores.items():
+            if objective is None or obj_name == objective:
+                holders.pop(holder, None)
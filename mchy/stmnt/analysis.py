@@ -0,0 +1,443 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from mchy.cmd_modules.function import CtxIFunc
+from mchy.common.com_types import ExecCoreTypes, InertType
+from mchy.contextual.struct.ctx_func import CtxMchyFunc
+from mchy.contextual.struct.expr import *
+from mchy.contextual.struct.stmnt import CtxForLoop, CtxIfStmnt, CtxReturn, CtxStmnt, CtxWhileLoop
+from mchy.stmnt.struct.abs_cmd import SmtCmd
+from mchy.stmnt.struct.atoms import SmtAtom, SmtConstInt, SmtVar
+from mchy.stmnt.struct.cmds import *
+from mchy.stmnt.struct.cmds.cleanup import SmtCleanupTag
+from mchy.stmnt.struct.cmds.helpers import SmtCompPredicate
+from mchy.stmnt.struct.cmds.raw import SmtConditionalRawCmd
+from mchy.stmnt.struct.cmds.tag_ops import SmtRawEntitySelector
+from mchy.stmnt.struct.function import SmtFunc
+from mchy.stmnt.struct.module import SmtModule
+from mchy.stmnt.struct.smt_frag import SmtFragment
+
+
+def module_functions(smt_module: SmtModule) -> List[SmtFunc]:
+    """Get every function of the module, each function owns its own fragments"""
+    return [
+        smt_module.setup_function, smt_module.import_ns_function, smt_module.initial_function, smt_module.ticking_function,
+        *smt_module.public_functions.values(), *smt_module.get_smt_mchy_funcs()
+    ]
+
+
+def function_fragments(func: SmtFunc) -> List[SmtFragment]:
+    """Get all fragments of `func` including the entrypoint (func_frag), the entrypoint is always first"""
+    return [func.func_frag] + func.fragments
+
+
+def is_pure_expr(ctx_expr: CtxExprNode) -> bool:
+    """True if evaluating `ctx_expr` cannot have any effect other than producing its value, conservatively False if unsure"""
+    if isinstance(ctx_expr, (CtxExprLits, CtxExprVar)):
+        return True
+    elif isinstance(ctx_expr, (CtxExprParamVal, CtxExprExtraParamVal)):
+        return ctx_expr.value is None or is_pure_expr(ctx_expr.value)  # Default values are computed ahead of time
+    elif isinstance(ctx_expr, CtxExprFuncCall):
+        return isinstance(ctx_expr.function, CtxIFunc) and ctx_expr.function.is_pure() and all(is_pure_expr(child) for child in ctx_expr.children)
+    elif isinstance(ctx_expr, (
+                CtxExprPlus, CtxExprMinus, CtxExprMult, CtxExprDiv, CtxExprMod, CtxExprExponent,
+                CtxExprCompEquality, CtxExprCompGTE, CtxExprCompGT, CtxExprCompLTE, CtxExprCompLT,
+                CtxExprNot, CtxExprAnd, CtxExprOr, CtxExprNullCoal
+            )):
+        return all(is_pure_expr(child) for child in ctx_expr.children)
+    else:
+        return False  # Chains & properties can run arbitrary library code
+
+
+def is_self_tail_call(ctx_stmnt: CtxStmnt, ctx_func: CtxMchyFunc) -> bool:
+    """True if `ctx_stmnt` returns the result of calling `ctx_func` again with the same executor, passing every (int or bool) parameter explicitly"""
+    if not isinstance(ctx_stmnt, CtxReturn) or not isinstance(ctx_stmnt.target, CtxExprFuncCall) or ctx_stmnt.target.function is not ctx_func:
+        return False
+    executor = ctx_stmnt.target.executor
+    if not (isinstance(executor, CtxExprLitThis) or (isinstance(executor, CtxExprLitWorld) and ctx_func.get_executor().target == ExecCoreTypes.WORLD)):
+        return False
+    for param in ctx_func.get_params():
+        param_type = param.get_param_type()
+        if not isinstance(param_type, InertType) or not param_type.is_intable() or ctx_stmnt.target.get_param_value(param) is None:
+            return False
+    return True
+
+
+def has_self_tail_call(ctx_stmnts: List[CtxStmnt], ctx_func: CtxMchyFunc) -> bool:
+    """True if any of `ctx_stmnts` (or the statements nested within them) is a self tail call of `ctx_func`"""
+    for ctx_stmnt in ctx_stmnts:
+        if is_self_tail_call(ctx_stmnt, ctx_func):
+            return True
+        elif isinstance(ctx_stmnt, CtxIfStmnt):
+            branches = [ctx_stmnt.if_branch, *ctx_stmnt.elif_branches] + ([ctx_stmnt.else_branch] if ctx_stmnt.else_branch is not None else [])
+            if any(has_self_tail_call(branch.exec_body, ctx_func) for branch in branches):
+                return True
+        elif isinstance(ctx_stmnt, (CtxWhileLoop, CtxForLoop)):
+            if has_self_tail_call(ctx_stmnt.exec_body, ctx_func):
+                return True
+    return False
+
+
+def constant_condition(conditions: List[Tuple[Union[SmtConstInt, SmtVar, SmtCompPredicate], bool]]) -> Optional[bool]:
+    """Get the outcome of a list of invoke conditions if it is known without running it, None if it depends on a variable"""
+    outcome: Optional[bool] = True
+    for atom, expected in conditions:
+        if isinstance(atom, SmtConstInt):
+            if (atom.value != 0) != expected:
+                return False  # One constant failing means the whole condition fails regardless of any variables
+        else:
+            outcome = None
+    return outcome
+
+
+@dataclass(frozen=True)
+class FragCallSite:
+    caller: SmtFragment
+    index: int  # The index of the invoking command in the caller's body
+    cmd: SmtConditionalInvokeFuncCmd
+
+    @property
+    def unconditional(self) -> bool:
+        return constant_condition(self.cmd.conditions) is True
+
+
+class FragGraph:
+    """The calls between the fragments of a single function
+
+    Only calls from fragments reachable from the entrypoint are recorded, unreachable fragments are listed by `unreachable`."""
+
+    def __init__(self, func: SmtFunc) -> None:
+        self.func: SmtFunc = func
+        self.reachable: List[SmtFragment] = []
+        self._call_sites: Dict[SmtFragment, List[FragCallSite]] = {}
+        seen: Set[SmtFragment] = {func.func_frag}
+        worklist: List[SmtFragment] = [func.func_frag]
+        while len(worklist) >= 1:
+            frag = worklist.pop()
+            self.reachable.append(frag)
+            for index, cmd in enumerate(frag.body):
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.target_func is func:
+                    self._call_sites.setdefault(cmd.ext_frag, []).append(FragCallSite(frag, index, cmd))
+                    if cmd.ext_frag not in seen:
+                        seen.add(cmd.ext_frag)
+                        worklist.append(cmd.ext_frag)
+                elif isinstance(cmd, SmtScheduleFragCmd) and not cmd.clear and cmd.target_func is func and cmd.ext_frag not in seen:
+                    # Scheduled fragments run on a later tick, they are reachable but have no call site
+                    seen.add(cmd.ext_frag)
+                    worklist.append(cmd.ext_frag)
+        self.unreachable: List[SmtFragment] = [frag for frag in func.fragments if frag not in seen]
+
+    def get_call_sites(self, frag: SmtFragment) -> List[FragCallSite]:
+        return self._call_sites.get(frag, [])
+
+
+def prune_unreachable(func: SmtFunc) -> int:
+    """Delete the fragments of `func` that can never be called, returns the number deleted"""
+    unreachable = FragGraph(func).unreachable
+    for frag in unreachable:
+        func.fragments.remove(frag)
+    return len(unreachable)
+
+
+def _collect_vars(value: Any, found: Set[SmtVar], seen: Set[int]) -> bool:
+    """Add every variable held (directly or in a container/struct/sub-command) by `value` to `found`
+
+    Returns False if a function or fragment is held, as then the value may be used to run arbitrary code"""
+    if id(value) in seen:
+        return True
+    seen.add(id(value))
+    if isinstance(value, SmtVar):
+        found.add(value)
+        return True
+    elif isinstance(value, (SmtFunc, SmtFragment, SmtModule)):
+        return False
+    elif isinstance(value, dict):
+        children = list(value.values())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        children = list(value)
+    elif (isinstance(value, (SmtCmd, SmtAtom, SmtCompPredicate)) or type(value).__module__.startswith(("mchy.stmnt.", "mchy.library."))) and hasattr(value, "__dict__"):
+        children = list(vars(value).values())
+    else:
+        return True  # Literals, types, enums & other non-statement data cannot reference variables
+    transparent = True
+    for child in children:
+        transparent = _collect_vars(child, found, seen) and transparent
+    return transparent
+
+
+def cmd_reads(cmd: SmtCmd) -> Set[SmtVar]:
+    """Get every variable `cmd` refers to (possibly over-approximating), not including any read by the code it invokes"""
+    found: Set[SmtVar] = set()
+    if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+        _collect_vars([cmd.conditions, cmd.executor], found, set())
+    elif isinstance(cmd, SmtInvokeFuncCmd):
+        _collect_vars(cmd.executor, found, set())
+    else:
+        _collect_vars(cmd, found, set())
+    return found
+
+
+def direct_writes(cmd: SmtCmd) -> Optional[Set[SmtVar]]:
+    """Get the variables `cmd` itself may write, not including any written by the code it invokes.  None if it may write anything"""
+    if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtInvokeFuncCmd, SmtCommentCmd, SmtCleanupTag)):
+        return set()
+    elif isinstance(cmd, (SmtRawCmd, SmtConditionalRawCmd)):
+        return None  # User written commands can do anything
+    elif isinstance(cmd, (SmtAssignCmd, SmtPlusCmd, SmtMinusCmd, SmtMultCmd, SmtDivCmd, SmtModCmd, SmtTagMergeCmd, SmtTagRemoveCmd, SmtRawEntitySelector)):
+        return {cmd.target_var}
+    elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtAndCmd, SmtOrCmd)):
+        return {cmd.out}
+    elif isinstance(cmd, SmtNotCmd):
+        return {cmd.out_var}
+    elif isinstance(cmd, SmtCompEqualityCmd):
+        return {cmd.out, cmd.value_reg, cmd.null_reg1, cmd.null_reg2, cmd.null_out_reg}
+    else:
+        # Library commands: assume they could write anything they refer to
+        found: Set[SmtVar] = set()
+        if not _collect_vars(cmd, found, set()):
+            return None
+        return found
+
+
+def direct_reads(cmd: SmtCmd) -> Set[SmtVar]:
+    """Get the variables `cmd` itself may read, not including any read by the code it invokes (possibly over-approximating)"""
+    found: Set[SmtVar] = set()
+    if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtInvokeFuncCmd)):
+        return cmd_reads(cmd)
+    elif isinstance(cmd, (SmtRawCmd, SmtCommentCmd, SmtCleanupTag)):
+        return found
+    elif isinstance(cmd, SmtConditionalRawCmd):
+        _collect_vars(cmd.conditions, found, set())
+    elif isinstance(cmd, SmtAssignCmd):
+        _collect_vars(cmd.value, found, set())
+    elif isinstance(cmd, (SmtPlusCmd, SmtMinusCmd, SmtMultCmd, SmtDivCmd, SmtModCmd, SmtTagMergeCmd, SmtTagRemoveCmd)):
+        _collect_vars([cmd.target_var, cmd.value], found, set())
+    elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtAndCmd, SmtOrCmd, SmtCompEqualityCmd)):
+        _collect_vars([cmd.lhs, cmd.rhs], found, set())
+    elif isinstance(cmd, SmtNotCmd):
+        _collect_vars(cmd.inp, found, set())
+    elif isinstance(cmd, SmtRawEntitySelector):
+        _collect_vars(cmd.executor, found, set())
+    else:
+        return cmd_reads(cmd)
+    return found
+
+
+def definite_writes(cmd: SmtCmd) -> Set[SmtVar]:
+    """Get the variables `cmd` always overwrites (in the current stack frame) without first reading them"""
+    if isinstance(cmd, SmtAssignCmd) and not isinstance(cmd, SmtSpecialStackIncTargetAssignCmd):
+        return {cmd.target_var}
+    elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtAndCmd, SmtOrCmd, SmtNotCmd, SmtCompEqualityCmd)):
+        writes = direct_writes(cmd)
+        return set() if writes is None else writes
+    else:
+        return set()
+
+
+class WriteSummary:
+    """The variables calling each fragment of a module may write, including everything written by the code it calls in turn
+
+    Variables are compared by identity so writes made to a function's variables in a deeper stack frame (e.g. by recursion) are also
+    counted, over-approximating what a single frame can observe."""
+
+    def __init__(self, smt_module: SmtModule) -> None:
+        self._frag_writes: Dict[SmtFragment, Optional[Set[SmtVar]]] = {
+            frag: set() for func in module_functions(smt_module) for frag in function_fragments(func)
+        }
+        # The writes of each fragment's own commands are found once, then the writes of the fragments it calls are added until stable
+        own_writes: Dict[SmtFragment, Optional[Set[SmtVar]]] = {}
+        callers: Dict[SmtFragment, Set[SmtFragment]] = {frag: set() for frag in self._frag_writes.keys()}
+        for frag in self._frag_writes.keys():
+            writes: Optional[Set[SmtVar]] = set()
+            for cmd in frag.body:
+                cmd_writes = direct_writes(cmd)
+                callee: Optional[SmtFragment] = None
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+                    callee = cmd.ext_frag
+                elif isinstance(cmd, SmtInvokeFuncCmd):
+                    callee = cmd.target_func.func_frag
+                if callee is not None and callee not in callers.keys():
+                    cmd_writes = None  # Fragment outside of the module?
+                elif callee is not None:
+                    callers[callee].add(frag)
+                if cmd_writes is None or writes is None:
+                    writes = None
+                else:
+                    writes |= cmd_writes
+            own_writes[frag] = writes
+        worklist: List[SmtFragment] = list(self._frag_writes.keys())
+        queued: Set[SmtFragment] = set(worklist)
+        while len(worklist) >= 1:  # Sets only grow (or become None) so this will terminate
+            frag = worklist.pop()
+            queued.discard(frag)
+            new_writes: Optional[Set[SmtVar]] = None if own_writes[frag] is None else set(own_writes[frag] or set())
+            for cmd in frag.body:
+                if new_writes is None:
+                    break
+                if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtInvokeFuncCmd)):
+                    callee_writes = self.cmd_writes(cmd)
+                    if callee_writes is None:
+                        new_writes = None
+                    else:
+                        new_writes |= callee_writes
+            if new_writes != self._frag_writes[frag]:
+                self._frag_writes[frag] = new_writes
+                for caller in callers[frag] - queued:
+                    queued.add(caller)
+                    worklist.append(caller)
+
+    def frag_writes(self, frag: SmtFragment) -> Optional[Set[SmtVar]]:
+        if frag not in self._frag_writes.keys():
+            return None  # Fragment outside of the module?
+        return self._frag_writes[frag]
+
+    def cmd_writes(self, cmd: SmtCmd) -> Optional[Set[SmtVar]]:
+        """Get the variables running `cmd` may write, None if it may write anything"""
+        writes = direct_writes(cmd)
+        if writes is None:
+            return None
+        callee_writes: Optional[Set[SmtVar]] = set()
+        if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+            callee_writes = self.frag_writes(cmd.ext_frag)
+        elif isinstance(cmd, SmtInvokeFuncCmd):
+            callee_writes = self.frag_writes(cmd.target_func.func_frag)
+        if callee_writes is None:
+            return None
+        return writes | callee_writes
+
+
+def ends_setting_true(func: SmtFunc, frag: SmtFragment, var: SmtVar, summary: WriteSummary, visiting: Optional[Set[SmtFragment]] = None) -> bool:
+    """True if once a call to `frag` (of `func`) completes `var` is guaranteed to hold a true (non-zero) value, conservatively False if unsure"""
+    visiting = set() if visiting is None else visiting
+    if frag in visiting:
+        return False
+    visiting.add(frag)
+    for cmd in reversed(frag.body):
+        if isinstance(cmd, SmtAssignCmd) and not isinstance(cmd, SmtSpecialStackIncTargetAssignCmd) and cmd.target_var is var:
+            return isinstance(cmd.value, SmtConstInt) and cmd.value.value != 0
+        writes = summary.cmd_writes(cmd)
+        if writes is None or var in writes:
+            # The last command that may write `var` must guarantee it ends true
+            return (
+                isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.target_func is func and FragCallSite(frag, 0, cmd).unconditional and
+                ends_setting_true(func, cmd.ext_frag, var, summary, visiting)
+            )
+    return False
+
+
+def local_temporaries(smt_module: SmtModule) -> Dict[SmtFunc, Set[SmtVar]]:
+    """Get, for every function, the scoreboard (int & bool) pseudo variables only referenced by commands of that function
+
+    Return, executor & error-state variables are excluded as they are also used by callers or the virtual layer"""
+    referencing_funcs: Dict[SmtVar, Set[SmtFunc]] = {}
+    for func in module_functions(smt_module):
+        for frag in function_fragments(func):
+            for cmd in frag.body:
+                for var in cmd_reads(cmd):
+                    referencing_funcs.setdefault(var, set()).add(func)
+    pinned: Set[SmtVar] = {smt_module.error_state_variable}
+    for func in smt_module.get_smt_mchy_funcs():
+        pinned.update((func.return_var, func.executor_var))
+
+    temporaries: Dict[SmtFunc, Set[SmtVar]] = {}
+    for func in module_functions(smt_module):
+        temporaries[func] = set()
+        for var in func.get_pseudo_vars():
+            var_type = var.get_type()
+            if var not in pinned and referencing_funcs.get(var, {func}) == {func} and isinstance(var_type, InertType) and var_type.is_intable():
+                temporaries[func].add(var)
+    return temporaries
+
+
+class FuncLiveness:
+    """Which of a set of a function's variables (the candidates) may still be read at each point of the function
+
+    Liveness is found across all fragments of the function, a call to a fragment of the same function reads everything the fragment
+    may read before writing it and writes everything the fragment (or anything it calls) may write.  Anything live after any call to a
+    fragment is live at the end of that fragment (after a returning call, anything live at the end of the calling fragment).  Hand written raw commands cannot name the candidates (temporaries) so are not
+    considered to read or write them.  Use `FuncLiveness.of` to create.
+    """
+
+    def __init__(self, func: SmtFunc, candidates: Set[SmtVar]) -> None:
+        self.func: SmtFunc = func
+        self.candidates: Set[SmtVar] = candidates
+        self._frag_writes: Dict[SmtFragment, Set[SmtVar]] = {frag: set() for frag in function_fragments(func)}
+        self._live_in: Dict[SmtFragment, Set[SmtVar]] = {frag: set() for frag in function_fragments(func)}
+        self._live_out: Dict[SmtFragment, Set[SmtVar]] = {frag: set() for frag in function_fragments(func)}
+        # The reads & writes of each command are found once, the loop below then only combines them across calls
+        steps: Dict[SmtFragment, List[Tuple[SmtCmd, Set[SmtVar], Set[SmtVar], Set[SmtVar]]]] = {}  # (cmd, reads, own writes, definite writes)
+        callers: Dict[SmtFragment, Set[SmtFragment]] = {frag: set() for frag in self._live_in.keys()}
+        for frag in self._live_in.keys():
+            steps[frag] = []
+            for cmd in frag.body:
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+                    callers.setdefault(cmd.ext_frag, set()).add(frag)
+                    steps[frag].append((cmd, self.cmd_reads(cmd), set(), set()))
+                else:
+                    steps[frag].append((cmd, self.cmd_reads(cmd), self.cmd_writes(cmd), definite_writes(cmd)))
+        worklist: List[SmtFragment] = list(self._live_in.keys())
+        queued: Set[SmtFragment] = set(worklist)
+        while len(worklist) >= 1:  # Sets only grow so this will terminate
+            frag = worklist.pop()
+            queued.discard(frag)
+            writes: Set[SmtVar] = set()
+            live: Set[SmtVar] = set(self._live_out[frag])
+            for cmd, reads, own_writes, killed in reversed(steps[frag]):
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+                    writes |= self._frag_writes[cmd.ext_frag]
+                    # Once a returning call completes this fragment ends, rather than continuing with the commands after the call
+                    after_call = self._live_out[frag] if cmd.returning else live
+                    if not after_call <= self._live_out[cmd.ext_frag]:
+                        self._live_out[cmd.ext_frag] |= after_call
+                        if cmd.ext_frag not in queued:
+                            queued.add(cmd.ext_frag)
+                            worklist.append(cmd.ext_frag)
+                    live = live | reads | self._live_in[cmd.ext_frag]  # The call may not happen so nothing is definitely written
+                else:
+                    writes |= own_writes
+                    live = (live - killed) | reads
+            if writes != self._frag_writes[frag] or live != self._live_in[frag]:
+                self._frag_writes[frag], self._live_in[frag] = writes, live
+                for caller in callers[frag] - queued:
+                    queued.add(caller)
+                    worklist.append(caller)
+
+    @staticmethod
+    def of(func: SmtFunc, candidates: Set[SmtVar]) -> Optional['FuncLiveness']:
+        """Get the liveness of `candidates` in `func`, None if it cannot be worked out (e.g. a command could run any code)"""
+        for frag in function_fragments(func):
+            for cmd in frag.body:
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.target_func is not func:
+                    return None  # Cannot follow calls into the fragments of other functions
+                if not isinstance(cmd, (SmtRawCmd, SmtConditionalRawCmd)) and direct_writes(cmd) is None:
+                    return None
+        return FuncLiveness(func, candidates)
+
+    def live_in(self, frag: SmtFragment) -> Set[SmtVar]:
+        """The candidates that may be read before being written when `frag` is called"""
+        return self._live_in[frag]
+
+    def live_after(self, frag: SmtFragment) -> List[Set[SmtVar]]:
+        """The candidates that may still be read after each command of `frag`"""
+        live: Set[SmtVar] = self._live_out[frag]
+        output: List[Set[SmtVar]] = []
+        for cmd in reversed(frag.body):
+            output.append(live)
+            live = self.live_before(cmd, live)
+        return output[::-1]
+
+    def cmd_reads(self, cmd: SmtCmd) -> Set[SmtVar]:
+        """The candidates `cmd` itself reads (excluding reads made by fragments it calls)"""
+        return direct_reads(cmd) & self.candidates
+
+    def cmd_writes(self, cmd: SmtCmd) -> Set[SmtVar]:
+        """The candidates running `cmd` may write, including writes made by fragments it calls"""
+        if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+            return self._frag_writes[cmd.ext_frag]
+        elif isinstance(cmd, (SmtRawCmd, SmtConditionalRawCmd)):
+            return set()
+        return (direct_writes(cmd) or set()) & self.candidates
+
+    def live_before(self, cmd: SmtCmd, live_after: Set[SmtVar]) -> Set[SmtVar]:
+        if isinstance(cmd, SmtConditionalInvokeFuncCmd):
+            return live_after | self.cmd_reads(cmd) | self._live_in[cmd.ext_frag]  # The call may not happen so nothing is definitely written
+        return (live_after - definite_writes(cmd)) | self.cmd_reads(cmd)
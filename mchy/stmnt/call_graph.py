@@ -0,0 +1,125 @@
+from typing import Dict, FrozenSet, Iterable, List, MutableSet, Set, Tuple
+from mchy.stmnt.struct.cmds import SmtInvokeFuncCmd
+from mchy.stmnt.struct.function import SmtFunc, SmtMchyFunc
+from mchy.stmnt.struct.module import SmtModule
+
+
+class SmtCallGraph:
+    """Static call graph between the functions of a module
+
+    Edges are formed from `SmtInvokeFuncCmd`s targeting mchy functions.  Fragment invocations stay inside a function and so are not edges."""
+
+    def __init__(self, smt_module: SmtModule) -> None:
+        self._mchy_funcs: List[SmtMchyFunc] = list(smt_module.get_smt_mchy_funcs())
+        self._root_funcs: List[SmtFunc] = [
+            smt_module.setup_function, smt_module.import_ns_function, smt_module.initial_function, smt_module.ticking_function,
+            *smt_module.public_functions.values()
+        ]
+        self._callees: Dict[SmtFunc, List[SmtMchyFunc]] = {}
+        for func in self._root_funcs + self._mchy_funcs:
+            self._callees[func] = SmtCallGraph._find_callees(func)
+        self._callers: Dict[SmtMchyFunc, List[SmtFunc]] = {func: [] for func in self._mchy_funcs}
+        for caller, callees in self._callees.items():
+            for callee in callees:
+                self._callers[callee].append(caller)
+        self._recursive: FrozenSet[SmtMchyFunc] = self._find_recursive_funcs()
+
+    @staticmethod
+    def _find_callees(func: SmtFunc) -> List[SmtMchyFunc]:
+        callees: List[SmtMchyFunc] = []
+        for frag in [func.func_frag] + func.fragments:
+            for cmd in frag.body:
+                if isinstance(cmd, SmtInvokeFuncCmd) and isinstance(cmd.target_func, SmtMchyFunc) and cmd.target_func not in callees:
+                    callees.append(cmd.target_func)
+        return callees
+
+    def get_callees(self, func: SmtFunc) -> Tuple[SmtMchyFunc, ...]:
+        return tuple(self._callees[func])
+
+    def get_callers(self, func: SmtMchyFunc) -> Tuple[SmtFunc, ...]:
+        return tuple(self._callers[func])
+
+    def get_sccs(self) -> List[List[SmtMchyFunc]]:
+        """Get the strongly connected components of the mchy function call graph (Tarjan), callees are always listed before their callers"""
+        index_of: Dict[SmtMchyFunc, int] = {}
+        low_link: Dict[SmtMchyFunc, int] = {}
+        on_stack: Set[SmtMchyFunc] = set()
+        stack: List[SmtMchyFunc] = []
+        sccs: List[List[SmtMchyFunc]] = []
+
+        for start in self._mchy_funcs:
+            if start in index_of:
+                continue
+            # Iterative to avoid python's recursion limit on long call chains
+            work: List[Tuple[SmtMchyFunc, int]] = [(start, 0)]
+            while len(work) >= 1:
+                func, child_ix = work.pop()
+                if child_ix == 0:
+                    index_of[func] = low_link[func] = len(index_of)
+                    stack.append(func)
+                    on_stack.add(func)
+                callees = self._callees[func]
+                if child_ix < len(callees):
+                    work.append((func, child_ix + 1))
+                    callee = callees[child_ix]
+                    if callee not in index_of:
+                        work.append((callee, 0))
+                    elif callee in on_stack:
+                        low_link[func] = min(low_link[func], index_of[callee])
+                    continue
+                if low_link[func] == index_of[func]:
+                    scc: List[SmtMchyFunc] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        scc.append(member)
+                        if member is func:
+                            break
+                    sccs.append(scc)
+                if len(work) >= 1:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[func])
+        return sccs
+
+    def _find_recursive_funcs(self) -> FrozenSet[SmtMchyFunc]:
+        recursive: Set[SmtMchyFunc] = set()
+        for scc in self.get_sccs():
+            if len(scc) >= 2 or scc[0] in self._callees[scc[0]]:
+                recursive.update(scc)
+        return frozenset(recursive)
+
+    def is_recursive(self, func: SmtMchyFunc) -> bool:
+        """True if `func` can (possibly indirectly) call itself"""
+        return func in self._recursive
+
+    def get_stack_levels(self, recursion_limit: int) -> Dict[SmtMchyFunc, FrozenSet[int]]:
+        """Get every stack level each mchy function can be executed at
+
+        Root functions (global scope, ticking, public...) run at stack level 0 and each call moves one level deeper.  Functions that
+        are never called are given stack level 0.  A function at level `recursion_limit` only produces the recursion error and so
+        has no callees of its own.
+        """
+        levels: Dict[SmtMchyFunc, MutableSet[int]] = {func: set() for func in self._mchy_funcs}
+        worklist: List[Tuple[SmtMchyFunc, int]] = []
+
+        def reach(funcs: Iterable[SmtMchyFunc], level: int) -> None:
+            for func in funcs:
+                if level not in levels[func]:
+                    levels[func].add(level)
+                    worklist.append((func, level))
+
+        for root in self._root_funcs:
+            reach(self._callees[root], 1)
+        reach([func for func in self._mchy_funcs if len(self._callers[func]) == 0], 0)
+
+        while True:
+            if len(worklist) == 0:
+                # Functions only reachable from uncalled recursive cycles are never called either, treat them as entrypoints
+                reach([func for func in self._mchy_funcs if len(levels[func]) == 0][:1], 0)
+                if len(worklist) == 0:
+                    break
+            func, level = worklist.pop()
+            if level < recursion_limit:  # At the limit only the recursion error is produced, no further calls made
+                reach(self._callees[func], level + 1)
+
+        return {func: frozenset(func_levels) for func, func_levels in levels.items()}
@@ -3,12 +3,14 @@ from typing import List, Tuple, Union
 from mchy.common.com_types import InertCoreTypes, InertType, StructType, cast_bool_to_int, matches_type
 from mchy.common.config import Config
 from mchy.contextual.struct import *
+from mchy.contextual.struct.expr import CtxExprLits
 from mchy.errors import StatementRepError, UnreachableError
-from mchy.stmnt.gen_expr import convert_expr
+from mchy.stmnt.analysis import is_pure_expr, is_self_tail_call
+from mchy.stmnt.gen_expr import convert_expr, generate_atom_param_binding
 
 from mchy.stmnt.struct import SmtCmd, SmtAssignCmd, SmtFunc, SmtMchyFunc, SmtModule
 from mchy.stmnt.struct.atoms import SmtAtom, SmtConstInt, SmtPseudoVar, SmtVar
-from mchy.stmnt.struct.cmds import CommentImportance, SmtCommentCmd, SmtCompGTECmd, SmtConditionalInvokeFuncCmd, SmtPlusCmd
+from mchy.stmnt.struct.cmds import CommentImportance, SmtCommentCmd, SmtCompGTECmd, SmtConditionalInvokeFuncCmd, SmtMinusCmd, SmtPlusCmd, SmtScheduleFragCmd
 from mchy.stmnt.struct.smt_frag import RoutingFlavour, SmtFragment
 
 
@@ -85,6 +87,8 @@ def convert_return_ln(ctx_return_ln: CtxReturn, module: SmtModule, function: Smt
     if not isinstance(function, SmtMchyFunc):
         # This error shouldn't happen usually as the ctx layer error should have caught it
         raise StatementRepError(f"Return outside of mchy function (late-error)")
+    if function.tail_call_flag is not None and is_self_tail_call(ctx_return_ln, function.get_ctx_func()):
+        return convert_tail_call(ctx_return_ln, module, function, config)
     cmds: List[SmtCmd] = []
     cmds.append(SmtCommentCmd(f"Beginning Return", importance=CommentImportance.HEADING))
     rhs_conversion, output_var = convert_expr(ctx_return_ln.target, module, function, config=config)
@@ -94,6 +98,57 @@ def convert_return_ln(ctx_return_ln: CtxReturn, module: SmtModule, function: Smt
     return cmds
 
 
+def build_tail_call_loop(function: SmtMchyFunc, module: SmtModule) -> SmtFragment:
+    """Wrap the body of `function` in a loop so self tail calls can restart it without growing the stack, returns the fragment to write the body to
+
+    A tail call reassigns the parameters & sets the `tail_call_flag`, once the body unwinds the flag causes the loop to run the body again.
+    """
+    function.tail_call_flag = function.new_pseudo_var(InertType(InertCoreTypes.BOOL))
+    loop_frag = function.func_frag.add_fragment(RoutingFlavour.COND)
+    body_frag = loop_frag.add_fragment(RoutingFlavour.LOOP)
+    loop_frag.body.append(SmtAssignCmd(function.tail_call_flag, module.get_const_with_val(0)))
+    loop_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, body_frag, module.get_world()))
+    loop_frag.body.append(SmtConditionalInvokeFuncCmd([(function.tail_call_flag, True)], function, loop_frag, module.get_world()))
+    function.func_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_frag, module.get_world()))
+    return body_frag
+
+
+def build_time_slicing(function: SmtMchyFunc, module: SmtModule, iterations_per_tick: int) -> None:
+    """Limit the loops of `function` to `iterations_per_tick` iterations per tick in total, continuing them on later ticks once it is reached
+
+    Every iteration spends one of the `iteration_budget`.  Once none is left the loop's condition fragment is scheduled to run next tick with a
+    new budget rather than called, all state the loop needs is already in the function's variables.  The stack then unwinds without
+    running anything else of the function as commands run after a call has returned are guarded by the budget (see `_loop_continue_cmds`).
+    """
+    function.iteration_budget = function.new_pseudo_var(InertType(InertCoreTypes.INT))
+    function.iterations_per_tick = iterations_per_tick
+    function.func_frag.body.append(SmtAssignCmd(function.iteration_budget, module.get_const_with_val(iterations_per_tick)))
+
+
+def convert_tail_call(ctx_return_ln: CtxReturn, module: SmtModule, function: SmtMchyFunc, config: Config) -> List[SmtCmd]:
+    if not isinstance(ctx_return_ln.target, CtxExprFuncCall) or function.tail_call_flag is None:
+        raise StatementRepError(f"Attempted to convert `{ctx_return_ln.target.render()}` as a tail call")
+    cmds: List[SmtCmd] = []
+    cmds.append(SmtCommentCmd(f"Beginning Tail Call", importance=CommentImportance.HEADING))
+    arg_cmds, param_atom_binding = generate_atom_param_binding(
+        {param: ctx_return_ln.target.get_param_value(param) for param in ctx_return_ln.target.function.get_params()}, ctx_return_ln.target.function.render(), module, function, config
+    )
+    cmds.extend(arg_cmds)
+    # Every argument is resolved before any parameter is reassigned as arguments may read the current parameters (e.g. `f(b, a)`)
+    param_bindings: List[Tuple[SmtVar, SmtAtom]] = []
+    for param, atom in param_atom_binding.items():
+        if not isinstance(param, CtxMchyParam) or atom is None:
+            raise StatementRepError(f"Tail call param `{param.render()}` has no explicit value")
+        if isinstance(atom, SmtVar):
+            arg_holder = function.new_pseudo_var(atom.get_type())
+            cmds.append(SmtAssignCmd(arg_holder, atom))
+            atom = arg_holder
+        param_bindings.append((function.param_var_lookup[param.get_label()], atom))
+    cmds.extend(SmtAssignCmd(param_var, atom) for param_var, atom in param_bindings)
+    cmds.append(SmtAssignCmd(function.tail_call_flag, module.get_const_with_val(1)))
+    return cmds
+
+
 def convert_func_decl(ctx_func_decl: MarkerDeclFunc, module: SmtModule, function: SmtFunc, config: Config) -> List[SmtCmd]:
     output_cmds: List[SmtCmd] = []
     linked_func: SmtMchyFunc = module.get_smt_func(ctx_func_decl.func)
@@ -109,7 +164,35 @@ def convert_func_decl(ctx_func_decl: MarkerDeclFunc, module: SmtModule, function
     return output_cmds
 
 
+def convert_condition(ctx_expr: CtxExprNode, module: SmtModule, function: SmtFunc, config: Config, fragment: SmtFragment) -> Tuple[List[SmtCmd], SmtAtom]:
+    """Convert the condition of an if/while, equivalent to `convert_expr` except `and`/`or` may short-circuit
+
+    From O2 the right hand side of an `and`/`or` is moved into its own fragment that is only called if the left hand side didn't already
+    decide the result.  This is only done if skipping the right hand side is unobservable (it is pure) & it needs commands to evaluate.
+    """
+    if (
+                config.optimisation.value >= Config.Optimize.O2.value and
+                isinstance(ctx_expr, (CtxExprAnd, CtxExprOr)) and
+                not isinstance(ctx_expr.right, (CtxExprLits, CtxExprVar)) and
+                is_pure_expr(ctx_expr.right)
+            ):
+        left_cmds, left_holder = convert_condition(ctx_expr.left, module, function, config, fragment)
+        output_var = function.new_pseudo_var(ctx_expr.get_type())
+        lazy_frag = fragment.add_fragment(RoutingFlavour.LAZY)
+        right_cmds, right_holder = convert_condition(ctx_expr.right, module, function, config, lazy_frag)
+        lazy_frag.body.extend(right_cmds)
+        lazy_frag.body.append(SmtAssignCmd(output_var, right_holder))
+        # `and` only needs the right hand side if the left is true, `or` only if the left is false
+        return left_cmds + [
+            SmtAssignCmd(output_var, left_holder),
+            SmtConditionalInvokeFuncCmd([(output_var, isinstance(ctx_expr, CtxExprAnd))], function, lazy_frag, module.get_world())
+        ], output_var
+    return convert_expr(ctx_expr, module, function, config)
+
+
 def convert_if_stmnt(ctx_if_stmnt: CtxIfStmnt, module: SmtModule, function: SmtFunc, config: Config, fragment: SmtFragment) -> Tuple[List[SmtCmd], SmtFragment]:
+    if config.supports(Config.Feature.RETURN_RUN):
+        return convert_if_stmnt_returning(ctx_if_stmnt, module, function, config, fragment)
     output_cmds: List[SmtCmd] = []
     conditions: List[Union[SmtConstInt, SmtVar]] = []
     passover_frag = fragment.add_fragment(RoutingFlavour.TOP)  # The fragment used to continue execution after an if statement returns to calling scope
@@ -120,7 +203,7 @@ def convert_if_stmnt(ctx_if_stmnt: CtxIfStmnt, module: SmtModule, function: SmtF
     for branch in ctx_if_stmnt.branches:
 
         # resolve condition
-        cond_exec, cond_out = convert_expr(branch.cond, module, function, config)
+        cond_exec, cond_out = convert_condition(branch.cond, module, function, config, fragment)
         output_cmds.extend(cond_exec)
 
         if not isinstance(cond_out, (SmtConstInt, SmtVar)):
@@ -148,6 +231,31 @@ def convert_if_stmnt(ctx_if_stmnt: CtxIfStmnt, module: SmtModule, function: SmtF
     return output_cmds, passover_frag
 
 
+def convert_if_stmnt_returning(
+            ctx_if_stmnt: CtxIfStmnt, module: SmtModule, function: SmtFunc, config: Config, fragment: SmtFragment
+        ) -> Tuple[List[SmtCmd], SmtFragment]:
+    """Equivalent to `convert_if_stmnt` for targets with `return run`
+
+    Each branch is called with `return run` so once a branch (and the code after the if statement it calls) is complete nothing else in the
+    fragment runs.  Later branches & the passover are then only reached if every earlier condition failed, no flag or repeated conditions
+    are needed and the conditions of later branches are only evaluated if the earlier ones failed.
+    """
+    output_cmds: List[SmtCmd] = []
+    passover_frag = fragment.add_fragment(RoutingFlavour.TOP)
+    for branch in ctx_if_stmnt.branches:
+        cond_exec, cond_out = convert_condition(branch.cond, module, function, config, fragment)
+        output_cmds.extend(cond_exec)
+        if not isinstance(cond_out, (SmtConstInt, SmtVar)):
+            raise StatementRepError(f"Statement if condition resolution is not a constant int or a variable, found `{repr(cond_out)}`")
+        branch_frag = fragment.add_fragment(RoutingFlavour.IF)
+        active_branch_frag = convert_stmnts(branch.exec_body, module, function, config, branch_frag)
+        active_branch_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, passover_frag, module.get_world()))
+        output_cmds.append(SmtConditionalInvokeFuncCmd([(cond_out, True)], function, branch_frag, module.get_world(), returning=True))
+    # Only reached if all conditions resolved false
+    output_cmds.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, passover_frag, module.get_world()))
+    return output_cmds, passover_frag
+
+
 def convert_while_loop(ctx_while: CtxWhileLoop, module: SmtModule, function: SmtFunc, config: Config, fragment: SmtFragment) -> Tuple[List[SmtCmd], SmtFragment]:
     # Build fragments
     loop_cond_check = fragment.add_fragment(RoutingFlavour.COND)
@@ -155,24 +263,61 @@ def convert_while_loop(ctx_while: CtxWhileLoop, module: SmtModule, function: Smt
     loop_exit_frag = fragment.add_fragment(RoutingFlavour.TOP)
 
     # Populate conditional fragment
-    cond_exec, cond_out = convert_expr(ctx_while.cond, module, function, config)
+    cond_exec, cond_out = convert_condition(ctx_while.cond, module, function, config, loop_cond_check)
     loop_cond_check.body.extend(cond_exec)
     if not isinstance(cond_out, (SmtConstInt, SmtVar)):
         raise StatementRepError(f"Statement while condition resolution is not a constant int or a variable, found `{repr(cond_out)}`")
-    # ORDERING: Because cond_out will not be modified after it resolves false, the superfluous 'branch to loop_body_frag' command on the runtime stack will never be called
-    loop_cond_check.body.append(SmtConditionalInvokeFuncCmd([(cond_out, False)], function, loop_exit_frag, module.get_world()))  # If the cond_out is false continue execution
-    loop_cond_check.body.append(SmtConditionalInvokeFuncCmd([(cond_out, True)], function, loop_body_frag, module.get_world()))  # If the cond_out is true run the loop body
+    loop_cond_check.body.extend(_loop_branch_cmds(cond_out, loop_body_frag, loop_exit_frag, module, function, config))
 
     # Populate body
     active_loop_frag = convert_stmnts(ctx_while.exec_body, module, function, config, loop_body_frag)
     # Make loop body return to condition
-    active_loop_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world()))
+    active_loop_frag.body.extend(_loop_continue_cmds(loop_cond_check, active_loop_frag, module, function))
 
     return [
         SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world()),  # Unconditionally call the cond resolution fragment
     ], loop_exit_frag  # return the post-loop fragment for future statement to be added to
 
 
+def _loop_branch_cmds(
+            cond_out: Union[SmtConstInt, SmtVar], loop_body_frag: SmtFragment, loop_exit_frag: SmtFragment, module: SmtModule, function: SmtFunc, config: Config
+        ) -> List[SmtCmd]:
+    """Get the commands ending a loop's condition fragment, calling the exit fragment if `cond_out` is false & the body if it is true"""
+    if config.supports(Config.Feature.RETURN_RUN):
+        # Once the loop is exited nothing else in the condition fragment runs so the body needs no condition
+        return [
+            SmtConditionalInvokeFuncCmd([(cond_out, False)], function, loop_exit_frag, module.get_world(), returning=True),
+            SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_body_frag, module.get_world()),
+        ]
+    # ORDERING: Because cond_out will not be modified after it resolves false, the superfluous 'branch to loop_body_frag' command on the runtime stack will never be called
+    body_conditions: List[Tuple[Union[SmtConstInt, SmtVar], bool]] = [(cond_out, True)]
+    if isinstance(function, SmtMchyFunc) and function.iteration_budget is not None:
+        # A suspended loop's cond_out may still be true as the stack unwinds, the exhausted budget stops the body running again
+        body_conditions.insert(0, (function.iteration_budget, True))
+    return [
+        SmtConditionalInvokeFuncCmd([(cond_out, False)], function, loop_exit_frag, module.get_world()),  # If the cond_out is false continue execution
+        SmtConditionalInvokeFuncCmd(body_conditions, function, loop_body_frag, module.get_world()),  # If the cond_out is true run the loop body
+    ]
+
+
+def _loop_continue_cmds(loop_cond_check: SmtFragment, loop_end_frag: SmtFragment, module: SmtModule, function: SmtFunc) -> List[SmtCmd]:
+    """Get the commands ending an iteration of a loop's body, calling the condition fragment again or in a time sliced function possibly suspending"""
+    if not isinstance(function, SmtMchyFunc) or function.iteration_budget is None:
+        return [SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world())]
+    resume_frag = loop_end_frag.add_fragment(RoutingFlavour.RESUME)
+    resume_frag.body.append(SmtAssignCmd(function.iteration_budget, module.get_const_with_val(function.iterations_per_tick)))
+    resume_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world()))
+    function.resume_frags.append(resume_frag)
+    suspend_frag = loop_end_frag.add_fragment(RoutingFlavour.COND)
+    suspend_frag.body.append(SmtScheduleFragCmd(function, resume_frag))
+    # ORDERING: Once suspended the budget stays exhausted, so neither the condition here nor any loop body in the frames below run again as the stack unwinds
+    return [
+        SmtMinusCmd(function.iteration_budget, module.get_const_with_val(1)),
+        SmtConditionalInvokeFuncCmd([(function.iteration_budget, False)], function, suspend_frag, module.get_world()),
+        SmtConditionalInvokeFuncCmd([(function.iteration_budget, True)], function, loop_cond_check, module.get_world()),
+    ]
+
+
 def convert_for_loop(ctx_for: CtxForLoop, module: SmtModule, function: SmtFunc, config: Config, fragment: SmtFragment) -> Tuple[List[SmtCmd], SmtFragment]:
     cmds: List[SmtCmd] = []
 
@@ -194,15 +339,13 @@ def convert_for_loop(ctx_for: CtxForLoop, module: SmtModule, function: SmtFunc,
     loop_cond_check.body.extend(index_exec)  # Any commands to ensure variable is accessible
     cond_out = function.new_pseudo_var(InertType(InertCoreTypes.BOOL))
     loop_cond_check.body.append(SmtCompGTECmd(upper_out, index_var, cond_out))  # Expr{cond_out = (index_var <= upper_out)}
-    # ORDERING: Because cond_out will not be modified after it resolves false, the superfluous 'branch to loop_body_frag' command on the runtime stack will never be called
-    loop_cond_check.body.append(SmtConditionalInvokeFuncCmd([(cond_out, False)], function, loop_exit_frag, module.get_world()))  # If the cond_out is false continue execution
-    loop_cond_check.body.append(SmtConditionalInvokeFuncCmd([(cond_out, True)], function, loop_body_frag, module.get_world()))  # If the cond_out is true run the loop body
+    loop_cond_check.body.extend(_loop_branch_cmds(cond_out, loop_body_frag, loop_exit_frag, module, function, config))
 
     # -- Populate body --
     active_loop_frag = convert_stmnts(ctx_for.exec_body, module, function, config, loop_body_frag)
     # Increment index and return to condition
     active_loop_frag.body.append(SmtPlusCmd(index_var, module.get_const_with_val(1)))
-    active_loop_frag.body.append(SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world()))
+    active_loop_frag.body.extend(_loop_continue_cmds(loop_cond_check, active_loop_frag, module, function))
 
     cmds.append(
         SmtConditionalInvokeFuncCmd([(module.get_const_with_val(1), True)], function, loop_cond_check, module.get_world()),  # Unconditionally call the cond resolution fragment
@@ -1,4 +1,6 @@
-from typing import List
+from fractions import Fraction
+from math import gcd
+from typing import Dict, List
 from mchy.common.com_loc import ComLoc
 from mchy.common.com_types import ExecCoreTypes, ExecType, InertCoreTypes, InertType, matches_type
 from mchy.common.config import Config
@@ -9,16 +11,23 @@ from mchy.contextual.struct.expr.structs import CtxExprPyStruct
 from mchy.contextual.struct.stmnt import CtxStmnt
 from mchy.errors import ConversionError, StatementRepError
 from mchy.library.std.cmd_cmd import SmtRawCmd
+from mchy.stmnt.analysis import has_self_tail_call
+from mchy.stmnt.call_graph import SmtCallGraph
 from mchy.stmnt.gen_expr import convert_func_call_expr
-from mchy.stmnt.gen_stmnt import convert_stmnts
+from mchy.stmnt.gen_stmnt import build_tail_call_loop, build_time_slicing, convert_stmnts
 from mchy.stmnt.helpers import runtime_error_tellraw_formatter
-from mchy.stmnt.struct.atoms import SmtConstInt, SmtWorld
+from mchy.stmnt.optimize import optimize
+from mchy.stmnt.storage_stack import insert_frame_saves
+from mchy.stmnt.struct.atoms import SmtConstInt, SmtVar, SmtWorld
+from mchy.stmnt.struct.cmds.arithmetic import SmtModCmd, SmtPlusCmd
 from mchy.stmnt.struct.cmds.assign import SmtAssignCmd
+from mchy.stmnt.struct.cmds.func_invoke import SmtConditionalInvokeFuncCmd, SmtScheduleFragCmd
+from mchy.stmnt.struct.cmds.helpers import SmtCompPredicate
 from mchy.stmnt.struct.cmds.raw import SmtConditionalRawCmd
 from mchy.stmnt.struct.cmds.tag_ops import SmtRawEntitySelector
 from mchy.stmnt.struct.function import SmtFunc
 from mchy.stmnt.struct.module import SmtModule
-from mchy.stmnt.struct.smt_frag import SmtFragment
+from mchy.stmnt.struct.smt_frag import RoutingFlavour, SmtFragment
 
 
 def convert(ctx_module: CtxModule, config: Config) -> SmtModule:
@@ -37,15 +46,50 @@ def convert(ctx_module: CtxModule, config: Config) -> SmtModule:
         config.logger.very_verbose(f"SMT: Building body of function `{mchy_func.render()}`")
         smt_mchy_func = smt_module.get_smt_func(mchy_func)
         smt_mchy_func.func_frag.body.append(SmtRawEntitySelector(SmtWorld(), smt_mchy_func.executor_var, "@s"))
-        convert_stmnts(mchy_func.exec_body, smt_module, smt_mchy_func, config, smt_mchy_func.func_frag)
+        body_frag = smt_mchy_func.func_frag
+        iterations_per_tick = ctx_module.get_iterations_per_tick(mchy_func)
+        if iterations_per_tick is not None:
+            build_time_slicing(smt_mchy_func, smt_module, iterations_per_tick)
+        elif config.optimisation.value >= Config.Optimize.O2.value and has_self_tail_call(mchy_func.exec_body, mchy_func):
+            body_frag = build_tail_call_loop(smt_mchy_func, smt_module)
+        convert_stmnts(mchy_func.exec_body, smt_module, smt_mchy_func, config, body_frag)
     # handle decorated functions
+    handle_time_slicing(ctx_module, smt_module, config)
     handle_ticking(ctx_module, smt_module, config)
     handle_public(ctx_module, smt_module, config)
+    # optimize
+    config.logger.very_verbose(f"SMT: Optimizing")
+    optimize(smt_module, config)
+    if config.storage_stack:
+        config.logger.very_verbose(f"SMT: Saving frames around recursive calls")
+        insert_frame_saves(smt_module, config)
     # return module
     smt_module.create_all_lazy_variables()
     return smt_module
 
 
+def handle_time_slicing(ctx_module: CtxModule, smt_module: SmtModule, config: Config) -> None:
+    call_graph = SmtCallGraph(smt_module)
+    for mchy_func in ctx_module.get_mchy_functions():
+        smt_mchy_func = smt_module.get_smt_func(mchy_func)
+        if smt_mchy_func.iteration_budget is None:
+            continue
+        if call_graph.is_recursive(smt_mchy_func):
+            raise ConversionError(
+                f"Time sliced function `{mchy_func.get_name()}` can be called recursively, a call of it continuing on a later tick " +
+                f"could be overwritten by the calls it made"
+            ).with_loc(mchy_func.get_signature_loc())
+        for var in smt_mchy_func.get_all_vars():
+            var_type = var.get_type()
+            if isinstance(var_type, ExecType) and var_type.target != ExecCoreTypes.WORLD:
+                raise ConversionError(
+                    f"Time sliced function `{mchy_func.get_name()}` cannot hold entities as they are forgotten between ticks, " +
+                    f"found `{var_type.render()}`.  Consider moving the entity logic into a separate function"
+                ).with_loc(mchy_func.get_signature_loc())
+        # A new call abandons any earlier call of the function still waiting to continue on a later tick
+        smt_mchy_func.func_frag.body[1:1] = [SmtScheduleFragCmd(smt_mchy_func, resume_frag, clear=True) for resume_frag in smt_mchy_func.resume_frags]
+
+
 def handle_ticking(ctx_module: CtxModule, smt_module: SmtModule, config: Config) -> None:
     if config.debug_mode:
         last_tick_failed_var = smt_module.initial_function.new_pseudo_var(InertType(InertCoreTypes.INT))
@@ -57,14 +101,54 @@ def handle_ticking(ctx_module: CtxModule, smt_module: SmtModule, config: Config)
         ))
         smt_module.ticking_function.func_frag.body.append(SmtAssignCmd(last_tick_failed_var, SmtConstInt(1)))
         smt_module.ticking_function.func_frag.body.append(SmtAssignCmd(smt_module.error_state_variable, SmtConstInt(0)))
-    for ticking_func in ctx_module.get_ticking_funcs():
+    ticking_funcs = ctx_module.get_ticking_funcs()
+    periods: List[int] = [ctx_module.get_ticking_period(ticking_func) for ticking_func in ticking_funcs]
+    phases: List[int] = assign_tick_phases(periods)
+    # Functions not run every tick are called when a counter of the ticks (modulo their period) reaches their phase
+    tick_counters: Dict[int, SmtVar] = {}
+    for period in sorted(set(periods) - {1}):
+        # Owned by the global scope so the count survives between ticks
+        tick_counters[period] = smt_module.initial_function.new_pseudo_var(InertType(InertCoreTypes.INT))
+        smt_module.ticking_function.func_frag.body.append(SmtPlusCmd(tick_counters[period], smt_module.get_const_with_val(1)))
+        smt_module.ticking_function.func_frag.body.append(SmtModCmd(tick_counters[period], smt_module.get_const_with_val(period)))
+    for ticking_func, period, phase in zip(ticking_funcs, periods, phases):
+        call_frag = smt_module.ticking_function.func_frag
+        if period != 1:
+            call_frag = smt_module.ticking_function.func_frag.add_fragment(RoutingFlavour.COND)
+            smt_module.ticking_function.func_frag.body.append(SmtConditionalInvokeFuncCmd(
+                [(SmtCompPredicate(tick_counters[period], SmtCompPredicate.Op.EQ, smt_module.get_const_with_val(phase)), True)],
+                smt_module.ticking_function, call_frag, smt_module.get_world()
+            ))
         pseudo_ctx_func_call: CtxExprFuncCall = CtxExprFuncCall(CtxExprLitWorld(src_loc=ComLoc()), ticking_func, [], [], src_loc=ComLoc())
         call_cmds, _ = convert_func_call_expr(pseudo_ctx_func_call, smt_module, smt_module.ticking_function, config)
-        smt_module.ticking_function.func_frag.body.extend(call_cmds)
+        call_frag.body.extend(call_cmds)
     if config.debug_mode:
         smt_module.ticking_function.func_frag.body.append(SmtAssignCmd(last_tick_failed_var, SmtConstInt(0)))
 
 
+def assign_tick_phases(periods: List[int]) -> List[int]:
+    """Choose the tick (modulo its period) each periodic function runs on so as few as possible run on the same tick
+
+    Functions are placed in order of how often they run, each taking the phase on which it would run alongside the other functions
+    the least often (two functions of periods P & Q on phases p & q run on the same tick once every lcm(P, Q) ticks if p = q (mod
+    gcd(P, Q)), never otherwise).  Ties go to the earliest phase.
+    """
+    phases: List[int] = [0] * len(periods)
+    placed: List[int] = []
+    for index in sorted(range(len(periods)), key=lambda index: periods[index]):
+        period = periods[index]
+        if period == 1:
+            continue  # Runs on every tick whatever the phase
+        clashes: List[Fraction] = [Fraction(0)] * period
+        for other in placed:
+            divisor = gcd(period, periods[other])
+            for phase in range(phases[other] % divisor, period, divisor):
+                clashes[phase] += Fraction(divisor, period * periods[other])
+        phases[index] = clashes.index(min(clashes))
+        placed.append(index)
+    return phases
+
+
 def handle_public(ctx_module: CtxModule, smt_module: SmtModule, config: Config) -> None:
     if len(ctx_module.get_public_funcs()) == 0:
         return  # This prevents tests needing to import the STD library to use convert
@@ -76,7 +160,7 @@ def handle_public(ctx_module: CtxModule, smt_module: SmtModule, config: Config)
         raise StatementRepError("Cannot get color struct - has STD library failed to load structs (but did load functions?)?")
 
     for ctx_pub_func in ctx_module.get_public_funcs():
-        smt_pub_func = SmtFunc()
+        smt_pub_func = SmtFunc(f"public/{ctx_pub_func.get_name()}")
         smt_pub_func.func_frag.body.append(SmtRawCmd(
             r'''tellraw @a ["",{"text":"Manually calling public function `","color":"blue"},{"text":"''' + ctx_pub_func.get_name() +
             r'''","color":"light_purple"},{"text":"`","color":"blue"}]'''
@@ -0,0 +1,909 @@
+from abc import ABC, abstractmethod
+import copy
+from dataclasses import dataclass
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type, Union
+from mchy.common.com_types import InertType
+from mchy.common.config import Config
+from mchy.stmnt.analysis import (
+    FragCallSite, FragGraph, FuncLiveness, WriteSummary, cmd_reads, constant_condition, definite_writes, direct_reads, direct_writes,
+    ends_setting_true, function_fragments, local_temporaries, module_functions, prune_unreachable
+)
+from mchy.stmnt.struct.cmds import (
+    SmtAndCmd, SmtAssignCmd, SmtCommentCmd, SmtCompEqualityCmd, SmtCompGTCmd, SmtCompGTECmd, SmtConditionalInvokeFuncCmd, SmtDivCmd, SmtInvokeFuncCmd,
+    SmtMinusCmd, SmtModCmd, SmtMultCmd, SmtNotCmd, SmtOrCmd, SmtPlusCmd, SmtScheduleFragCmd, SmtSpecialStackIncSourceAssignCmd, SmtSpecialStackIncTargetAssignCmd
+)
+from mchy.stmnt.struct.cmds.helpers import SmtCompPredicate
+from mchy.stmnt.struct.cmds.raw import SmtConditionalRawCmd
+from mchy.stmnt.struct.abs_cmd import SmtCmd
+from mchy.stmnt.struct.atoms import SmtConstInt, SmtPseudoVar, SmtVar, SmtWorld
+from mchy.stmnt.struct.function import SmtFunc
+from mchy.stmnt.struct.module import SmtModule
+from mchy.stmnt.struct.smt_frag import RoutingFlavour, SmtFragment
+
+
+# ===== Core Structures =====
+
+
+class SmtOptimisation(ABC):
+
+    __optimizations: List['SmtOptimisation'] = []
+    __singleton_access: Dict[Type['SmtOptimisation'], 'SmtOptimisation'] = {}
+
+    @staticmethod
+    def optimizations() -> Tuple['SmtOptimisation', ...]:
+        return tuple(SmtOptimisation.__optimizations)
+
+    @classmethod
+    def get(cls) -> 'SmtOptimisation':
+        return SmtOptimisation.__singleton_access[cls]
+
+    def __init_subclass__(cls) -> None:
+        SmtOptimisation.__singleton_access[cls] = cls()
+        SmtOptimisation.__optimizations.append(cls.get())
+        return super().__init_subclass__()
+
+    @abstractmethod
+    def level(self) -> Config.Optimize:
+        ...
+
+    @abstractmethod
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        """Optimize the module in place, returns True if anything was changed"""
+        ...
+
+    def is_final(self) -> bool:
+        """Final optimisations run once, after all others stop making changes, as what they do is invalidated by any later rewrite"""
+        return False
+
+
+@dataclass
+class SmtOptimisationStats:
+    runs: int = 0
+    hits: int = 0
+    runtime: float = 0.0  # Seconds
+
+
+def _run_optimisation(opt: SmtOptimisation, smt_module: SmtModule, config: Config) -> bool:
+    opt_stats = smt_module.optimisation_stats[type(opt).__name__]
+    start_time = time.perf_counter()
+    res = opt.optimize(smt_module, config)
+    opt_stats.runtime += time.perf_counter() - start_time
+    opt_stats.runs += 1
+    if res:
+        opt_stats.hits += 1
+    return res
+
+
+def optimize(smt_module: SmtModule, config: Config) -> SmtModule:
+    """Run every enabled optimisation, in registration order, until a full pass over them changes nothing then run the final optimisations"""
+    optimisations: List[SmtOptimisation] = [opt for opt in SmtOptimisation.optimizations() if opt.level().value <= config.optimisation.value]
+    stats: Dict[str, SmtOptimisationStats] = smt_module.optimisation_stats
+    for opt in optimisations:
+        stats.setdefault(type(opt).__name__, SmtOptimisationStats())
+
+    for _ in range(100):  # Prevents inf loops
+        changed = False
+        for opt in optimisations:
+            if not opt.is_final() and _run_optimisation(opt, smt_module, config):
+                changed = True
+        if not changed:
+            break
+    else:
+        config.logger.warn("Over 100 statement optimisation passes applied, infinite loop probable, Ending")
+    for opt in optimisations:
+        if opt.is_final():
+            _run_optimisation(opt, smt_module, config)
+
+    for opt_name, opt_stats in stats.items():
+        config.logger.very_verbose(f"SMT: {opt_name}: ran {opt_stats.runs} time(s), applied {opt_stats.hits} time(s), took {opt_stats.runtime*1000:.2f}ms")
+    return smt_module
+
+
+# ===== Optimisations =====
+
+
+class FoldConstantConditions(SmtOptimisation):
+    """Resolve the constant parts of invoke & raw command conditions at compile time
+
+    Commands whose conditions can never pass are deleted (along with any fragments only they called), always-true constant conditions
+    are dropped leaving only the variable conditions.  If no conditions remain the command runs unconditionally, for a returning call
+    (`return run`) the commands after it are then deleted.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O1
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        changed = False
+        for func in module_functions(smt_module):
+            func_changed = False
+            for frag in function_fragments(func):
+                new_body: List[SmtCmd] = []
+                for cmd in frag.body:
+                    if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+                        outcome = constant_condition(cmd.conditions)
+                        if outcome is False:
+                            func_changed = True
+                            continue  # Never ran
+                        folded = [(atom, expected) for atom, expected in cmd.conditions if not isinstance(atom, SmtConstInt)]
+                        if len(folded) == 0:
+                            folded = [(smt_module.get_const_with_val(1), True)]  # Conditions cannot be empty, a lone constant true renders as no condition
+                        if len(folded) != len(cmd.conditions):
+                            cmd.conditions = folded
+                            func_changed = True
+                        if outcome is True and isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.returning:
+                            new_body.append(cmd)
+                            func_changed = func_changed or len(new_body) != len(frag.body)
+                            break  # The fragment always ends with this call
+                    new_body.append(cmd)
+                frag.body = new_body
+            if func_changed:
+                if (pruned := prune_unreachable(func)) >= 1:
+                    config.logger.very_verbose(f"SMT: {type(self).__name__}: Deleting {pruned} unreachable fragment(s) from `{func.id}`")
+                changed = True
+        return changed
+
+
+class MergeFragments(SmtOptimisation):
+    """Collapse the passover & trampoline fragments left behind by control flow conversion
+
+    * Fragments that can never be called (e.g. code after a `return`) are deleted
+    * Calls to empty fragments are deleted, invoke conditions only read variables so skipping the call changes nothing
+    * Calls to a fragment that only unconditionally calls another fragment are redirected to that other fragment
+    * A fragment with exactly one caller, that calls it unconditionally, is spliced into the caller in place of the call
+
+    A returning call (`return run`) ends the calling fragment once complete.  As the last command of a fragment that changes nothing
+    so it becomes a plain call, elsewhere it is never deleted and a fragment containing one is only spliced in place of a final call.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O1
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        changed = False
+        for func in module_functions(smt_module):
+            for _ in range(10000):  # Prevents inf loops
+                if not self._merge_round(func, config):
+                    break
+                changed = True
+            else:
+                config.logger.warn(f"SMT: {type(self).__name__}: Over 10000 rounds on function `{func.id}`, infinite loop probable, Ending")
+        return changed
+
+    def _merge_round(self, func: SmtFunc, config: Config) -> bool:
+        """Apply every rewrite that doesn't overlap another made this round, returns True if anything changed"""
+        changed = False
+        if (pruned := prune_unreachable(func)) >= 1:
+            config.logger.very_verbose(f"SMT: {type(self).__name__}: Deleting {pruned} unreachable fragment(s) from `{func.id}`")
+            changed = True
+        graph = FragGraph(func)
+        for frag in graph.reachable:
+            if len(frag.body) >= 1 and isinstance(frag.body[-1], SmtConditionalInvokeFuncCmd) and frag.body[-1].returning:
+                frag.body[-1].returning = False  # Nothing follows the call for it to skip
+                changed = True
+
+        touched: Set[SmtFragment] = set()  # Fragments whose body (and so call site indices) changed or that were removed this round
+        for frag in graph.reachable:
+            if frag is func.func_frag or frag in touched:
+                continue
+            sites = graph.get_call_sites(frag)
+            if any(site.caller in touched or site.caller is frag for site in sites):
+                continue
+            target = self._trampoline_target(func, frag)
+            if len(frag.body) == 0 and not any(site.cmd.returning for site in sites):
+                self._delete_calls(sites)
+            elif target is not None:
+                for site in sites:
+                    site.caller.body[site.index] = SmtConditionalInvokeFuncCmd(site.cmd.conditions, func, target, site.cmd.executor, returning=site.cmd.returning)
+            elif len(sites) == 1 and sites[0].unconditional and sites[0].cmd.returning:
+                sites[0].caller.body[sites[0].index:] = frag.body  # Nothing after the call could run
+                frag.body = []
+            elif len(sites) == 1 and sites[0].unconditional and (sites[0].index == len(sites[0].caller.body) - 1 or not self._has_returning_call(frag)):
+                sites[0].caller.body[sites[0].index:sites[0].index + 1] = frag.body
+                frag.body = []
+            else:
+                continue
+            touched.add(frag)
+            touched.update(site.caller for site in sites)
+            changed = True
+        return changed
+
+    @staticmethod
+    def _delete_calls(sites: List[FragCallSite]) -> None:
+        for site in sorted(sites, key=lambda site: site.index, reverse=True):
+            del site.caller.body[site.index]
+
+    @staticmethod
+    def _has_returning_call(frag: SmtFragment) -> bool:
+        return any(isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.returning for cmd in frag.body)
+
+    @staticmethod
+    def _trampoline_target(func: SmtFunc, frag: SmtFragment) -> Optional[SmtFragment]:
+        if len(frag.body) != 1:
+            return None
+        cmd = frag.body[0]
+        if not isinstance(cmd, SmtConditionalInvokeFuncCmd) or cmd.target_func is not func or cmd.ext_frag is frag:
+            return None
+        if not FragCallSite(frag, 0, cmd).unconditional:
+            return None
+        if len(cmd.ext_frag.body) == 1 and isinstance(cmd.ext_frag.body[0], SmtConditionalInvokeFuncCmd) and cmd.ext_frag.body[0].ext_frag is frag:
+            return None  # Two fragments only calling each other, forwarding would just swap them forever
+        return cmd.ext_frag
+
+
+class FuseComparisons(SmtOptimisation):
+    """Test comparisons directly in the conditions that read them rather than storing their result to a temporary first
+
+    e.g. `if x >= 5` becomes `execute if score x obj matches 5.. run function ...`.  As the comparison is then re-evaluated by every
+    condition that used it, it is only fused if all of its reads are conditions later in the same fragment and nothing that may run in
+    between can change its operands.  Code that can change them is allowed only if the read also requires a flag to be false that the code
+    is guaranteed to leave true (e.g. an if statement's branch-taken flag), as then the read fails whatever the comparison's value.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        summary = WriteSummary(smt_module)
+        changed = False
+        for func in module_functions(smt_module):
+            refs: Dict[SmtVar, List[Tuple[SmtFragment, int]]] = {}
+            for frag in function_fragments(func):
+                for index, cmd in enumerate(frag.body):
+                    for var in cmd_reads(cmd):
+                        refs.setdefault(var, []).append((frag, index))
+            for frag in function_fragments(func):
+                fused: Set[int] = set()
+                for index, cmd in enumerate(frag.body):
+                    predicate = self._as_predicate(cmd)
+                    if predicate is None or not isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtCompEqualityCmd)):
+                        continue
+                    uses = [use_index for use_frag, use_index in refs.get(cmd.out, []) if use_frag is frag and use_index != index]
+                    if len(uses) != len(refs.get(cmd.out, [])) - 1 or not self._can_fuse(func, frag, index, cmd.out, predicate, uses, summary):
+                        continue
+                    for use_index in uses:
+                        use = frag.body[use_index]
+                        if isinstance(use, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+                            use.conditions = [(predicate if atom is cmd.out else atom, expected) for atom, expected in use.conditions]
+                    fused.add(index)
+                if len(fused) >= 1:
+                    config.logger.very_verbose(f"SMT: {type(self).__name__}: Fusing {len(fused)} comparison(s) into conditions in `{func.id}`")
+                    frag.body = [cmd for index, cmd in enumerate(frag.body) if index not in fused]
+                    changed = True
+        return changed
+
+    @staticmethod
+    def _as_predicate(cmd: SmtCmd) -> Optional[SmtCompPredicate]:
+        op: SmtCompPredicate.Op
+        if isinstance(cmd, SmtCompGTECmd):
+            op = SmtCompPredicate.Op.GTE
+        elif isinstance(cmd, SmtCompGTCmd):
+            op = SmtCompPredicate.Op.GT
+        elif isinstance(cmd, SmtCompEqualityCmd):
+            op = SmtCompPredicate.Op.EQ
+        else:
+            return None
+        if not isinstance(cmd.out, SmtPseudoVar):
+            return None  # Public variables may be read outside of the function
+        for atom in (cmd.lhs, cmd.rhs):
+            atom_type = atom.get_type()
+            if not isinstance(atom, (SmtConstInt, SmtVar)) or not isinstance(atom_type, InertType) or not atom_type.is_intable():
+                return None  # Only non-null ints & bools are plain scores
+        if isinstance(cmd.lhs, SmtConstInt) and isinstance(cmd.rhs, SmtConstInt):
+            return None
+        return SmtCompPredicate(cmd.lhs, op, cmd.rhs)  # type: ignore  # Atom types checked above
+
+    def _can_fuse(
+                self, func: SmtFunc, frag: SmtFragment, index: int, out: SmtVar, predicate: SmtCompPredicate, uses: List[int], summary: WriteSummary
+            ) -> bool:
+        if len(uses) == 0:
+            return False
+        operands = set(predicate.get_vars())
+        for use_index in uses:
+            use = frag.body[use_index]
+            if use_index <= index or not isinstance(use, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+                return False
+            if isinstance(use, SmtConditionalInvokeFuncCmd) and use.executor is out:
+                return False
+            for between in range(index + 1, use_index):
+                writes = summary.cmd_writes(frag.body[between])
+                if (writes is None or not operands.isdisjoint(writes)) and not self._guarded(func, frag, between, use_index, summary):
+                    return False
+        return True
+
+    @staticmethod
+    def _guarded(func: SmtFunc, frag: SmtFragment, writer_index: int, use_index: int, summary: WriteSummary) -> bool:
+        """True if the use cannot pass if the writer ran, as the writer always leaves a variable the use requires to be false true"""
+        writer = frag.body[writer_index]
+        use = frag.body[use_index]
+        if not isinstance(writer, SmtConditionalInvokeFuncCmd) or writer.target_func is not func:
+            return False
+        if not isinstance(use, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+            return False
+        for atom, expected in use.conditions:
+            if expected is False and isinstance(atom, SmtVar) and ends_setting_true(func, writer.ext_frag, atom, summary):
+                if all(FuseComparisons._keeps_true(func, cmd, atom, summary) for cmd in frag.body[writer_index + 1:use_index]):
+                    return True
+        return False
+
+    @staticmethod
+    def _keeps_true(func: SmtFunc, cmd: SmtCmd, var: SmtVar, summary: WriteSummary) -> bool:
+        """True if `var` will still be true after running `cmd` if it was true before"""
+        writes = summary.cmd_writes(cmd)
+        if writes is not None and var not in writes:
+            return True
+        return isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.target_func is func and ends_setting_true(func, cmd.ext_frag, var, summary)
+
+
+class SharePseudoVarStorage(SmtOptimisation):
+    """Let pseudo variables (temporaries) whose values are never needed at the same time share a scoreboard player
+
+    Two variables interfere if one is written while the other is live, or by a command that also reads or writes the other (as commands
+    may write their outputs before they finish reading their inputs).  Non-interfering variables are then greedily given the same storage.
+    Only temporaries local to their function, and not live on entry to it, share storage.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def is_final(self) -> bool:
+        return True
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        changed = False
+        for func, candidates in local_temporaries(smt_module).items():
+            liveness = FuncLiveness.of(func, candidates)
+            if liveness is None:
+                continue
+            interference = self._interference(liveness)
+            storage: List[Tuple[SmtPseudoVar, Set[SmtVar]]] = []  # (var owning the storage, all vars using it)
+            shared = 0
+            for var in sorted(candidates - liveness.live_in(func.func_frag), key=lambda var: var.value if isinstance(var, SmtPseudoVar) else -1):
+                if not isinstance(var, SmtPseudoVar):
+                    continue
+                for storage_var, users in storage:
+                    if users.isdisjoint(interference.get(var, set())):
+                        func.share_pseudo_var_storage(var, storage_var)
+                        users.add(var)
+                        shared += 1
+                        break
+                else:
+                    storage.append((var, {var}))
+            if shared >= 1:
+                config.logger.very_verbose(f"SMT: {type(self).__name__}: {shared} pseudo variable(s) of `{func.id}` share storage with another")
+                changed = True
+        return changed
+
+    @staticmethod
+    def _interference(liveness: FuncLiveness) -> Dict[SmtVar, Set[SmtVar]]:
+        interference: Dict[SmtVar, Set[SmtVar]] = {}
+        for frag in function_fragments(liveness.func):
+            for cmd, live in zip(frag.body, liveness.live_after(frag)):
+                cmd_writes = liveness.cmd_writes(cmd)
+                clobbered = live | liveness.cmd_reads(cmd)
+                if not isinstance(cmd, SmtConditionalInvokeFuncCmd):
+                    clobbered |= cmd_writes  # e.g. the registers of an equality are all needed at once
+                for written in cmd_writes:
+                    for other in clobbered:
+                        if other is not written:
+                            interference.setdefault(written, set()).add(other)
+                            interference.setdefault(other, set()).add(written)
+        return interference
+
+
+# Commands (by exact type) that only read & write the variables held in the named attributes, with no other effects
+_PURE_READ_ATTRS: Dict[type, Tuple[str, ...]] = {
+    SmtAssignCmd: ("value", ),
+    SmtSpecialStackIncTargetAssignCmd: ("value", ),
+    SmtPlusCmd: ("value", ),
+    SmtMinusCmd: ("value", ),
+    SmtMultCmd: ("value", ),
+    SmtDivCmd: ("value", ),
+    SmtModCmd: ("value", ),
+    SmtCompGTECmd: ("lhs", "rhs"),
+    SmtCompGTCmd: ("lhs", "rhs"),
+    SmtCompEqualityCmd: ("lhs", "rhs"),
+    SmtAndCmd: ("lhs", "rhs"),
+    SmtOrCmd: ("lhs", "rhs"),
+    SmtNotCmd: ("inp", ),
+}
+_PURE_WRITE_ATTRS: Dict[type, Tuple[str, ...]] = {
+    SmtAssignCmd: ("target_var", ),
+    SmtSpecialStackIncSourceAssignCmd: ("target_var", ),
+    SmtPlusCmd: ("target_var", ),
+    SmtMinusCmd: ("target_var", ),
+    SmtMultCmd: ("target_var", ),
+    SmtDivCmd: ("target_var", ),
+    SmtModCmd: ("target_var", ),
+    SmtCompGTECmd: ("out", ),
+    SmtCompGTCmd: ("out", ),
+    SmtCompEqualityCmd: ("out", "value_reg", "null_reg1", "null_reg2", "null_out_reg"),
+    SmtAndCmd: ("out", ),
+    SmtOrCmd: ("out", ),
+    SmtNotCmd: ("out_var", ),
+}
+
+
+def _is_scoreboard_var(atom: object) -> bool:
+    if not isinstance(atom, SmtVar):
+        return False
+    atom_type = atom.get_type()
+    return isinstance(atom_type, InertType) and atom_type.is_intable()
+
+
+def _substitute_reads(cmd: SmtCmd, old: SmtVar, new: SmtVar) -> bool:
+    """Make `cmd` read `new` wherever it reads `old` (the read positions of pure & conditional commands only).  True if `cmd` changed"""
+    changed = False
+    if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+        conditions: List[Tuple[Union[SmtConstInt, SmtVar, SmtCompPredicate], bool]] = []
+        for atom, expected in cmd.conditions:
+            if atom is old:
+                atom = new
+                changed = True
+            elif isinstance(atom, SmtCompPredicate) and old in atom.get_vars():
+                atom = SmtCompPredicate(new if atom.lhs is old else atom.lhs, atom.op, new if atom.rhs is old else atom.rhs)
+                changed = True
+            conditions.append((atom, expected))
+        cmd.conditions = conditions
+    for attr in _PURE_READ_ATTRS.get(type(cmd), ()):
+        if getattr(cmd, attr) is old:
+            setattr(cmd, attr, new)
+            changed = True
+    return changed
+
+
+def _rename(cmd: SmtCmd, old: SmtVar, new: SmtVar) -> None:
+    """Replace every use of `old` by the pure command `cmd` with `new`"""
+    for attr in _PURE_READ_ATTRS.get(type(cmd), ()) + _PURE_WRITE_ATTRS.get(type(cmd), ()):
+        if getattr(cmd, attr) is old:
+            setattr(cmd, attr, new)
+
+
+class PropagateCopies(SmtOptimisation):
+    """Remove the copies expression lowering makes between temporaries and the variables they are stored to
+
+    Forwards: after `tmp = x` later reads of `tmp` in the same fragment read `x` directly, until either may be written.  Backwards: for
+    `x = tmp` where `tmp` is not read again, the commands computing `tmp` compute straight into `x` instead (e.g. `tmp = x; tmp += 1; x = tmp`
+    becomes `x += 1`), provided nothing in between can observe `x`.  Raw & library commands and calls are never rewritten or moved across
+    when they could read or write either variable, stores made dead are left to `EliminateDeadStores`.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        summary = WriteSummary(smt_module)
+        changed = False
+        for func, candidates in local_temporaries(smt_module).items():
+            forwarded = 0
+            for frag in function_fragments(func):
+                for index, cmd in enumerate(frag.body):
+                    if type(cmd) is SmtAssignCmd and cmd.target_var in candidates and _is_scoreboard_var(cmd.value) and cmd.value is not cmd.target_var:
+                        forwarded += self._forward(frag, index, cmd.target_var, cmd.value, summary)  # type: ignore  # value checked above
+            coalesced = 0
+            liveness = FuncLiveness.of(func, candidates)
+            for frag in (function_fragments(func) if liveness is not None else []):
+                live_after = liveness.live_after(frag)
+                index = len(frag.body) - 1
+                while index >= 0:
+                    if self._coalesce(frag, index, candidates, live_after[index]):
+                        coalesced += 1
+                        # The source is only live between its definition & the copy, both in this fragment & with no call between them, so
+                        # liveness on entry to & exit from every fragment is unchanged & only this fragment's commands need visiting again
+                        live_after = liveness.live_after(frag)
+                    index = min(index, len(frag.body)) - 1
+            if forwarded + coalesced >= 1:
+                config.logger.very_verbose(f"SMT: {type(self).__name__}: Forwarded {forwarded} & coalesced {coalesced} copies in `{func.id}`")
+                changed = True
+        return changed
+
+    @staticmethod
+    def _forward(frag: SmtFragment, index: int, tmp: SmtVar, source: SmtVar, summary: WriteSummary) -> int:
+        forwarded = 0
+        for cmd in frag.body[index + 1:]:
+            writes = summary.cmd_writes(cmd)
+            if writes is not None and source in writes and tmp not in writes and not isinstance(cmd, SmtConditionalInvokeFuncCmd):
+                return forwarded  # Cannot substitute into a command that may write the source after reading it
+            if _substitute_reads(cmd, tmp, source):
+                forwarded += 1
+            if writes is None or tmp in writes or source in writes:
+                return forwarded
+        return forwarded
+
+    @staticmethod
+    def _coalesce(frag: SmtFragment, index: int, candidates: Set[SmtVar], live_after: Set[SmtVar]) -> bool:
+        copy = frag.body[index]
+        if type(copy) is not SmtAssignCmd or not isinstance(copy.value, SmtVar) or copy.value not in candidates or copy.value in live_after:
+            return False
+        src: SmtVar = copy.value
+        dst: SmtVar = copy.target_var
+        if dst is src or not _is_scoreboard_var(dst):
+            return False
+        for def_index in range(index - 1, -1, -1):
+            cmd = frag.body[def_index]
+            refs = cmd_reads(cmd)
+            if isinstance(cmd, SmtCommentCmd):
+                continue
+            if type(cmd) not in _PURE_WRITE_ATTRS.keys():
+                if src in refs or dst in refs or direct_writes(cmd) is None or isinstance(cmd, (SmtInvokeFuncCmd, SmtConditionalInvokeFuncCmd)):
+                    return False  # Only pure commands can be rewritten or moved across (calls may observe `dst`)
+                continue
+            if src in definite_writes(cmd):
+                if dst in refs and not isinstance(cmd, SmtAssignCmd):
+                    return False  # The output may be written before inputs are read so cannot become an input
+                if isinstance(cmd, SmtCompEqualityCmd) and cmd.out is not src:
+                    return False  # Registers must stay temporaries
+                break
+            if dst in refs:
+                return False
+        else:
+            return False  # `src` is never defined in this fragment
+        for cmd in frag.body[def_index:index]:
+            _rename(cmd, src, dst)
+        definition = frag.body[def_index]
+        drop = {index}
+        if type(definition) is SmtAssignCmd and definition.value is definition.target_var:
+            drop.add(def_index)
+        frag.body = [cmd for cmd_index, cmd in enumerate(frag.body) if cmd_index not in drop]
+        return True
+
+
+class EliminateDeadStores(SmtOptimisation):
+    """Remove pure commands (assignments, arithmetic, comparisons & logic) whose results are never read
+
+    A store to any variable is removed if a later command of the same fragment overwrites it with only pure commands that do not read
+    it in between.  Other stores are only removed if they are to temporaries local to their function and the whole function's liveness
+    is known.  Copies of a variable to itself are always removed."""
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        changed = False
+        for func, candidates in local_temporaries(smt_module).items():
+            liveness = FuncLiveness.of(func, candidates)
+            removed = 0
+            for frag in function_fragments(func):
+                live_after = liveness.live_after(frag) if liveness is not None else [set() for _ in frag.body]
+                kept: List[SmtCmd] = []
+                for index, (cmd, live) in enumerate(zip(frag.body, live_after)):
+                    if self._is_dead(cmd, live, candidates if liveness is not None else set()) or self._is_overwritten(frag, index):
+                        removed += 1
+                    else:
+                        kept.append(cmd)
+                frag.body = kept
+            if removed >= 1:
+                config.logger.very_verbose(f"SMT: {type(self).__name__}: Removed {removed} dead store(s) from `{func.id}`")
+                changed = True
+        return changed
+
+    @staticmethod
+    def _is_dead(cmd: SmtCmd, live_after: Set[SmtVar], removable: Set[SmtVar]) -> bool:
+        if type(cmd) is SmtAssignCmd and cmd.value is cmd.target_var:
+            return True
+        if type(cmd) not in _PURE_WRITE_ATTRS.keys():
+            return False
+        writes = direct_writes(cmd)
+        return writes is not None and writes <= removable and writes.isdisjoint(live_after)
+
+    @staticmethod
+    def _is_overwritten(frag: SmtFragment, index: int) -> bool:
+        cmd = frag.body[index]
+        writes = direct_writes(cmd)
+        if type(cmd) not in _PURE_WRITE_ATTRS.keys() or writes is None or len(writes) != 1:
+            return False
+        written = next(iter(writes))
+        for later in frag.body[index + 1:]:
+            if isinstance(later, SmtCommentCmd):
+                continue
+            if type(later) not in _PURE_WRITE_ATTRS.keys() or written in direct_reads(later):
+                return False  # Anything else (e.g. calls & raw commands) could read it
+            if written in definite_writes(later):
+                return True
+        return False
+
+
+_INT_MIN: int = -2**31
+
+
+def _wrap_int(value: int) -> int:
+    """Wrap `value` to a signed 32 bit integer as scoreboard arithmetic does"""
+    return ((value - _INT_MIN) % 2**32) + _INT_MIN
+
+
+class PropagateConstants(SmtOptimisation):
+    """Track the variables whose values are known at each point and fold the commands that use them
+
+    Values are followed through each fragment and into the fragments of the same function it calls (a fragment starts with the values
+    that agree at every call to it).  Arithmetic is folded as scoreboards do it (32 bit wrapping, floor division & modulo, division by zero
+    ignored).  Calls forget every value the called code may write and raw commands forget everything, calls run by entities (which
+    may run many times) start knowing nothing.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        summary = WriteSummary(smt_module)
+        external_frags: Set[SmtFragment] = set()  # Fragments called in a way they cannot be given any known values
+        for func in module_functions(smt_module):
+            for frag in function_fragments(func):
+                for cmd in frag.body:
+                    if isinstance(cmd, SmtConditionalInvokeFuncCmd) and (cmd.target_func is not func or not isinstance(cmd.executor, SmtWorld)):
+                        external_frags.add(cmd.ext_frag)
+                    elif isinstance(cmd, SmtScheduleFragCmd):
+                        external_frags.add(cmd.ext_frag)
+        changed = False
+        for func in module_functions(smt_module):
+            entry_values = self._entry_values(func, external_frags, summary)
+            folded = 0
+            for frag in function_fragments(func):
+                values = dict(entry_values.get(frag) or {})
+                for index, cmd in enumerate(frag.body):
+                    new_cmd = self._fold(cmd, values)
+                    if new_cmd is not cmd:
+                        frag.body[index] = new_cmd
+                        folded += 1
+                    self._update(new_cmd, values, summary)
+            if folded >= 1:
+                config.logger.very_verbose(f"SMT: {type(self).__name__}: Folded {folded} command(s) using known values in `{func.id}`")
+                changed = True
+        return changed
+
+    def _entry_values(self, func: SmtFunc, external_frags: Set[SmtFragment], summary: WriteSummary) -> Dict[SmtFragment, Optional[Dict[SmtVar, int]]]:
+        """Find the values known on entry to each fragment of `func`, None if a fragment is never called"""
+        entry_values: Dict[SmtFragment, Optional[Dict[SmtVar, int]]] = {frag: None for frag in func.fragments}
+        entry_values[func.func_frag] = {}
+        for frag in external_frags:
+            if frag in entry_values.keys():
+                entry_values[frag] = {}
+        worklist: List[SmtFragment] = [frag for frag, values in entry_values.items() if values is not None]
+        while len(worklist) >= 1:  # Known values only ever shrink so this will terminate
+            frag = worklist.pop()
+            values = dict(entry_values[frag] or {})
+            for cmd in frag.body:
+                cmd = self._fold(cmd, values)
+                if isinstance(cmd, SmtConditionalInvokeFuncCmd) and cmd.target_func is func and cmd.ext_frag in entry_values.keys():
+                    if constant_condition(cmd.conditions) is not False:
+                        callee_values = entry_values[cmd.ext_frag]
+                        new_values = dict(values) if callee_values is None else {var: val for var, val in callee_values.items() if values.get(var) == val}
+                        if new_values != callee_values:
+                            entry_values[cmd.ext_frag] = new_values
+                            worklist.append(cmd.ext_frag)
+                self._update(cmd, values, summary)
+        return entry_values
+
+    @staticmethod
+    def _update(cmd: SmtCmd, values: Dict[SmtVar, int], summary: WriteSummary) -> None:
+        """Update the known values to those after running `cmd` (which is already folded)"""
+        if type(cmd) is SmtAssignCmd and isinstance(cmd.value, SmtConstInt) and _is_scoreboard_var(cmd.target_var):
+            values[cmd.target_var] = _wrap_int(cmd.value.value)
+            return
+        writes = summary.cmd_writes(cmd)
+        if writes is None:
+            values.clear()
+            return
+        for var in writes:
+            values.pop(var, None)
+
+    def _fold(self, cmd: SmtCmd, values: Dict[SmtVar, int]) -> SmtCmd:
+        """Get a copy of `cmd` rewritten to use the known values, `cmd` itself if it cannot be changed"""
+        def known(atom: object) -> Optional[int]:
+            if isinstance(atom, SmtConstInt):
+                return atom.value
+            elif isinstance(atom, SmtVar) and _is_scoreboard_var(atom):
+                return values.get(atom)
+            return None
+
+        if isinstance(cmd, (SmtConditionalInvokeFuncCmd, SmtConditionalRawCmd)):
+            conditions = [(self._fold_condition(atom, known), expected) for atom, expected in cmd.conditions]
+            if any(new is not old for (new, _), (old, _) in zip(conditions, cmd.conditions)):
+                new_cond_cmd = copy.copy(cmd)
+                new_cond_cmd.conditions = conditions
+                return new_cond_cmd
+        elif type(cmd) in (SmtAssignCmd, SmtSpecialStackIncTargetAssignCmd):
+            value = known(cmd.value)
+            if isinstance(cmd.value, SmtVar) and value is not None:
+                return type(cmd)(cmd.target_var, SmtConstInt(value))
+        elif isinstance(cmd, (SmtPlusCmd, SmtMinusCmd, SmtMultCmd, SmtDivCmd, SmtModCmd)):
+            target, value = known(cmd.target_var), known(cmd.value)
+            if not _is_scoreboard_var(cmd.target_var) or value is None:
+                return cmd
+            elif target is not None:
+                return SmtAssignCmd(cmd.target_var, SmtConstInt(self._fold_arithmetic(cmd, target, value)))
+            elif isinstance(cmd, (SmtPlusCmd, SmtMinusCmd)) and value < 0 and value != _INT_MIN:
+                return (SmtMinusCmd if isinstance(cmd, SmtPlusCmd) else SmtPlusCmd)(cmd.target_var, SmtConstInt(-value))  # Cannot add negatives
+            elif isinstance(cmd.value, SmtVar):
+                return type(cmd)(cmd.target_var, SmtConstInt(value))
+        elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtCompEqualityCmd, SmtAndCmd, SmtOrCmd)):
+            if not all(_is_scoreboard_var(atom) or isinstance(atom, SmtConstInt) for atom in (cmd.lhs, cmd.rhs)):
+                return cmd  # e.g. nullable or entity comparisons
+            lhs, rhs = known(cmd.lhs), known(cmd.rhs)
+            if lhs is not None and rhs is not None:
+                return SmtAssignCmd(cmd.out, SmtConstInt(self._fold_binary(cmd, lhs, rhs)))
+            elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtCompEqualityCmd)) and (lhs is not None and isinstance(cmd.lhs, SmtVar)):
+                new_cmd = copy.copy(cmd)
+                new_cmd.lhs = SmtConstInt(lhs)
+                return new_cmd
+            elif isinstance(cmd, (SmtCompGTECmd, SmtCompGTCmd, SmtCompEqualityCmd)) and (rhs is not None and isinstance(cmd.rhs, SmtVar)):
+                new_cmd = copy.copy(cmd)
+                new_cmd.rhs = SmtConstInt(rhs)
+                return new_cmd
+        elif type(cmd) is SmtNotCmd:
+            inp = known(cmd.inp)
+            if isinstance(cmd.inp, SmtVar) and inp is not None:
+                return SmtAssignCmd(cmd.out_var, SmtConstInt(0 if inp >= 1 else 1))
+        return cmd
+
+    @staticmethod
+    def _fold_condition(
+                atom: Union[SmtConstInt, SmtVar, SmtCompPredicate], known: Callable[[object], Optional[int]]
+            ) -> Union[SmtConstInt, SmtVar, SmtCompPredicate]:
+        if isinstance(atom, SmtCompPredicate):
+            lhs, rhs = known(atom.lhs), known(atom.rhs)
+            if lhs is None or rhs is None:
+                return atom
+            return SmtConstInt(int({SmtCompPredicate.Op.GTE: lhs >= rhs, SmtCompPredicate.Op.GT: lhs > rhs, SmtCompPredicate.Op.EQ: lhs == rhs}[atom.op]))
+        value = known(atom)
+        if isinstance(atom, SmtVar) and value is not None:
+            return SmtConstInt(1 if value >= 1 else 0)  # Conditions test variables for being at least 1
+        return atom
+
+    @staticmethod
+    def _fold_arithmetic(cmd: SmtCmd, target: int, value: int) -> int:
+        if isinstance(cmd, SmtPlusCmd):
+            return _wrap_int(target + value)
+        elif isinstance(cmd, SmtMinusCmd):
+            return _wrap_int(target - value)
+        elif isinstance(cmd, SmtMultCmd):
+            return _wrap_int(target * value)
+        elif value == 0:
+            return target  # Scoreboard division & modulo by zero leave the target unchanged
+        elif isinstance(cmd, SmtDivCmd):
+            return _wrap_int(target // value)
+        else:
+            return _wrap_int(target % value)
+
+    @staticmethod
+    def _fold_binary(cmd: SmtCmd, lhs: int, rhs: int) -> int:
+        if isinstance(cmd, SmtCompGTECmd):
+            return int(lhs >= rhs)
+        elif isinstance(cmd, SmtCompGTCmd):
+            return int(lhs > rhs)
+        elif isinstance(cmd, SmtCompEqualityCmd):
+            return int(lhs == rhs)
+        elif isinstance(cmd, SmtAndCmd):
+            return int(lhs >= 1 and rhs >= 1)
+        else:
+            return int(lhs >= 1 or rhs >= 1)
+
+
+class HoistLoopInvariants(SmtOptimisation):
+    """Compute temporaries that hold the same value on every iteration of a loop once, before the loop starts
+
+    A loop is the condition fragment of a while/for loop and every fragment it (transitively) calls, other than the code following the
+    loop (which only runs once the loop has finished).  A run of pure commands in the loop is moved before the call that starts the
+    loop if it only writes temporaries that nothing else writes and that are not read before being written on entering the loop, and
+    if nothing in the loop can write the variables it reads.  As pure commands never fail it does not matter if the loop body would
+    not have run.  Entity selections are not moved as most library commands can change which entities they would find.
+    """
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O2
+
+    def optimize(self, smt_module: SmtModule, config: Config) -> bool:
+        summary = WriteSummary(smt_module)
+        changed = False
+        for func, candidates in local_temporaries(smt_module).items():
+            liveness = FuncLiveness.of(func, candidates)
+            if liveness is None:
+                continue
+            # Hoisting only moves pure commands so the calls between fragments, and so each loop's region & entry, never change
+            frag_graph = FragGraph(func)
+            loops: List[Tuple[SmtFragment, Set[SmtFragment], FragCallSite]] = []
+            for header in function_fragments(func):
+                if len(header.route) == 0 or header.route[-1].flavour != RoutingFlavour.COND:
+                    continue
+                region = self._loop_region(func, header)
+                outside_sites = [site for site in frag_graph.get_call_sites(header) if site.caller not in region]
+                if len(outside_sites) == 1 and outside_sites[0].unconditional and isinstance(outside_sites[0].cmd.executor, SmtWorld):
+                    loops.append((header, region, outside_sites[0]))
+            hoisted = 0
+            while liveness is not None:
+                # Hoisting a block can let another be hoisted (e.g. out of an enclosing loop) so sweep again until nothing moves
+                writers: Dict[SmtVar, List[Tuple[SmtFragment, SmtCmd]]] = {}
+                for frag in function_fragments(func):
+                    for cmd in frag.body:
+                        for var in direct_writes(cmd) or set():
+                            writers.setdefault(var, []).append((frag, cmd))
+                swept = sum(self._hoist_all(header, region, preheader, candidates, liveness, writers, summary) for header, region, preheader in loops)
+                if swept == 0:
+                    break
+                hoisted += swept
+                liveness = FuncLiveness.of(func, candidates)
+            if hoisted >= 1:
+                config.logger.very_verbose(f"SMT: {type(self).__name__}: Hoisted {hoisted} loop invariant computation(s) out of loops in `{func.id}`")
+                changed = True
+        return changed
+
+    def _hoist_all(
+                self, header: SmtFragment, region: Set[SmtFragment], preheader: FragCallSite, candidates: Set[SmtVar], liveness: FuncLiveness,
+                writers: Dict[SmtVar, List[Tuple[SmtFragment, SmtCmd]]], summary: WriteSummary
+            ) -> int:
+        """Hoist every invariant block of the loop starting at `header` before its `preheader` call, returns the number of blocks hoisted
+
+        `liveness` & `writers` may predate blocks hoisted earlier in the sweep.  Hoisting only removes writes from loops & moves reads to
+        before them, so the checks stay sound; blocks whose writers have moved are skipped until the next sweep."""
+        region_writes: Set[SmtVar] = set()
+        for frag in region:
+            for cmd in frag.body:
+                writes = summary.cmd_writes(cmd)
+                if writes is None:
+                    return 0
+                region_writes |= writes
+        hoisted = 0
+        for frag in region:
+            positions: Dict[int, int] = {id(cmd): index for index, cmd in enumerate(frag.body)}
+            index = 0
+            while index < len(frag.body):
+                block = self._invariant_block(frag, index, candidates, writers, positions)
+                if block is None:
+                    index += 1
+                    continue
+                lo, hi = block
+                written: Set[SmtVar] = set()
+                exposed: Set[SmtVar] = set()
+                for cmd in reversed(frag.body[lo:hi + 1]):
+                    written |= direct_writes(cmd) or set()
+                    exposed = (exposed - definite_writes(cmd)) | direct_reads(cmd)
+                if not written.isdisjoint(liveness.live_in(header)) or not written.isdisjoint(exposed) or not exposed.isdisjoint(region_writes):
+                    index += 1
+                    continue
+                cmds = frag.body[lo:hi + 1]
+                del frag.body[lo:hi + 1]
+                call_index = next(call_index for call_index, cmd in enumerate(preheader.caller.body) if cmd is preheader.cmd)
+                preheader.caller.body[call_index:call_index] = cmds
+                positions = {id(cmd): index for index, cmd in enumerate(frag.body)}
+                hoisted += 1
+                index = lo
+        return hoisted
+
+    @staticmethod
+    def _loop_region(func: SmtFunc, header: SmtFragment) -> Set[SmtFragment]:
+        """Get the fragments that may run between the iterations of the loop starting at `header`"""
+        region: Set[SmtFragment] = {header}
+        worklist: List[SmtFragment] = [header]
+        while len(worklist) >= 1:
+            frag = worklist.pop()
+            for cmd in frag.body:
+                if not isinstance(cmd, SmtConditionalInvokeFuncCmd) or cmd.target_func is not func or cmd.ext_frag in region:
+                    continue
+                if frag is header and len(cmd.ext_frag.route) >= 1 and cmd.ext_frag.route[-1].flavour == RoutingFlavour.TOP:
+                    continue  # The loop exit, the loop never continues once this has been called
+                region.add(cmd.ext_frag)
+                worklist.append(cmd.ext_frag)
+        return region
+
+    @staticmethod
+    def _invariant_block(
+                frag: SmtFragment, index: int, candidates: Set[SmtVar], writers: Dict[SmtVar, List[Tuple[SmtFragment, SmtCmd]]], positions: Dict[int, int]
+            ) -> Optional[Tuple[int, int]]:
+        """Get the smallest run of pure commands around `index` that includes every write to the temporaries the run writes"""
+        lo = hi = index
+        while True:
+            new_lo, new_hi = lo, hi
+            for cmd in frag.body[lo:hi + 1]:
+                if type(cmd) not in _PURE_WRITE_ATTRS.keys() or type(cmd) is SmtSpecialStackIncSourceAssignCmd:
+                    return None
+                for var in direct_writes(cmd) or set():
+                    if var not in candidates:
+                        return None
+                    for writer_frag, writer in writers.get(var, []):
+                        writer_index = positions.get(id(writer))
+                        if writer_frag is not frag or writer_index is None:
+                            return None  # Written elsewhere (or moved since `writers` was found)
+                        new_lo, new_hi = min(new_lo, writer_index), max(new_hi, writer_index)
+            if (new_lo, new_hi) == (lo, hi):
+                return lo, hi
+            lo, hi = new_lo, new_hi
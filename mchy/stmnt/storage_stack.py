@@ -0,0 +1,84 @@
+from typing import Dict, List, Set, Tuple
+from mchy.common.com_types import ExecCoreTypes, ExecType
+from mchy.common.config import Config
+from mchy.errors import ConversionError, StatementRepError
+from mchy.stmnt.analysis import FuncLiveness, function_fragments
+from mchy.stmnt.call_graph import SmtCallGraph
+from mchy.stmnt.struct import SmtAssignCmd, SmtCmd, SmtMchyFunc, SmtModule
+from mchy.stmnt.struct.atoms import SmtPseudoVar, SmtVar, SmtWorld
+from mchy.stmnt.struct.cmds import SmtInvokeFuncCmd, SmtPopFrameCmd, SmtPushFrameCmd, SmtSpecialStackIncTargetAssignCmd
+from mchy.stmnt.struct.cmds.tag_ops import SmtRawEntitySelector
+from mchy.stmnt.struct.smt_frag import SmtFragment
+
+
+def insert_frame_saves(smt_module: SmtModule, config: Config) -> None:
+    """Save the caller's variables to the storage stack around every recursive call
+
+    With the storage stack every function has a single set of variables shared by all of its active calls.  A call can only overwrite
+    the variables of the functions it can reach, so only calls to a function in the same cycle of the call graph as the caller need
+    the caller's variables saved.  Of those only the variables still needed after the call are saved.
+    """
+    call_graph = SmtCallGraph(smt_module)
+    cycle_of: Dict[SmtMchyFunc, int] = {func: cycle_ix for cycle_ix, scc in enumerate(call_graph.get_sccs()) for func in scc}
+    for caller in smt_module.get_smt_mchy_funcs():
+        recursive_calls: List[Tuple[SmtFragment, int, SmtInvokeFuncCmd]] = []
+        for frag in function_fragments(caller):
+            for index, cmd in enumerate(frag.body):
+                if isinstance(cmd, SmtInvokeFuncCmd) and isinstance(cmd.target_func, SmtMchyFunc) and cycle_of[cmd.target_func] == cycle_of[caller]:
+                    recursive_calls.append((frag, index, cmd))
+        if len(recursive_calls) == 0:
+            continue
+        candidates: Set[SmtVar] = {
+            var for var in caller.get_all_vars() + tuple(caller.get_shared_pseudo_vars().keys()) if var != caller.return_var and not _is_world(var)
+        }
+        liveness = FuncLiveness.of(caller, candidates)
+        live_after: Dict[SmtFragment, List[Set[SmtVar]]] = {}
+        for frag, _, _ in recursive_calls:
+            if frag not in live_after.keys():
+                live_after[frag] = [candidates] * len(frag.body) if liveness is None else liveness.live_after(frag)
+        # Later calls in a fragment are handled first so the indices of earlier calls stay valid
+        for frag, index, call in reversed(recursive_calls):
+            _save_around_call(caller, frag, index, call, live_after[frag][index], config)
+
+
+def _is_world(var: SmtVar) -> bool:
+    var_type = var.get_type()
+    return isinstance(var_type, ExecType) and var_type.target == ExecCoreTypes.WORLD
+
+
+def _save_around_call(caller: SmtMchyFunc, frag: SmtFragment, index: int, call: SmtInvokeFuncCmd, live: Set[SmtVar], config: Config) -> None:
+    shared_storage: Dict[SmtPseudoVar, SmtPseudoVar] = caller.get_shared_pseudo_vars()
+    live_storage: Set[SmtVar] = {(shared_storage.get(var, var) if isinstance(var, SmtPseudoVar) else var) for var in live}
+    saved_vars: List[SmtVar] = [var for var in caller.get_all_vars() if var in live_storage and var != caller.executor_var]
+    for var in saved_vars:
+        if isinstance(var.get_type(), ExecType):
+            raise ConversionError(
+                f"The entity variable `{repr(var)}` of function `{caller.get_func_name()}` is used after a recursive call, " +
+                f"entities cannot be saved to the storage stack (compile without the storage stack or reselect the entities after the call)"
+            )
+    callee = call.target_func
+    if not isinstance(callee, SmtMchyFunc):
+        raise StatementRepError(f"Recursive call to `{callee.id}` which is not a mchy function")
+
+    # The parameters are bound just before the call, when calling itself they are the caller's own variables and so must be saved first
+    bind_start = index
+    while bind_start >= 1 and isinstance(frag.body[bind_start - 1], SmtSpecialStackIncTargetAssignCmd) and frag.body[bind_start - 1].target_var in callee.param_var_lookup.values():
+        bind_start -= 1
+    # A binding may read a parameter an earlier binding has already overwritten (e.g. `f(b, a)`), such values are copied beforehand
+    staging: List[SmtCmd] = []
+    bound: Set[SmtVar] = set()
+    for binding in frag.body[bind_start:index]:
+        if not isinstance(binding, SmtSpecialStackIncTargetAssignCmd):
+            raise StatementRepError(f"Non-binding command `{repr(binding)}` found while binding the parameters of `{callee.get_func_name()}`")
+        if isinstance(binding.value, SmtVar) and binding.value in bound:
+            holder: SmtVar = caller.new_pseudo_var(binding.value.get_type())
+            staging.append(SmtAssignCmd(holder, binding.value))
+            binding.value = holder
+        bound.add(binding.target_var)
+
+    restore: List[SmtCmd] = [SmtPopFrameCmd(saved_vars)]
+    if caller.executor_var in live and not _is_world(caller.executor_var):
+        # The executor is still `@s` after the call so can be reselected rather than saved
+        restore.append(SmtRawEntitySelector(SmtWorld(), caller.executor_var, "@s"))
+    frag.body[index + 1:index + 1] = restore
+    frag.body[bind_start:bind_start] = staging + [SmtPushFrameCmd(callee, saved_vars, config.recursion_limit)]
@@ -4,7 +4,8 @@ from mchy.stmnt.struct.cmds.cleanup import SmtCleanupTag
 from mchy.stmnt.struct.cmds.comments import SmtCommentCmd, CommentImportance
 from mchy.stmnt.struct.cmds.comparison import SmtCompGTCmd, SmtCompGTECmd
 from mchy.stmnt.struct.cmds.equality import SmtCompEqualityCmd
-from mchy.stmnt.struct.cmds.func_invoke import SmtConditionalInvokeFuncCmd, SmtInvokeFuncCmd
+from mchy.stmnt.struct.cmds.frames import SmtPopFrameCmd, SmtPushFrameCmd
+from mchy.stmnt.struct.cmds.func_invoke import SmtConditionalInvokeFuncCmd, SmtInvokeFuncCmd, SmtScheduleFragCmd
 from mchy.stmnt.struct.cmds.logic_ops import SmtAndCmd, SmtNotCmd, SmtOrCmd
 from mchy.stmnt.struct.cmds.null_coal import SmtNullCoalCmd
 from mchy.stmnt.struct.cmds.tag_ops import SmtTagMergeCmd, SmtTagRemoveCmd
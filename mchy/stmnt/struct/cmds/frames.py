@@ -0,0 +1,67 @@
+from typing import List, Sequence
+from mchy.common.com_cmd import ComCmd
+from mchy.errors import VirtualRepError
+from mchy.stmnt.struct.abs_cmd import SmtCmd
+from mchy.stmnt.struct.atoms import SmtVar
+from mchy.stmnt.struct.function import SmtMchyFunc
+from mchy.stmnt.struct.linker import SmtExecVarLinkage, SmtLinker, SmtObjVarLinkage
+
+
+class SmtPushFrameCmd(SmtCmd):
+    """Save `saved_vars` to a new frame on top of the storage stack before a recursive call to `callee`
+
+    If the stack is already `recursion_limit` frames deep the recursion limit error of `callee` is raised instead"""
+
+    def __init__(self, callee: SmtMchyFunc, saved_vars: Sequence[SmtVar], recursion_limit: int) -> None:
+        self.callee: SmtMchyFunc = callee
+        self.saved_vars: List[SmtVar] = list(saved_vars)
+        self.recursion_limit: int = recursion_limit
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(repr(var) for var in self.saved_vars)})"
+
+    def virtualize(self, linker: 'SmtLinker', stack_level: int) -> List[ComCmd]:
+        stack = linker.get_frame_stack()
+        cmds: List[ComCmd] = [
+            ComCmd(f"execute if data storage {stack}[{self.recursion_limit - 1}] run function {linker.lookup_recursion_error(self.callee)}"),
+            ComCmd(f"data modify storage {stack} append value {{}}")
+        ]
+        for var in self.saved_vars:
+            vdat = linker.lookup_var(var)
+            if isinstance(vdat, SmtObjVarLinkage):
+                cmds.append(ComCmd(
+                    f"execute store result storage {stack}[-1].{vdat.var_name} int 1 run scoreboard players get {vdat.var_name} {vdat.get_objective(stack_level)}"
+                ))
+            elif isinstance(vdat, SmtExecVarLinkage):
+                raise VirtualRepError(f"Attempted to save the tagged variable `{vdat.var_name}` to the storage stack")
+            else:
+                cmds.append(ComCmd(f"data modify storage {stack}[-1].{vdat.var_name} set from storage {vdat.ns} {vdat.get_store_path(stack_level)}.{vdat.var_name}"))
+        return cmds
+
+
+class SmtPopFrameCmd(SmtCmd):
+    """Restore `saved_vars` from the frame on top of the storage stack after a recursive call & remove that frame"""
+
+    def __init__(self, saved_vars: Sequence[SmtVar]) -> None:
+        self.saved_vars: List[SmtVar] = list(saved_vars)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(repr(var) for var in self.saved_vars)})"
+
+    def virtualize(self, linker: 'SmtLinker', stack_level: int) -> List[ComCmd]:
+        stack = linker.get_frame_stack()
+        cmds: List[ComCmd] = []
+        for var in self.saved_vars:
+            vdat = linker.lookup_var(var)
+            if isinstance(vdat, SmtObjVarLinkage):
+                cmds.append(ComCmd(
+                    f"execute store result score {vdat.var_name} {vdat.get_objective(stack_level)} run data get storage {stack}[-1].{vdat.var_name}"
+                ))
+            elif isinstance(vdat, SmtExecVarLinkage):
+                raise VirtualRepError(f"Attempted to restore the tagged variable `{vdat.var_name}` from the storage stack")
+            else:
+                # Removed first as there is nothing to copy if the variable was never set before the call
+                cmds.append(ComCmd(f"data remove storage {vdat.ns} {vdat.get_store_path(stack_level)}.{vdat.var_name}"))
+                cmds.append(ComCmd(f"data modify storage {vdat.ns} {vdat.get_store_path(stack_level)}.{vdat.var_name} set from storage {stack}[-1].{vdat.var_name}"))
+        cmds.append(ComCmd(f"data remove storage {stack}[-1]"))
+        return cmds
@@ -3,8 +3,8 @@ from typing import List, Tuple, Union
 from mchy.common.com_cmd import ComCmd
 from mchy.errors import StatementRepError
 from mchy.stmnt.helpers import smt_get_exec_vdat
-from mchy.stmnt.struct.cmds.helpers import resolve_condition_cmd
-from mchy.stmnt.struct.linker import SmtLinker, SmtVarLinkage, SmtObjVarLinkage
+from mchy.stmnt.struct.cmds.helpers import SmtCompPredicate, resolve_condition_cmd
+from mchy.stmnt.struct.linker import SmtLinker, SmtVarLinkage, SmtObjVarLinkage, SmtStackSlot, SmtStackSlotMisuse
 from mchy.stmnt.struct.abs_cmd import SmtCmd
 from mchy.stmnt.struct.atoms import SmtAtom, SmtConstInt, SmtVar, SmtWorld
 from mchy.stmnt.struct.function import SmtFunc, SmtMchyFunc
@@ -40,14 +40,19 @@ class SmtInvokeFuncCmd(SmtCmd):
 
 class SmtConditionalInvokeFuncCmd(SmtCmd):
 
-    def __init__(self, conditions: List[Tuple[Union[SmtConstInt, SmtVar], bool]], target_func: SmtFunc, ext_frag: SmtFragment, executor: SmtAtom) -> None:
+    def __init__(
+                self, conditions: List[Tuple[Union[SmtConstInt, SmtVar, SmtCompPredicate], bool]], target_func: SmtFunc, ext_frag: SmtFragment, executor: SmtAtom,
+                *, returning: bool = False
+            ) -> None:
         # conditions: A list of atoms and if they must resolve true or false for the target func/frag to be called
+        # returning: If the calling fragment returns once the call is complete (`return run`), none of the commands after it are then run
         if len(conditions) == 0:
             raise StatementRepError("ConditionalInvokeFuncCmd has no conditions attached")
-        self.conditions: List[Tuple[Union[SmtConstInt, SmtVar], bool]] = conditions
+        self.conditions: List[Tuple[Union[SmtConstInt, SmtVar, SmtCompPredicate], bool]] = conditions
         self.target_func: SmtFunc = target_func
         self.ext_frag: SmtFragment = ext_frag
         self.executor: SmtAtom = executor
+        self.returning: bool = returning
 
     @property
     def func_id(self):
@@ -56,16 +61,40 @@ class SmtConditionalInvokeFuncCmd(SmtCmd):
     def __repr__(self) -> str:
         return (
             f"{type(self).__name__}(call_id={self.func_id}, frag={self.ext_frag.get_frag_name()}, conditions=[" +
-            (', '.join(f'({atom}: {expect})' for atom, expect in self.conditions)) + "])"
+            (', '.join(f'({atom}: {expect})' for atom, expect in self.conditions)) + "]" + (", returning" if self.returning else "") + ")"
         )
 
     def virtualize(self, linker: 'SmtLinker', stack_level: int) -> List[ComCmd]:
         # resolve conditions
-        cmd: str = ("execute " + resolve_condition_cmd(self.conditions, linker, stack_level)).strip(" ")
-        cmd += f" run "
+        condition: str = resolve_condition_cmd(self.conditions, linker, stack_level)
+        cmd: str = f"execute {condition} run " if condition != "" else ""
         # resolve prefix:
         if isinstance(self.target_func, SmtMchyFunc):
             cmd += invoke_prefix_create(self.executor, linker, stack_level)
         # build final command
+        if self.returning:
+            cmd += "return run "
         cmd += f"function {linker.lookup_frag(self.target_func, stack_level, self.ext_frag)}"
         return [ComCmd(cmd)]
+
+
+class SmtScheduleFragCmd(SmtCmd):
+
+    def __init__(self, target_func: SmtMchyFunc, ext_frag: SmtFragment, *, clear: bool = False) -> None:
+        # Runs the fragment (as world) at the start of the next tick, after the current call has unwound
+        # clear: Cancel the fragment's pending run instead
+        self.target_func: SmtMchyFunc = target_func
+        self.ext_frag: SmtFragment = ext_frag
+        self.clear: bool = clear
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(call_id={self.target_func.id}, frag={self.ext_frag.get_frag_name()}" + (", clear" if self.clear else "") + ")"
+
+    def virtualize(self, linker: SmtLinker, stack_level: int) -> List[ComCmd]:
+        if isinstance(stack_level, SmtStackSlot):
+            # Scheduled functions cannot take macro arguments so the fragment must be generated at every stack level
+            raise SmtStackSlotMisuse("Cannot schedule a fragment of a macro function")
+        frag_path = linker.lookup_frag(self.target_func, stack_level, self.ext_frag)
+        if self.clear:
+            return [ComCmd(f"schedule clear {frag_path}")]
+        return [ComCmd(f"schedule function {frag_path} 1t")]
@@ -1,7 +1,8 @@
 
+import enum
 from typing import List, Tuple, Union
 from mchy.common.com_cmd import ComCmd
-from mchy.errors import StatementRepError
+from mchy.errors import StatementRepError, VirtualRepError
 from mchy.stmnt.helpers import smt_get_exec_vdat
 from mchy.stmnt.struct.linker import SmtLinker, SmtVarLinkage, SmtObjVarLinkage
 from mchy.stmnt.struct.abs_cmd import SmtCmd
@@ -10,11 +11,57 @@ from mchy.stmnt.struct.function import SmtFunc, SmtMchyFunc
 from mchy.stmnt.struct.smt_frag import SmtFragment
 
 
-def resolve_condition_cmd(conditions: List[Tuple[Union[SmtConstInt, SmtVar], bool]], linker: SmtLinker, stack_level: int) -> str:
+class SmtCompPredicate:
+    """A comparison between two int atoms tested directly by an execute condition instead of being stored to a variable first
+
+    e.g.: SmtCompPredicate(foo, GTE, 5) ---> score var_foo objective matches 5..
+    """
+
+    class Op(enum.Enum):
+        GTE = ">="
+        GT = ">"
+        EQ = "="
+
+    def __init__(self, lhs: Union[SmtConstInt, SmtVar], op: 'SmtCompPredicate.Op', rhs: Union[SmtConstInt, SmtVar]) -> None:
+        if isinstance(lhs, SmtConstInt) and isinstance(rhs, SmtConstInt):
+            raise StatementRepError(f"Constant comparison predicate created ({repr(lhs)} {op.value} {repr(rhs)})")
+        self.lhs: Union[SmtConstInt, SmtVar] = lhs
+        self.op: SmtCompPredicate.Op = op
+        self.rhs: Union[SmtConstInt, SmtVar] = rhs
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({repr(self.lhs)} {self.op.value} {repr(self.rhs)})"
+
+    def get_vars(self) -> List[SmtVar]:
+        return [atom for atom in (self.lhs, self.rhs) if isinstance(atom, SmtVar)]
+
+    @staticmethod
+    def _score(var: SmtVar, linker: SmtLinker, stack_level: int) -> str:
+        var_vdat: SmtVarLinkage = linker.lookup_var(var)
+        if not isinstance(var_vdat, SmtObjVarLinkage):
+            raise VirtualRepError(f"Attempted to compare variable without an objective value ({repr(var)}) in execute condition")
+        return f"{var_vdat.var_name} {var_vdat.get_objective(stack_level)}"
+
+    def render(self, linker: SmtLinker, stack_level: int) -> str:
+        """Get the score test (without the leading if/unless) that passes when the comparison is true"""
+        if isinstance(self.lhs, SmtVar) and isinstance(self.rhs, SmtVar):
+            return f"score {self._score(self.lhs, linker, stack_level)} {self.op.value} {self._score(self.rhs, linker, stack_level)}"
+        elif isinstance(self.lhs, SmtVar) and isinstance(self.rhs, SmtConstInt):
+            bound = {SmtCompPredicate.Op.GTE: f"{self.rhs.value}..", SmtCompPredicate.Op.GT: f"{self.rhs.value+1}..", SmtCompPredicate.Op.EQ: f"{self.rhs.value}"}
+            return f"score {self._score(self.lhs, linker, stack_level)} matches {bound[self.op]}"
+        elif isinstance(self.lhs, SmtConstInt) and isinstance(self.rhs, SmtVar):
+            bound = {SmtCompPredicate.Op.GTE: f"..{self.lhs.value}", SmtCompPredicate.Op.GT: f"..{self.lhs.value-1}", SmtCompPredicate.Op.EQ: f"{self.lhs.value}"}
+            return f"score {self._score(self.rhs, linker, stack_level)} matches {bound[self.op]}"
+        else:
+            raise VirtualRepError(f"Invalid comparison predicate operands `{type(self.lhs)}` & `{type(self.rhs)}`?")
+
+
+def resolve_condition_cmd(conditions: List[Tuple[Union[SmtConstInt, SmtVar, SmtCompPredicate], bool]], linker: SmtLinker, stack_level: int) -> str:
     """Given a list of conditions that must at runtime hold a given value generate the exeucte command bod that will only pass if the conditions are met
 
     e.g.:
     [(1, True), (foo, False)] ---> if score var_foo objective matches ..0
+    [(foo >= 5, False)] ---> unless score var_foo objective matches 5..
 
     """
     cmd: str = ""
@@ -31,6 +78,8 @@ def resolve_condition_cmd(conditions: List[Tuple[Union[SmtConstInt, SmtVar], boo
                 cmd += f" if score {cond_vdat.var_name} {cond_vdat.get_objective(stack_level)} matches 1.."
             else:
                 cmd += f" if score {cond_vdat.var_name} {cond_vdat.get_objective(stack_level)} matches ..0"
+        elif isinstance(cond, SmtCompPredicate):
+            cmd += f" {'if' if req_value else 'unless'} {cond.render(linker, stack_level)}"
         else:
-            raise StatementRepError(f"condition had invalid type {type(cond)}, expected SmtConstInt or SmtVar")
+            raise StatementRepError(f"condition had invalid type {type(cond)}, expected SmtConstInt, SmtVar or SmtCompPredicate")
     return cmd.strip(" ")
@@ -1,6 +1,8 @@
 
 
-from typing import Dict, List, Tuple
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+import hashlib
 from mchy.common.com_types import ComType, ExecType
 from mchy.contextual.struct.ctx_func import CtxMchyFunc, CtxMchyParam
 from mchy.errors import StatementRepError
@@ -12,15 +14,21 @@ from mchy.stmnt.struct.smt_frag import RoutingFlavour, SmtFragment
 
 class SmtFunc:
 
-    def __init__(self) -> None:
+    _ANON_COUNTER = count()
+
+    def __init__(self, id_key: Optional[str] = None) -> None:
         self._pseudo_index: int = 0
         self._pseudo_vars: Dict[int, SmtPseudoVar] = {}
+        self._shared_pseudo_vars: Dict[SmtPseudoVar, SmtPseudoVar] = {}  # var -> var whose storage it shares
         self._public_vars: Dict[str, SmtPublicVar] = {}
         self._fragments: List[SmtFragment] = []
         self._func_frag: SmtFragment = SmtFragment(lambda x: self._fragments.append(x), [])
         self._fragments = []
 
-        fid = hex(abs(hash(str(id(self)))) % (16**8))[2:]  # abs-hash-str makes the fid very different for similar values out of id
+        # The id is derived from `id_key` (rather than the object's address) so identical programs always produce identical ids
+        if id_key is None:
+            id_key = f"anon-{next(SmtFunc._ANON_COUNTER)}"
+        fid = hashlib.sha256(id_key.encode("utf-8")).hexdigest()[:8]
         self._id = f"{fid[:4]}-{fid[4:]}".upper()
 
     @property
@@ -47,6 +55,23 @@ class SmtFunc:
     def get_pseudo_vars(self) -> Tuple[SmtPseudoVar, ...]:
         return tuple(self._pseudo_vars.values())
 
+    def share_pseudo_var_storage(self, var: SmtPseudoVar, storage_var: SmtPseudoVar) -> None:
+        """Store `var` in the same scoreboard player/storage location as `storage_var`
+
+        The caller must ensure the values of the two are never needed at the same time.  As `var` no longer needs storage of its own it
+        is no longer returned by `get_pseudo_vars`.
+        """
+        if self._pseudo_vars.get(var.value) is not var or self._pseudo_vars.get(storage_var.value) is not storage_var or var is storage_var:
+            raise StatementRepError(
+                f"Cannot share storage of {repr(storage_var)} with {repr(var)}, both must be distinct pseudo variables of this function with their own storage"
+            )
+        del self._pseudo_vars[var.value]
+        self._shared_pseudo_vars[var] = storage_var
+
+    def get_shared_pseudo_vars(self) -> Dict[SmtPseudoVar, SmtPseudoVar]:
+        """Get the pseudo variables stored in another's storage (var -> var whose storage it uses)"""
+        return dict(self._shared_pseudo_vars)
+
     def get_all_vars(self) -> Tuple[SmtVar, ...]:
         return self.get_public_vars() + self.get_pseudo_vars()
 
@@ -69,7 +94,7 @@ class SmtGhostFunc(SmtFunc):
 class SmtMchyFunc(SmtFunc):
 
     def __init__(self, enclosing_func: SmtFunc, mchy_func: CtxMchyFunc) -> None:
-        super().__init__()
+        super().__init__(f"mchy/{mchy_func.get_name()}/{str(mchy_func.get_executor().target.value).lower()}")
         self._mchy_func: CtxMchyFunc = mchy_func
         self.param_var_lookup: Dict[str, SmtPublicVar] = {}
         for param in mchy_func.get_params():
@@ -77,6 +102,13 @@ class SmtMchyFunc(SmtFunc):
         self.return_var: SmtPseudoVar = self.new_pseudo_var(mchy_func.get_return_type())
         self.executor_var: SmtPseudoVar = self.new_pseudo_var(mchy_func.get_executor())
         self.param_default_lookup: Dict[str, SmtPseudoVar] = {}
+        self.tail_call_flag: Optional[SmtPseudoVar] = None  # Set if self tail calls loop back to the start of the function (see `build_tail_call_loop`)
+        self.iteration_budget: Optional[SmtPseudoVar] = None  # Set if loops continue on later ticks once it runs out (see `build_time_slicing`)
+        self.iterations_per_tick: int = 0  # The budget of a time sliced function at the start of each tick
+        self.resume_frags: List[SmtFragment] = []  # Fragments continuing time sliced loops on a later tick
+
+    def get_ctx_func(self) -> CtxMchyFunc:
+        return self._mchy_func
 
     def get_func_name(self) -> str:
         return self._mchy_func.get_name()
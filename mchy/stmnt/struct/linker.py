@@ -1,7 +1,8 @@
 
 from dataclasses import dataclass
 import enum
-from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Set, Tuple
+import re
+from typing import TYPE_CHECKING, Collection, Dict, List, Optional, Sequence, Set, Tuple, Union
 from mchy.common.com_types import ExecCoreTypes, ExecType, StructType
 
 from mchy.errors import StatementRepError, UnreachableError, VirtualRepError
@@ -12,6 +13,53 @@ from mchy.stmnt.struct.smt_frag import SmtFragment
 from mchy.stmnt.struct.struct import SmtPyStructInstance
 
 
+class SmtStackSlotMisuse(VirtualRepError):
+    """Raised when a stack slot is used in a way that cannot be expressed in a command template"""
+    pass
+
+
+class SmtStackSlot:
+    """A stand-in stack level used to virtualize a command once into a template for every stack level
+
+    The linker renders stack-level dependant names containing a slot as template tokens that `SmtLinker.instantiate` later
+    substitutes.  Only offsetting a slot by an integer is supported, any other use raises `SmtStackSlotMisuse`
+    """
+
+    def __init__(self, offset: int = 0) -> None:
+        self.offset: int = offset
+
+    def __add__(self, other: object) -> 'SmtStackSlot':
+        if isinstance(other, int) and not isinstance(other, bool):
+            return SmtStackSlot(self.offset + other)
+        raise SmtStackSlotMisuse(f"Cannot add `{type(other).__name__}` to a stack slot")
+
+    __radd__ = __add__
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(offset={self.offset})"
+
+    def _misuse(self, *args, **kwargs):
+        raise SmtStackSlotMisuse("Attempted to use a stack slot as a concrete stack level")
+
+    __str__ = __format__ = __int__ = __index__ = __bool__ = __hash__ = _misuse
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _misuse  # type: ignore
+    __float__ = __round__ = __neg__ = __pos__ = __abs__ = __truediv__ = __rtruediv__ = __floordiv__ = __rfloordiv__ = _misuse  # type: ignore
+    __mod__ = __rmod__ = __pow__ = __rpow__ = __divmod__ = __rdivmod__ = _misuse  # type: ignore
+
+
+StackLevel = Union[int, SmtStackSlot]
+
+
+def _slot_token(slot: SmtStackSlot, kind: str) -> str:
+    return f"\x00{slot.offset}{kind}\x00"
+
+
+def _render_level(stack_level: StackLevel, padded: bool) -> str:
+    if isinstance(stack_level, SmtStackSlot):
+        return _slot_token(stack_level, "z" if padded else "p")
+    return str(stack_level).rjust(3, '0') if padded else str(stack_level)
+
+
 @dataclass(frozen=True)
 class SmtVarLinkage:
     ns: str
@@ -20,12 +68,12 @@ class SmtVarLinkage:
     _public: bool
     _stackless: bool
 
-    def get_store_path(self, stack_level: Optional[int]) -> str:
+    def get_store_path(self, stack_level: Optional[StackLevel]) -> str:
         if self._stackless:
             return self._store_path
         if stack_level is None:
             raise VirtualRepError(f"Non-Stackless variable `{self.var_name}` has no stack level attached to request for store path. (Scope: `{self._store_path}`)")
-        return self._store_path+f".r{stack_level}"+("" if self._public else "I")
+        return self._store_path+f".r{_render_level(stack_level, False)}"+("" if self._public else "I")
 
 
 @dataclass(frozen=True)
@@ -33,12 +81,12 @@ class SmtObjVarLinkage(SmtVarLinkage):
     """Used when the variable stores it's value in an objective rather than in storage - provides access to that objective"""
     _objective: str
 
-    def get_objective(self, stack_level: Optional[int]) -> str:
+    def get_objective(self, stack_level: Optional[StackLevel]) -> str:
         if self._stackless:
             return self._objective
         if stack_level is None:
             raise VirtualRepError(f"Non-Stackless variable `{self.var_name}` has no stack level attached to request for objective. (Scope: `{self._objective}`)")
-        return self._objective+f"-r{str(stack_level).rjust(3, '0')}"+("" if self._public else "-I")
+        return self._objective+f"-r{_render_level(stack_level, True)}"+("" if self._public else "-I")
 
 
 @dataclass(frozen=True)
@@ -48,15 +96,15 @@ class SmtExecVarLinkage(SmtVarLinkage):
     solitary: bool  # True if this is non-grouped
     _player: bool
 
-    def get_full_tag(self, stack_level: Optional[int]) -> str:
+    def get_full_tag(self, stack_level: Optional[StackLevel]) -> str:
         """Get the tag this variable uses, Must not be called on source-variables only targets (as source variables may be `this` which has no tag)"""
         if self._stackless:
             return self._tag+f"-{self.var_name}"
         if stack_level is None:
             raise VirtualRepError(f"Non-Stackless variable `{self.var_name}` has no stack level attached to request for tag. (Scope: `{self._tag}`)")
-        return self._tag+f"-r{str(stack_level).rjust(3, '0')}"+("" if self._public else "-I")+f"-{self.var_name}"
+        return self._tag+f"-r{_render_level(stack_level, True)}"+("" if self._public else "-I")+f"-{self.var_name}"
 
-    def get_selector(self, stack_level: Optional[int], *, force_group: bool = False) -> str:
+    def get_selector(self, stack_level: Optional[StackLevel], *, force_group: bool = False) -> str:
         return (
             "@"+('a' if self._player else 'e') +
             f"[tag={self.get_full_tag(stack_level)}" + (
@@ -78,10 +126,14 @@ class SmtLinker:
         self._recursion_limit: int = recursion_limit
         self._func_link: Dict[Tuple[SmtFunc, int], str] = {}
         self._wildcard_func_link: Dict[SmtFunc, str] = {}
+        self._macro_func_link: Dict[SmtFunc, str] = {}  # Functions generated once as macro functions taking their stack level as arguments
         self._var_lookup: Dict[SmtVar, SmtVarLinkage] = {}
+        self._var_stack_levels: Dict[SmtVar, Collection[int]] = {}  # The stack levels each non-stackless variable is used at
         self._int_constants: Set[int] = set()
         self._frag_path_override: Dict[SmtFunc, str] = {}
         self._special_objectives: Set[str] = set()  # Any objectives the linker returned unexpectedly (such as debug objectives)
+        self._template_funcs: List[SmtFunc] = []  # Functions referenced by stack slot tokens (The token stores the index into this list)
+        self._template_func_index: Dict[SmtFunc, int] = {}
 
     def add_const(self, const_value: int) -> None:
         self._int_constants.add(const_value)
@@ -97,37 +149,97 @@ class SmtLinker:
         self._special_objectives.add(obj)
         return obj
 
+    def get_frame_stack(self) -> str:
+        """The storage & path of the nbt list used as the stack of saved frames by the storage stack calling convention"""
+        return f"{self._prj_namespace}:mchy mchy_stack"
+
     def add_func(self, func: SmtFunc, ns_loc: str, stack_level: Optional[int]) -> None:
         if stack_level is None:
             self._wildcard_func_link[func] = ns_loc
         else:
             self._func_link[(func, stack_level)] = ns_loc
 
+    def get_level_args(self) -> str:
+        """The storage & path of the nbt list holding the macro arguments of each stack level, macro functions are called with an element"""
+        return f"{self._prj_namespace}:mchy mchy_levels"
+
+    def set_macro_funcs(self, macro_func_link: Dict[SmtFunc, str]) -> None:
+        """Replace the functions generated as a single macro function for all stack levels"""
+        self._macro_func_link = dict(macro_func_link)
+
+    def _macro_args(self, func: SmtFunc, stack_level: Optional[StackLevel]) -> str:
+        if func not in self._macro_func_link.keys():
+            return ""
+        if stack_level is None:
+            raise VirtualRepError(f"Macro function `{func.id}` has no stack level attached to request for its arguments")
+        return f" with storage {self.get_level_args()}[{_render_level(stack_level, False)}]"
+
     def add_frag_path_override(self, func: SmtFunc, ns_loc: str):
         self._frag_path_override[func] = ns_loc
 
-    def lookup_frag(self, func: SmtFunc, stack_level: Optional[int], frag: SmtFragment) -> str:
+    def lookup_frag(self, func: SmtFunc, stack_level: Optional[StackLevel], frag: SmtFragment) -> str:
         frags_path: str
         if func in self._frag_path_override.keys():
             frags_path = self._frag_path_override[func]
         else:
             frags_path = self._lookup_func(func, stack_level) + "fragments"
 
-        return frags_path + "/" + frag.get_frag_name()
+        return frags_path + "/" + frag.get_frag_name() + self._macro_args(func, stack_level)
 
-    def _lookup_func(self, func: SmtFunc, stack_level: Optional[int]) -> str:
+    def _lookup_func(self, func: SmtFunc, stack_level: Optional[StackLevel]) -> str:
+        # Macro functions are at the same location for every stack level
+        if func in self._macro_func_link.keys():
+            return self._macro_func_link[func]
         # If no stack level is provided you must find the file in the wildcard link
         if stack_level is None:
             return self._wildcard_func_link[func]
         # If a stack level is provided but a wildcard entry is present for that function use the wild card option
         if func in self._wildcard_func_link.keys():
             return self._wildcard_func_link[func]
+        # If the stack level is a slot defer the lookup until the template is instantiated
+        if isinstance(stack_level, SmtStackSlot):
+            if func not in self._template_func_index.keys():
+                self._template_func_index[func] = len(self._template_funcs)
+                self._template_funcs.append(func)
+            return _slot_token(stack_level, f"f{self._template_func_index[func]}")
         # Else return the direct stack-respecting link
         return self._func_link[(func, stack_level)]
 
-    def lookup_func(self, func: SmtFunc, stack_level: Optional[int]) -> str:
+    _TEMPLATE_TOKEN_REGEX = re.compile("\x00(-?[0-9]+)(z|p|f[0-9]+)\x00")
+
+    def compile_template(self, template: str) -> List[Union[str, Tuple[int, str]]]:
+        """Split a command rendered at a stack slot into literal text and (offset, token kind) pairs ready for `instantiate`"""
+        parts: List[Union[str, Tuple[int, str]]] = []
+        split = SmtLinker._TEMPLATE_TOKEN_REGEX.split(template)
+        for ix in range(0, len(split) - 1, 3):
+            parts.append(split[ix])
+            parts.append((int(split[ix + 1]), split[ix + 2]))
+        parts.append(split[-1])
+        return parts
+
+    def instantiate(self, template: Sequence[Union[str, Tuple[int, str]]], stack_level: int) -> str:
+        """Render a compiled template at a concrete stack level"""
+        output: List[str] = []
+        for part in template:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+            offset, kind = part
+            if kind == "p":
+                output.append(str(stack_level + offset))
+            elif kind == "z":
+                output.append(str(stack_level + offset).rjust(3, '0'))
+            else:
+                output.append(self._lookup_func(self._template_funcs[int(kind[1:])], stack_level + offset))
+        return "".join(output)
+
+    def lookup_recursion_error(self, func: SmtMchyFunc) -> str:
+        """Get the function reporting that the recursion limit was reached in `func` when using the storage stack or macro functions"""
+        return self._lookup_func(func, None) + "recursion_limit"
+
+    def lookup_func(self, func: SmtFunc, stack_level: Optional[StackLevel]) -> str:
         if isinstance(func, SmtMchyFunc):
-            return self._lookup_func(func, stack_level) + "run"
+            return self._lookup_func(func, stack_level) + "run" + self._macro_args(func, stack_level)
         else:
             return self._lookup_func(func, stack_level)
 
@@ -140,16 +252,24 @@ class SmtLinker:
         else:
             raise UnreachableError("var is neither public nor pseudo - unknown subclass of SmtVar")
 
-    def add_mchy_var(self, var: SmtVar, func: SmtMchyFunc) -> None:
+    def add_mchy_var(self, var: SmtVar, func: SmtMchyFunc, stack_levels: Optional[Collection[int]] = None, *, stackless: bool = False) -> None:
         var_type = SmtVarFlavour.VAR
         if var in func.param_var_lookup.values():
             var_type = SmtVarFlavour.PARAM
         elif var == func.return_var:
             var_type = SmtVarFlavour.RETURN
 
-        self.add_bland_var(var, ["mchy_func", func.get_unique_ident()], stackless=False, var_type=var_type)
+        self.add_bland_var(var, ["mchy_func", func.get_unique_ident()], stackless=stackless, var_type=var_type, stack_levels=stack_levels)
+
+    def add_bland_var(
+                self, var: SmtVar, pathing: Sequence[str], *, stackless: bool, var_type: SmtVarFlavour = SmtVarFlavour.VAR,
+                stack_levels: Optional[Collection[int]] = None
+            ):
+        """Link `var` to a storage location
 
-    def add_bland_var(self, var: SmtVar, pathing: Sequence[str], *, stackless: bool, var_type: SmtVarFlavour = SmtVarFlavour.VAR):
+        Args:
+            stack_levels: The stack levels this variable is used at, if None every level below the recursion limit is assumed
+        """
         if var_type == SmtVarFlavour.VAR:
             var_name, public = self._get_var_data(var, param_var=False)
         elif var_type == SmtVarFlavour.PARAM:
@@ -177,6 +297,18 @@ class SmtLinker:
             )
         else:
             self._var_lookup[var] = SmtVarLinkage(linkage_ns, storage_path, var_name, public, stackless)
+        if not stackless:
+            self._var_stack_levels[var] = (
+                range(0, self._recursion_limit) if stack_levels is None else [level for level in stack_levels if level < self._recursion_limit]
+            )
+
+    def add_var_alias(self, var: SmtVar, storage_var: SmtVar) -> None:
+        """Link `var` to the same storage location as the already linked `storage_var`"""
+        if var in self._var_lookup:
+            raise StatementRepError(f"Attempting to add variable that already exists ({repr(var)})")
+        self._var_lookup[var] = self.lookup_var(storage_var)
+        if storage_var in self._var_stack_levels:
+            self._var_stack_levels[var] = self._var_stack_levels[storage_var]
 
     def lookup_var(self, var: SmtVar) -> SmtVarLinkage:
         try:
@@ -187,8 +319,8 @@ class SmtLinker:
     def get_all_sb_objs(self) -> List[str]:
         output_objectives: Set[str] = set()
         output_objectives.update(self._special_objectives)
-        for linkage in self._var_lookup.values():
+        for var, linkage in self._var_lookup.items():
             if isinstance(linkage, SmtObjVarLinkage):
-                for stacklevel in range(0, self._recursion_limit):
+                for stacklevel in self._var_stack_levels.get(var, [None]):
                     output_objectives.add(linkage.get_objective(stacklevel))
         return sorted(output_objectives)
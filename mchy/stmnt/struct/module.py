@@ -1,5 +1,5 @@
 
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 from mchy.cmd_modules.function import CtxIFunc, CtxIParam
 from mchy.common.com_inclusion import FileInclusion
 from mchy.common.com_types import InertCoreTypes, InertType
@@ -10,21 +10,25 @@ from mchy.stmnt.struct.cmds import SmtInvokeFuncCmd
 from mchy.stmnt.struct.function import SmtFunc, SmtMchyFunc, SmtGhostFunc
 from mchy.stmnt.gen_expr import convert_expr
 
+if TYPE_CHECKING:
+    from mchy.stmnt.optimize import SmtOptimisationStats
+
 
 class SmtModule:
 
     def __init__(self) -> None:
         self._mchy_funcs_link: Dict[CtxMchyFunc, SmtMchyFunc] = {}
-        self.setup_function: SmtFunc = SmtGhostFunc()  # The function that is ran to setup required structures (Such as late scoreboard creation etc)
-        self.initial_function: SmtFunc = SmtFunc()  # The function that is ran on reload to produce the effects of global scope code
-        self.ticking_function: SmtFunc = SmtFunc()  # The function that is ran every tick
-        self.import_ns_function: SmtFunc = SmtGhostFunc()  # generates code to ensure that default-iparam's pseudo-vars have the correct value
+        self.setup_function: SmtFunc = SmtGhostFunc("setup")  # The function that is ran to setup required structures (Such as late scoreboard creation etc)
+        self.initial_function: SmtFunc = SmtFunc("initial")  # The function that is ran on reload to produce the effects of global scope code
+        self.ticking_function: SmtFunc = SmtFunc("ticking")  # The function that is ran every tick
+        self.import_ns_function: SmtFunc = SmtGhostFunc("import_ns")  # generates code to ensure that default-iparam's pseudo-vars have the correct value
         self._int_consts: Dict[int, SmtConstInt] = {}
         self.ctx_decl_func: Set[CtxMchyFunc] = set()
         self._ctx_iparam_defaults: Dict[CtxIParam, Optional[SmtAtom]] = {}
         self._world_lit_val = SmtWorld()
         self.public_functions: Dict[str, SmtFunc] = {}
         self.file_inclusions: List[FileInclusion] = []
+        self.optimisation_stats: Dict[str, 'SmtOptimisationStats'] = {}  # Populated by the optimizer, keyed by optimisation name
 
         # Ensures before any global scope code runs the imported functions are fully loaded
         self.setup_function.func_frag.body.append(SmtInvokeFuncCmd(self.import_ns_function, self.get_world()))
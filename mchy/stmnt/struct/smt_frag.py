@@ -14,6 +14,8 @@ class RoutingFlavour(enum.Enum):
     COND = enum.auto()  # Used for conditionally running some other fragment
     TOP = enum.auto()  # Used for fragments continuing top level scope
     DEAD = enum.auto()  # Used as a place to write unreachable code to
+    LAZY = enum.auto()  # Used for operands that are only evaluated if needed (e.g. the right hand side of a short-circuiting and)
+    RESUME = enum.auto()  # Used for continuing a time sliced loop on a later tick
     TOPS = enum.auto   # DO NOT USE WILL CAUSE NAME CLASHES WITH TOP COMPRESSOR
 
 
@@ -2,12 +2,12 @@ from typing import List
 from mchy.common.com_types import ExecCoreTypes, ExecType
 from mchy.stmnt.struct.abs_cmd import SmtCmd
 from mchy.stmnt.struct.function import SmtFunc, SmtMchyFunc
-from mchy.stmnt.struct.linker import SmtLinker, SmtVarLinkage, SmtExecVarLinkage
+from mchy.stmnt.struct.linker import SmtLinker, SmtVarLinkage, SmtExecVarLinkage, StackLevel
 from mchy.stmnt.struct.cmds import SmtCleanupTag
 from mchy.errors import VirtualRepError
 
 
-def get_cleanup_stmnts(smt_func: SmtFunc, linker: 'SmtLinker', stack_level: int) -> List[SmtCmd]:
+def get_cleanup_stmnts(smt_func: SmtFunc, linker: 'SmtLinker', stack_level: StackLevel) -> List[SmtCmd]:
     """Yield a list of statements that must be executed at the end of the function regardless of how the function exits (similar to closing a file or freeing memory)
 
     Returns:
@@ -6,19 +6,21 @@ from mchy.virtual.vir_dp import VirDP
 import os
 
 
+def get_resource_path(inclusion: FileInclusion, config: Config) -> str:
+    return os.path.abspath(config.inclusion_path + os.path.sep + os.path.join(*inclusion.resource_path.split("/")))
+
+
 def include_file(vir_dp: VirDP, inclusion: FileInclusion, config: Config):
-    resource_path = os.path.abspath(config.inclusion_path + os.path.sep + os.path.join(*inclusion.resource_path.split("/")))
+    resource_path = get_resource_path(inclusion, config)
     if not os.path.exists(resource_path):
         raise ConversionError(f"The included resource targeting `{'/'.join(inclusion.output_path)}` cannot be found at {resource_path}").with_loc(inclusion.loc)
 
     target_folder = vir_dp.top_data_fld
     for tar_name in inclusion.output_path:
-        for child in target_folder.children:
-            if child.fs_name == tar_name:
-                if not isinstance(child, VirFolder):
-                    raise ConversionError(f"Included target `{tar_name}` appears to be a file, directory/folder expected?").with_loc(inclusion.loc)
-                target_folder = child
-                break
+        if (child := target_folder.get_child_with_name(tar_name)) is not None:
+            if not isinstance(child, VirFolder):
+                raise ConversionError(f"Included target `{tar_name}` appears to be a file, directory/folder expected?").with_loc(inclusion.loc)
+            target_folder = child
         else:
             target_folder = VirFolder(tar_name, target_folder)
 
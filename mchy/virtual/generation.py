@@ -1,12 +1,15 @@
 
-from typing import List, Sequence
+from typing import Collection, Dict, FrozenSet, List, Optional, Sequence, Tuple
 from mchy.common.config import Config
 from mchy.errors import VirtualRepError
+from mchy.stmnt.analysis import module_functions
+from mchy.stmnt.call_graph import SmtCallGraph
 from mchy.stmnt.helpers import runtime_error_tellraw_formatter
 from mchy.stmnt.struct.cmds import SmtRawCmd
 from mchy.stmnt.struct.cmds.assign import SmtAssignCmd
-from mchy.stmnt.struct.linker import SmtLinker, SmtVarFlavour
+from mchy.stmnt.struct.linker import SmtLinker, SmtStackSlot, SmtStackSlotMisuse, SmtVarFlavour
 from mchy.stmnt.struct import SmtModule, SmtMchyFunc, SmtCmd, SmtCommentCmd, CommentImportance
+from mchy.stmnt.struct.smt_frag import SmtFragment
 from mchy.common.com_cmd import ComCmd
 from mchy.stmnt.tag_cleanup import get_cleanup_stmnts
 from mchy.virtual.dp_tools import generate_tools
@@ -19,12 +22,25 @@ from mchy.virtual.vir_dp import VirDP
 def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
     vir_dp = VirDP(config)
 
+    # ===== Call Graph =====
+    # Only generate the stack levels a function can actually be called at (The recursion error happens at `recursion_limit` itself)
+    config.logger.very_verbose(f"VIR: Computing reachable stack levels")
+    call_graph = SmtCallGraph(smt_module)
+    if config.storage_stack:
+        # Recursive calls save their frame to storage so every function only ever runs at (& is only generated for) a single level
+        stack_levels: Dict[SmtMchyFunc, FrozenSet[int]] = {smt_func: frozenset([0]) for smt_func in smt_module.get_smt_mchy_funcs()}
+    else:
+        stack_levels = call_graph.get_stack_levels(config.recursion_limit)
+
     # ===== Linker Building =====
     # Build function linking
     config.logger.very_verbose(f"VIR: Building function loc linking table")
     vir_dp.linker.add_func(smt_module.import_ns_function, vir_dp.import_param_default_file.get_namespace_loc(), None)
     for smt_func in smt_module.get_smt_mchy_funcs():
-        for rix in range(0, config.recursion_limit + 1):  # Plus 1 as the recursion error technically happens 1 stack frame deeper
+        if config.storage_stack:
+            vir_dp.linker.add_func(smt_func, f"{vir_dp.mchy_func_fld.get_namespace_loc()}/{smt_func.get_unique_ident()}/", None)
+            continue
+        for rix in sorted(stack_levels[smt_func]):
             vir_dp.linker.add_func(
                 smt_func,
                 f"{vir_dp.mchy_func_fld.get_namespace_loc()}/{smt_func.get_unique_ident()}/s{rix}/",
@@ -55,9 +71,22 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
     for smt_func in smt_module.get_smt_mchy_funcs():
         for var in smt_func.get_all_vars():
             if var == smt_func.executor_var:
-                vir_dp.linker.add_bland_var(var, ["mchy_func", smt_func.get_unique_ident()], stackless=False, var_type=SmtVarFlavour.VAR)
+                vir_dp.linker.add_bland_var(
+                    var, ["mchy_func", smt_func.get_unique_ident()], stackless=config.storage_stack, var_type=SmtVarFlavour.VAR, stack_levels=stack_levels[smt_func]
+                )
             else:
-                vir_dp.linker.add_mchy_var(var, smt_func)
+                vir_dp.linker.add_mchy_var(var, smt_func, stack_levels[smt_func], stackless=config.storage_stack)
+    for smt_func in module_functions(smt_module):
+        for var, storage_var in smt_func.get_shared_pseudo_vars().items():
+            vir_dp.linker.add_var_alias(var, storage_var)
+
+    # ===== Macro functions =====
+    # Where macros are available functions run at many stack levels are generated once, taking the stack level dependant names as arguments
+    macro_funcs: Dict[SmtMchyFunc, MacroFunc] = {}
+    if config.supports(Config.Feature.MACROS) and not config.storage_stack:
+        macro_funcs = select_macro_funcs(
+            [smt_func for smt_func in smt_module.get_smt_mchy_funcs() if len(stack_levels[smt_func]) >= 2], vir_dp, config
+        )
 
     # ===== Command generation =====
     load_master_tag_cleanup: List[ComCmd] = []
@@ -79,6 +108,8 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
     vir_dp.load_master_file.append(ComCmd(f"scoreboard objectives add {vir_dp.linker.get_const_obj()} dummy"))
     for const_val in smt_module.get_all_int_consts():
         vir_dp.load_master_file.append(ComCmd(f"scoreboard players set c{const_val.value} {vir_dp.linker.get_const_obj()} {const_val.value}"))
+    if len(macro_funcs) >= 1:
+        vir_dp.load_master_file.append(level_args_init(vir_dp.linker, config))
 
     # Add import_ns work and setup to the load master file
     config.logger.very_verbose(f"VIR: Adding Initial setup to the load_master file")
@@ -100,13 +131,17 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
         vir_dp.load_master_file.extend(load_master_tag_cleanup)
 
     # Add ticking commands to tick master file
-    config.logger.very_verbose(f"VIR: Building master tick in tick_master file")
-    vir_dp.tick_master_file.extend(SmtCommentCmd("Calling Ticking Functions", generator="MCHY", importance=CommentImportance.TITLE).virtualize(vir_dp.linker, 0))
-    if config.testing_comments:
-        vir_dp.tick_master_file.append(ComCmd("# TESTING: tick-call-start"))
-    vir_dp.tick_master_file.extend(convert_smtcmds(smt_module.ticking_function.func_frag.body, vir_dp.linker, 0, config=config))
-    if config.testing_comments:
-        vir_dp.tick_master_file.append(ComCmd("# TESTING: tick-call-end"))
+    if len(smt_module.ticking_function.func_frag.body) == 0:
+        config.logger.very_verbose(f"VIR: Nothing to run each tick, removing tick_master file")
+        vir_dp.unregister_tick_master()
+    else:
+        config.logger.very_verbose(f"VIR: Building master tick in tick_master file")
+        vir_dp.tick_master_file.extend(SmtCommentCmd("Calling Ticking Functions", generator="MCHY", importance=CommentImportance.TITLE).virtualize(vir_dp.linker, 0))
+        if config.testing_comments:
+            vir_dp.tick_master_file.append(ComCmd("# TESTING: tick-call-start"))
+        vir_dp.tick_master_file.extend(convert_smtcmds(smt_module.ticking_function.func_frag.body, vir_dp.linker, 0, config=config))
+        if config.testing_comments:
+            vir_dp.tick_master_file.append(ComCmd("# TESTING: tick-call-end"))
 
     # build public functions
     config.logger.very_verbose(f"VIR: Building public function accessor files")
@@ -125,6 +160,9 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
     for frag in smt_module.initial_function.fragments:
         frag_file = VirMCHYFile(frag.get_frag_name()+".mcfunction", vir_dp.extra_frags_init)
         frag_file.extend(convert_smtcmds(frag.body, vir_dp.linker, 0, config=config))
+    for frag in smt_module.ticking_function.fragments:
+        frag_file = VirMCHYFile(frag.get_frag_name()+".mcfunction", vir_dp.extra_frags_tick)
+        frag_file.extend(convert_smtcmds(frag.body, vir_dp.linker, 0, config=config))
     for func_name, function in smt_module.public_functions.items():
         par_fld = vir_dp.extra_frags_public_fld.get_child_with_name(func_name)
         if par_fld is None:
@@ -137,7 +175,12 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
 
     # handle mchy functions
     for smt_func in smt_module.get_smt_mchy_funcs():
-        vir_dp.mchy_func_fld.add_child(convert_mchy_func(smt_func, vir_dp, config, _extra_error_state_begin))
+        if config.storage_stack:
+            vir_dp.mchy_func_fld.add_child(convert_mchy_func_single(smt_func, vir_dp, config, _extra_error_state_begin, call_graph.is_recursive(smt_func)))
+        elif smt_func in macro_funcs.keys():
+            vir_dp.mchy_func_fld.add_child(convert_mchy_func_macro(smt_func, macro_funcs[smt_func], vir_dp, config, _extra_error_state_begin, stack_levels[smt_func]))
+        else:
+            vir_dp.mchy_func_fld.add_child(convert_mchy_func(smt_func, vir_dp, config, _extra_error_state_begin, stack_levels[smt_func]))
 
     # Add all required scoreboard objectives (done here so that dynamic scoreboard objectives are created now that they are known)
     config.logger.very_verbose(f"VIR: Adding scoreboard objective creation commands to beginning of load_master file")
@@ -160,18 +203,25 @@ def convert(smt_module: SmtModule, config: Config = Config()) -> VirDP:
     return vir_dp
 
 
-def convert_mchy_func(smt_func: SmtMchyFunc, vir_dp: VirDP, config: Config, error_endpoint: VirMCHYFile) -> VirFolder:
+def convert_mchy_func(
+            smt_func: SmtMchyFunc, vir_dp: VirDP, config: Config, error_endpoint: VirMCHYFile, stack_levels: Collection[int]
+        ) -> VirFolder:
     func_fld = VirFolder(smt_func.get_unique_ident())
-    for rix in range(0, config.recursion_limit + 1):
+    body_levels = sorted(rix for rix in stack_levels if rix < config.recursion_limit)
+    # Each command is virtualized once and then stamped out for every stack level the function runs at
+    run_by_level = convert_smtcmds_templated(
+        smt_func.func_frag.body + get_cleanup_stmnts(smt_func, vir_dp.linker, SmtStackSlot()), vir_dp.linker, body_levels, config
+    )
+    frags_by_level = [(frag, convert_smtcmds_templated(frag.body, vir_dp.linker, body_levels, config)) for frag in smt_func.fragments]
+    for rix in sorted(stack_levels):
         sn_fld = VirFolder(f"s{rix}", func_fld)
         fragments = VirFolder("fragments", sn_fld)
         run_file = VirMCHYFile("run.mcfunction", sn_fld)
         if rix < config.recursion_limit:
-            run_file.extend(convert_smtcmds(smt_func.func_frag.body, vir_dp.linker, rix, config))
-            for frag in smt_func.fragments:
+            run_file.extend(run_by_level[rix])
+            for frag, frag_by_level in frags_by_level:
                 frag_file = VirMCHYFile(frag.get_frag_name()+".mcfunction", fragments)
-                frag_file.extend(convert_smtcmds(frag.body, vir_dp.linker, rix, config))
-            run_file.extend(convert_smtcmds(get_cleanup_stmnts(smt_func, vir_dp.linker, rix), vir_dp.linker, rix, config))
+                frag_file.extend(frag_by_level[rix])
         else:
             # Recursion limit runtime error:
             run_file.extend(convert_smtcmds([
@@ -182,6 +232,135 @@ def convert_mchy_func(smt_func: SmtMchyFunc, vir_dp: VirDP, config: Config, erro
     return func_fld
 
 
+def convert_mchy_func_single(smt_func: SmtMchyFunc, vir_dp: VirDP, config: Config, error_endpoint: VirMCHYFile, recursive: bool) -> VirFolder:
+    """Equivalent to `convert_mchy_func` for the storage stack calling convention where each function is generated only once"""
+    func_fld = VirFolder(smt_func.get_unique_ident())
+    fragments = VirFolder("fragments", func_fld)
+    run_file = VirMCHYFile("run.mcfunction", func_fld)
+    run_file.extend(convert_smtcmds(smt_func.func_frag.body + get_cleanup_stmnts(smt_func, vir_dp.linker, 0), vir_dp.linker, 0, config))
+    for frag in smt_func.fragments:
+        frag_file = VirMCHYFile(frag.get_frag_name()+".mcfunction", fragments)
+        frag_file.extend(convert_smtcmds(frag.body, vir_dp.linker, 0, config))
+    if recursive:
+        # Recursion limit runtime error, called instead of pushing a frame once the storage stack is full:
+        _add_recursion_limit_file(smt_func, func_fld, vir_dp, config, error_endpoint)
+    return func_fld
+
+
+def _add_recursion_limit_file(smt_func: SmtMchyFunc, func_fld: VirFolder, vir_dp: VirDP, config: Config, error_endpoint: VirMCHYFile) -> None:
+    error_file = VirMCHYFile("recursion_limit.mcfunction", func_fld)
+    error_file.extend(convert_smtcmds([
+        SmtRawCmd(runtime_error_tellraw_formatter(f"recursion limit ({config.recursion_limit}) reached in function `{smt_func.get_func_name()}`", debug=False)),
+        ], vir_dp.linker, 0, config
+    ))
+    error_file.append(ComCmd(f"function {error_endpoint.get_namespace_loc()}"))
+
+
+# The commands of a macro function's run file & of each of its fragments
+MacroFunc = Tuple[List[ComCmd], List[Tuple[SmtFragment, List[ComCmd]]]]
+
+# The stack level offsets macro functions can use, a function at level `n` is called with the arguments `p<o>`/`z<o>` set to `n+o`
+_MACRO_LEVEL_OFFSETS: Tuple[int, ...] = (0, 1)
+
+
+def select_macro_funcs(candidates: Sequence[SmtMchyFunc], vir_dp: VirDP, config: Config) -> Dict[SmtMchyFunc, MacroFunc]:
+    """Link & render as many of `candidates` as possible as macro functions
+
+    A function can only be a macro function if every stack level dependant name it uses can be passed as an argument, calls to the
+    per-level copies of another function cannot be.  As that depends on which other functions are macro functions, functions that cannot
+    be rendered are removed until the rest all can.
+    """
+    selected: List[SmtMchyFunc] = list(candidates)
+    while len(selected) >= 1:
+        vir_dp.linker.set_macro_funcs({smt_func: f"{vir_dp.mchy_func_fld.get_namespace_loc()}/{smt_func.get_unique_ident()}/" for smt_func in selected})
+        rendered = {smt_func: render_macro_func(smt_func, vir_dp.linker, config) for smt_func in selected}
+        if all(macro_func is not None for macro_func in rendered.values()):
+            return {smt_func: macro_func for smt_func, macro_func in rendered.items() if macro_func is not None}
+        selected = [smt_func for smt_func in selected if rendered[smt_func] is not None]
+    vir_dp.linker.set_macro_funcs({})
+    return {}
+
+
+def render_macro_func(smt_func: SmtMchyFunc, linker: SmtLinker, config: Config) -> Optional[MacroFunc]:
+    """Render `smt_func` as a macro function taking its stack level as arguments, None if it uses its stack level in any other way"""
+    try:
+        run_cmds = _render_macro_cmds(smt_func.func_frag.body + get_cleanup_stmnts(smt_func, linker, SmtStackSlot()), linker, config)
+        return run_cmds, [(frag, _render_macro_cmds(frag.body, linker, config)) for frag in smt_func.fragments]
+    except SmtStackSlotMisuse:
+        config.logger.very_verbose(f"VIR: function `{smt_func.get_func_name()}` cannot be a macro function, generating per stack level")
+        return None
+
+
+def _render_macro_cmds(smt_cmds: Sequence[SmtCmd], linker: SmtLinker, config: Config) -> List[ComCmd]:
+    vir_cmds: List[ComCmd] = []
+    for smt_cmd in smt_cmds:
+        config.logger.trace(f"VIR: generating macro command for {repr(smt_cmd)})")
+        for cmd in smt_cmd.virtualize(linker, SmtStackSlot()):  # type: ignore
+            parts: List[str] = []
+            for part in linker.compile_template(cmd.cmd):
+                if isinstance(part, str):
+                    parts.append(part)
+                elif part[1] in ("p", "z") and part[0] in _MACRO_LEVEL_OFFSETS:
+                    parts.append(f"$({part[1]}{part[0]})")
+                else:
+                    raise SmtStackSlotMisuse(f"Stack slot token `{part}` cannot be a macro argument")
+            vir_cmds.append(ComCmd(("$" if len(parts) >= 2 else "") + "".join(parts)))
+    return vir_cmds
+
+
+def level_args_init(linker: SmtLinker, config: Config) -> ComCmd:
+    """Get the command building the macro arguments of every stack level, the level at the recursion limit is marked with `limit`"""
+    levels: List[str] = []
+    for rix in range(config.recursion_limit + 1):
+        args = [f'p{offset}:"{rix + offset}",z{offset}:"{str(rix + offset).rjust(3, "0")}"' for offset in _MACRO_LEVEL_OFFSETS]
+        if rix == config.recursion_limit:
+            args.append("limit:1b")
+        levels.append("{" + ",".join(args) + "}")
+    return ComCmd(f"data modify storage {linker.get_level_args()} set value [{','.join(levels)}]")
+
+
+def convert_mchy_func_macro(
+            smt_func: SmtMchyFunc, macro_func: MacroFunc, vir_dp: VirDP, config: Config, error_endpoint: VirMCHYFile, stack_levels: Collection[int]
+        ) -> VirFolder:
+    """Equivalent to `convert_mchy_func` for a function generated once as a macro function"""
+    run_cmds, frag_cmds = macro_func
+    func_fld = VirFolder(smt_func.get_unique_ident())
+    fragments = VirFolder("fragments", func_fld)
+    run_file = VirMCHYFile("run.mcfunction", func_fld)
+    if config.recursion_limit in stack_levels:
+        # Recursion limit runtime error, called instead of the function body at the recursion limit:
+        _add_recursion_limit_file(smt_func, func_fld, vir_dp, config, error_endpoint)
+        returning = "return run " if config.supports(Config.Feature.RETURN_RUN) else ""  # Otherwise the error's infinite loop stops execution
+        run_file.append(ComCmd(
+            f"$execute if data storage {vir_dp.linker.get_level_args()}[$(p0)].limit run {returning}function {vir_dp.linker.lookup_recursion_error(smt_func)}"
+        ))
+    run_file.extend(run_cmds)
+    for frag, cmds in frag_cmds:
+        frag_file = VirMCHYFile(frag.get_frag_name()+".mcfunction", fragments)
+        frag_file.extend(cmds)
+    return func_fld
+
+
+def convert_smtcmds_templated(smt_cmds: Sequence[SmtCmd], linker: SmtLinker, stack_levels: Sequence[int], config: Config) -> Dict[int, List[ComCmd]]:
+    """Equivalent to calling `convert_smtcmds` at every level in `stack_levels` but virtualizes each command only once where possible"""
+    vir_cmds: Dict[int, List[ComCmd]] = {rix: [] for rix in stack_levels}
+    if len(stack_levels) == 0:
+        return vir_cmds
+    for smt_cmd in smt_cmds:
+        config.logger.trace(f"VIR: generating command template for {repr(smt_cmd)})")
+        try:
+            templates = [linker.compile_template(template.cmd) for template in smt_cmd.virtualize(linker, SmtStackSlot())]  # type: ignore
+        except SmtStackSlotMisuse:
+            config.logger.trace(f"VIR: command cannot be templated, generating per stack level")
+            for rix in stack_levels:
+                # Instantiate anyway as the command may hold names built at a stack slot (e.g. tag cleanup)
+                vir_cmds[rix].extend(ComCmd(linker.instantiate(linker.compile_template(cmd.cmd), rix)) for cmd in smt_cmd.virtualize(linker, rix))
+            continue
+        for rix in stack_levels:
+            vir_cmds[rix].extend(ComCmd(linker.instantiate(template, rix)) for template in templates)
+    return vir_cmds
+
+
 def convert_smtcmds(smt_cmds: Sequence[SmtCmd], linker: SmtLinker, stack_level: int, config: Config) -> List[ComCmd]:
     vir_cmds: List[ComCmd] = []
     for smt_cmd in smt_cmds:
@@ -1,17 +1,29 @@
 
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
 import re
-from typing import Dict, FrozenSet, List, MutableSet, Optional, Tuple, Type, Union
+import time
+from typing import Dict, FrozenSet, Iterator, List, MutableSet, Optional, Tuple, Type, Union
+from weakref import WeakKeyDictionary
+from mchy.common.com_cmd import ComCmd
 from mchy.common.config import Config
 from mchy.errors import ConversionError, VirtualRepError
-from mchy.virtual.vir_dirs import VirFSNode, VirFolder, VirMCHYFile, VirNSFolder
+from mchy.virtual.vir_dirs import VirBaseMCHYFile, VirDynamicMCHYFile, VirFSNode, VirFolder, VirMCHYFile, VirNSFolder
 from mchy.virtual.vir_dp import VirDP
 
 
 # ===== Core Structures =====
 
 
+class VirChange(Enum):
+    """The kinds of change an optimisation can make to the generated filesystem"""
+    FILE_CONTENTS = 0  # The commands of a file changed
+    FILES = 1  # Files were deleted
+    FOLDERS = 2  # Folders were deleted
+
+
 class VirOptimisation(ABC):
 
     __optimizations: List['VirOptimisation'] = []
@@ -51,29 +63,109 @@ class VirOptimisation(ABC):
     def optimize(self, vir_dp: VirDP) -> Optional[VirDP]:
         ...
 
+    @abstractmethod
+    def reads(self) -> FrozenSet[VirChange]:
+        """The changes that can give this optimisation more to do, it is only re-run after an optimisation makes one of these changes"""
+        ...
+
+    @abstractmethod
+    def writes(self) -> FrozenSet[VirChange]:
+        """The changes this optimisation makes when it applies"""
+        ...
+
+
+@dataclass
+class VirOptimisationStats:
+    runs: int = 0
+    hits: int = 0
+    runtime: float = 0.0  # Seconds
+
 
 def optimize(vir_dp: VirDP) -> VirDP:
-    """Optimizations may change the passed in VirDP and will return the VirDP to treat as optimal"""
+    """Optimizations may change the passed in VirDP and will return the VirDP to treat as optimal
+
+    Every optimisation starts dirty.  The cheapest dirty optimisation is ran, if it changes anything every optimisation (including itself)
+    that reads the kinds of change it writes is marked dirty again.  Once nothing is dirty no optimisation can make further progress.
+    """
     optimisations: List[VirOptimisation] = []
     for opt in VirOptimisation.optimizations():
         if opt.level().value <= vir_dp._config.optimisation.value:
             optimisations.append(opt)
     optimisations.sort(key=lambda opt: opt.cost())
 
+    stats: Dict[str, VirOptimisationStats] = vir_dp.optimisation_stats
+    for opt in optimisations:
+        stats.setdefault(type(opt).__name__, VirOptimisationStats())
+    dirty: List[VirOptimisation] = list(optimisations)
+
     for _ in range(10000):  # Prevents inf loops
-        for opt in optimisations:
-            res = opt.optimize(vir_dp)
-            if res is not None:
-                vir_dp = res
-                break
-        else:
-            break  # If we couldn't apply any optimizations: Stop
+        if len(dirty) == 0:
+            break  # If no optimizations could apply: Stop
+        opt = dirty.pop(0)
+        opt_stats = stats[type(opt).__name__]
+        start_time = time.perf_counter()
+        res = opt.optimize(vir_dp)
+        opt_stats.runtime += time.perf_counter() - start_time
+        opt_stats.runs += 1
+        if res is None:
+            continue
+        vir_dp = res
+        opt_stats.hits += 1
+        for other in optimisations:
+            if (other not in dirty) and not other.reads().isdisjoint(opt.writes()):
+                dirty.append(other)
+        dirty.sort(key=lambda opt: opt.cost())
     else:
         vir_dp._config.logger.warn("Over 10000 optimisation applied, infinite loop probable, Ending")
 
+    for opt_name, opt_stats in stats.items():
+        vir_dp._config.logger.very_verbose(
+            f"VIR: {opt_name}: ran {opt_stats.runs} time(s), applied {opt_stats.hits} time(s), took {opt_stats.runtime*1000:.2f}ms"
+        )
     return vir_dp
 
 
+_REGEX_FUNC_LINE = re.compile(r"^\$?(execute.*run )?(?:return run )?(?:schedule )?function ([^ :]+:[^ ]*)( with .*| [0-9]+[tsd]?(?: append| replace)?)?$")
+_call_cache: 'WeakKeyDictionary[VirBaseMCHYFile, Tuple[int, List[str]]]' = WeakKeyDictionary()  # Cached until the file next changes
+
+
+def get_calls(file: VirBaseMCHYFile) -> List[str]:
+    """Get the functions called (or scheduled to run later) by each line of a file that calls a function"""
+    cached = _call_cache.get(file)
+    if cached is not None and cached[0] == file.revision:
+        return cached[1]
+    calls: List[str] = []
+    for line in file.lines:
+        if (found := _REGEX_FUNC_LINE.match(line.cmd)) is not None:
+            calls.append(found.group(2))
+    _call_cache[file] = (file.revision, calls)
+    return calls
+
+
+def parse_function_link(vir_dp: VirDP, function_line: str) -> Optional[VirMCHYFile]:
+    """Get the VirDP file linked to via the function_line or None if it is an external resource"""
+    ns, path = function_line.split(":")
+    if ns != vir_dp._config.project_namespace:
+        return None  # Call doesn't link to this datapack
+    path_elems = path.split("/")
+    if path_elems[0] != "generated":
+        return None  # This call references functions we didn't generate
+    cur_path = ns+":"+path_elems[0]
+    cur_loc: VirFSNode = vir_dp.generated_root
+    for path_elem in path_elems[1:]:
+        if not isinstance(cur_loc, VirFolder):
+            raise ConversionError(f"Encountered path that performs a directory lookup on a file: {cur_path}")
+        cur_path += "/" + path_elem
+        if (child := cur_loc.get_child_with_ns_name(path_elem)) is None:
+            vir_dp._config.logger.warn(f"File/Folder at {cur_path} does not seem to exist")
+            return None  # This seems to link to a non-existent file
+        cur_loc = child
+    if isinstance(cur_loc, VirMCHYFile):
+        return cur_loc
+    else:
+        raise ConversionError(f"Path links to non-mchy file {type(cur_loc).__name__}(fs_name={cur_loc.fs_name})? (path: {cur_path})")
+
+
 # ===== Optimisations =====
 
 class CallableFilesOnly(VirOptimisation):
@@ -84,33 +176,11 @@ class CallableFilesOnly(VirOptimisation):
     def level(self) -> Config.Optimize:
         return Config.Optimize.O2
 
-    _REGEX_FUNC_LINE = re.compile(r"^(execute.*run )?function (.*:[^/]*(/.*)*)$")
-
-    def _parse_link(self, vir_dp: VirDP, function_line: str) -> Optional[VirMCHYFile]:
-        """Get the VirDP file linked to via the function_line or None if it is an external resource"""
-        ns, path = function_line.split(":")
-        if ns != vir_dp._config.project_namespace:
-            return None  # Call doesn't link to this datapack
-        path_elems = path.split("/")
-        if path_elems[0] != "generated":
-            return None  # This call references functions we didn't generate
-        cur_path = ns+":"+path_elems[0]
-        cur_loc: VirFSNode = vir_dp.generated_root
-        for path_elem in path_elems[1:]:
-            if not isinstance(cur_loc, VirFolder):
-                raise ConversionError(f"Encountered path that performs a directory lookup on a file: {cur_path}")
-            cur_path += "/" + path_elem
-            for child in cur_loc.children:
-                if child.get_namespace_loc() == cur_path:
-                    cur_loc = child
-                    break
-            else:
-                vir_dp._config.logger.warn(f"File/Folder at {cur_path} does not seem to exist")
-                return None  # This seems to link to a non-existent file
-        if isinstance(cur_loc, VirMCHYFile):
-            return cur_loc
-        else:
-            raise ConversionError(f"Path links to non-mchy file {type(cur_loc).__name__}(fs_name={cur_loc.fs_name})? (path: {cur_path})")
+    def reads(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FILE_CONTENTS})  # Only removed calls can make files unreachable
+
+    def writes(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FILES})
 
     def optimize(self, vir_dp: VirDP) -> Optional[VirDP]:
         # initialize file search
@@ -125,11 +195,10 @@ class CallableFilesOnly(VirOptimisation):
         # parse all reachable files
         while len(found_files) >= 1:
             active_file = found_files.pop()
-            for line in active_file.lines:
-                if (found := CallableFilesOnly._REGEX_FUNC_LINE.match(line.cmd)) is not None:
-                    file_link = self._parse_link(vir_dp, found.group(2))
-                    if (file_link is not None) and (file_link not in finished_files):
-                        found_files.add(file_link)
+            for call in get_calls(active_file):
+                file_link = parse_function_link(vir_dp, call)
+                if (file_link is not None) and (file_link not in finished_files):
+                    found_files.add(file_link)
             finished_files.add(active_file)
         live_files = frozenset(finished_files)
 
@@ -167,6 +236,12 @@ class DeleteEmptyFolders(VirOptimisation):
     def level(self) -> Config.Optimize:
         return Config.Optimize.O1
 
+    def reads(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FILES})  # Folders emptied by deleting empty sub-folders are deleted in the same pass
+
+    def writes(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FOLDERS})
+
     def optimize(self, vir_dp: VirDP) -> Optional[VirDP]:
         if (pcount := self._prune_empty(vir_dp.generated_root)) >= 1:
             vir_dp._config.logger.very_verbose(f"VIR: {type(self).__name__}: Deleting `{pcount}` empty folders")
@@ -183,3 +258,189 @@ class DeleteEmptyFolders(VirOptimisation):
             node.delete()
             pruned += 1
         return pruned
+
+
+class InlineSmallFiles(VirOptimisation):
+    """Replace calls to small non-recursive files (fragments & function bodies) with the commands of the called file
+
+    Unconditional calls inline files of up to `MAX_INLINE_LINES` commands, or of any size if there is only one call to the file.  A
+    conditional call to a single command merges the call's conditions into that command.  A conditional call to up to
+    `MAX_CONDITIONAL_INLINE_LINES` commands repeats the conditions on every command, this is only done if the conditions are score tests
+    that none of the inlined commands can change.  Files that return (`return`) are only inlined by an unconditional last command, files
+    that are only called to store their result & calls made by `return run` (as the caller must still return) are never inlined.
+    """
+
+    MAX_INLINE_LINES = 16
+    MAX_CONDITIONAL_INLINE_LINES = 2
+
+    _REGEX_CALL = re.compile(r"^(?:execute((?: .*)?) run )?function ([^ ]+)$")
+    _REGEX_STORE = re.compile(r"(^| )store (result|success) ")
+    _REGEX_SUMMON = re.compile(r"(^| )summon ")
+    _REGEX_RETURN = re.compile(r"(^| run )return( |$)")
+    _REGEX_FUNCTION = re.compile(r"(^| )function ")
+    _REGEX_STORE_SCORE = re.compile(r"store (?:result|success) score ([^ ]+) ([^ ]+)")
+    _REGEX_SCORE_WRITE = re.compile(r"(?:^| run )scoreboard players (set|add|remove|reset|operation|enable) ([^ ]+)(?: ([^ ]+))?(?: ([^ ]+) ([^ ]+) ([^ ]+))?")
+
+    def cost(self) -> int:
+        return 4
+
+    def level(self) -> Config.Optimize:
+        return Config.Optimize.O3
+
+    def reads(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FILE_CONTENTS, VirChange.FILES})  # Deleted callers can leave a file with only one call
+
+    def writes(self) -> FrozenSet[VirChange]:
+        return frozenset({VirChange.FILE_CONTENTS})
+
+    def optimize(self, vir_dp: VirDP) -> Optional[VirDP]:
+        files = self._walk_files(vir_dp.generated_root)
+        calls: Dict[VirBaseMCHYFile, List[VirBaseMCHYFile]] = {}
+        call_counts: Dict[VirBaseMCHYFile, int] = {}
+        for file in files:
+            calls[file] = [link for call in get_calls(file) if (link := parse_function_link(vir_dp, call)) is not None]
+            for callee in calls[file]:
+                call_counts[callee] = call_counts.get(callee, 0) + 1
+        recursive = self._recursive_files(files, calls)
+
+        inlined = 0
+        for caller in files:
+            if caller in recursive or len(calls[caller]) == 0 or not isinstance(caller, (VirMCHYFile, VirDynamicMCHYFile)):
+                continue
+            new_lines: List[ComCmd] = []
+            last_index = max((index for index, line in enumerate(caller.lines) if line.cmd.strip() != "" and not line.cmd.startswith("#")), default=-1)
+            for index, line in enumerate(caller.lines):
+                replacement = self._inline_line(vir_dp, caller, line, recursive, call_counts, index == last_index)
+                if replacement is None:
+                    new_lines.append(line)
+                else:
+                    new_lines.extend(replacement)
+                    inlined += 1
+            if len(new_lines) != len(caller.lines) or any(new is not old for new, old in zip(new_lines, caller.lines)):
+                caller.replace_lines(new_lines)
+
+        if inlined == 0:
+            return None
+        vir_dp._config.logger.very_verbose(f"VIR: {type(self).__name__}: Inlined `{inlined}` function calls")
+        return vir_dp
+
+    def _walk_files(self, folder: VirFolder) -> List[VirBaseMCHYFile]:
+        files: List[VirBaseMCHYFile] = []
+        for child in folder.children:
+            if isinstance(child, VirFolder):
+                files.extend(self._walk_files(child))
+            elif isinstance(child, VirBaseMCHYFile):
+                files.append(child)
+        return files
+
+    def _recursive_files(self, files: List[VirBaseMCHYFile], calls: Dict[VirBaseMCHYFile, List[VirBaseMCHYFile]]) -> MutableSet[VirBaseMCHYFile]:
+        """Get every file that can (possibly indirectly) call itself using Tarjan's strongly connected components algorithm"""
+        index: Dict[VirBaseMCHYFile, int] = {}
+        low: Dict[VirBaseMCHYFile, int] = {}
+        stack: List[VirBaseMCHYFile] = []
+        on_stack: MutableSet[VirBaseMCHYFile] = set()
+        recursive: MutableSet[VirBaseMCHYFile] = set()
+        for root in files:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work: List[Tuple[VirBaseMCHYFile, Iterator[VirBaseMCHYFile]]] = [(root, iter(calls.get(root, [])))]
+            while len(work) >= 1:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(calls.get(child, []))))
+                        break
+                    elif child in on_stack:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if len(work) >= 1:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                    if low[node] == index[node]:
+                        component: List[VirBaseMCHYFile] = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member is node:
+                                break
+                        if len(component) >= 2 or node in calls.get(node, []):
+                            recursive.update(component)
+        return recursive
+
+    def _inline_line(
+            self, vir_dp: VirDP, caller: VirBaseMCHYFile, line: ComCmd, recursive: MutableSet[VirBaseMCHYFile], call_counts: Dict[VirBaseMCHYFile, int],
+            last_line: bool
+            ) -> Optional[List[ComCmd]]:
+        """Get the commands to replace the function call `line` with or None if it shouldn't be inlined"""
+        if (found := InlineSmallFiles._REGEX_CALL.match(line.cmd)) is None or InlineSmallFiles._REGEX_RETURN.search(line.cmd):
+            return None
+        callee = parse_function_link(vir_dp, found.group(2))
+        if callee is None or callee is caller or callee in recursive:
+            return None
+        conditions = (found.group(1) or "").replace(" run execute ", " ").strip()
+        if InlineSmallFiles._REGEX_STORE.search(conditions):
+            return None  # The result of a function differs from the result of its commands
+        commands = [cmd.cmd for cmd in callee.lines if cmd.cmd.strip() != "" and not cmd.cmd.startswith("#")]
+        if any(cmd.startswith("$") for cmd in commands):
+            return None
+        if any(InlineSmallFiles._REGEX_RETURN.search(cmd) for cmd in commands) and not (last_line and conditions == ""):
+            return None  # Returning would now skip the rest of the caller
+        if conditions == "":
+            if len(commands) <= InlineSmallFiles.MAX_INLINE_LINES or call_counts.get(callee, 0) == 1:
+                return [ComCmd(cmd.cmd) for cmd in callee.lines]
+            return None
+        if len(commands) == 0:
+            return None if InlineSmallFiles._REGEX_SUMMON.search(conditions) else []
+        if len(commands) == 1:
+            return [ComCmd(self._merge(conditions, commands[0]))]
+        if len(commands) <= InlineSmallFiles.MAX_CONDITIONAL_INLINE_LINES and self._conditions_preserved(conditions, commands):
+            return [ComCmd(cmd.cmd if cmd.cmd.strip() == "" or cmd.cmd.startswith("#") else self._merge(conditions, cmd.cmd)) for cmd in callee.lines]
+        return None
+
+    @staticmethod
+    def _merge(conditions: str, command: str) -> str:
+        if command.startswith("execute "):
+            return f"execute {conditions} {command[len('execute '):]}"
+        return f"execute {conditions} run {command}"
+
+    def _conditions_preserved(self, conditions: str, commands: List[str]) -> bool:
+        """Check the conditions are all score tests that will give the same result before each command"""
+        reads: MutableSet[Tuple[str, str]] = set()
+        tokens = conditions.split(" ")
+        pos = 0
+        while pos < len(tokens):
+            if tokens[pos] not in ("if", "unless") or tokens[pos+1:pos+2] != ["score"] or len(tokens) < pos + 6:
+                return False
+            reads.add((tokens[pos+2], tokens[pos+3]))
+            if tokens[pos+4] == "matches":
+                pos += 6
+            elif tokens[pos+4] in ("<", "<=", "=", ">=", ">") and len(tokens) >= pos + 7:
+                reads.add((tokens[pos+5], tokens[pos+6]))
+                pos += 7
+            else:
+                return False
+        if any(holder.startswith("@") or holder == "*" for holder, _ in reads):
+            return False
+        read_objectives = {objective for _, objective in reads}
+        for command in commands:
+            if InlineSmallFiles._REGEX_FUNCTION.search(command):
+                return False  # Could change anything
+            writes: List[Tuple[str, Optional[str]]] = [(found.group(1), found.group(2)) for found in InlineSmallFiles._REGEX_STORE_SCORE.finditer(command)]
+            if (found := InlineSmallFiles._REGEX_SCORE_WRITE.search(command)) is not None:
+                writes.append((found.group(2), found.group(3)))
+                if found.group(1) == "operation" and found.group(4) == "><":
+                    writes.append((found.group(5), found.group(6)))
+            for holder, objective in writes:
+                if holder.startswith("@") or holder == "*":
+                    if objective is None or objective in read_objectives:
+                        return False
+                elif (objective is None and any(holder == read_holder for read_holder, _ in reads)) or (holder, objective) in reads:
+                    return False
+        return True
@@ -1,14 +1,64 @@
-
+from dataclasses import dataclass, field
+import hashlib
+import json
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
 from mchy.common.com_cmd import ComCmd
 from mchy.errors import UnreachableError
-from mchy.virtual.vir_dirs import VirBaseMCHYFile, VirFolder, VirRawFile
+from mchy.virtual.vir_dirs import VirBaseMCHYFile, VirFSNode, VirFolder, VirRawFile
 import os
 
 
+MANIFEST_FILE_NAME = ".mchy_manifest.json"
+_MANIFEST_VERSION = 1
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # Fixed timestamp so identical datapacks produce identical archives
+
+
 def disk_line(ln: ComCmd) -> str:
     return ln.cmd
 
 
+def file_data(node: VirFSNode) -> bytes:
+    """Get the exact bytes a virtual file is written to disk as"""
+    if isinstance(node, VirBaseMCHYFile):
+        return ("\n".join([disk_line(line) for line in node.lines])+"\n").encode("utf-8")
+    elif isinstance(node, VirRawFile):
+        return node.content.encode("utf-8")
+    else:
+        raise UnreachableError(f"Unknown file type `{type(node).__name__}`")
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _walk_files(cur_folder: VirFolder, rel_path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], VirFSNode]]:
+    for child in cur_folder.children:
+        if isinstance(child, VirFolder):
+            yield from _walk_files(child, rel_path + (child.fs_name, ))
+        elif isinstance(child, (VirBaseMCHYFile, VirRawFile)):
+            yield (rel_path + (child.fs_name, ), child)
+        else:
+            raise UnreachableError(f"Unknown child of VirFSNode `{type(child).__name__}`")
+
+
+def _walk_folders(cur_folder: VirFolder, rel_path: Tuple[str, ...] = ()) -> Iterator[Tuple[str, ...]]:
+    for child in cur_folder.children:
+        if isinstance(child, VirFolder):
+            yield rel_path + (child.fs_name, )
+            yield from _walk_folders(child, rel_path + (child.fs_name, ))
+
+
+def collect_files(root: VirFolder) -> List[Tuple[str, bytes]]:
+    """Get the relative path (with `/` separators) and exact data of every file in the virtual folder `root`"""
+    return [("/".join(rel_path_elems), file_data(node)) for rel_path_elems, node in _walk_files(root)]
+
+
+def collect_folders(root: VirFolder) -> List[str]:
+    """Get the relative path (with `/` separators) of every folder in the virtual folder `root`, parents before their children"""
+    return ["/".join(rel_path_elems) for rel_path_elems in _walk_folders(root)]
+
+
 def to_disk(cur_folder: VirFolder, cur_path: str) -> None:
     # create the current directory
     os.mkdir(cur_path)
@@ -17,12 +67,147 @@ def to_disk(cur_folder: VirFolder, cur_path: str) -> None:
     for child in cur_folder.children:
         if isinstance(child, VirFolder):
             to_disk(child, os.path.join(cur_path, child.fs_name))
-        elif isinstance(child, VirBaseMCHYFile):
-            content = "\n".join([disk_line(line) for line in child.lines])+"\n"
-            with open(os.path.join(cur_path, child.fs_name), mode="w") as file:
-                file.write(content)
-        elif isinstance(child, VirRawFile):
-            with open(os.path.join(cur_path, child.fs_name), mode="w") as file:
-                file.write(child.content)
+        elif isinstance(child, (VirBaseMCHYFile, VirRawFile)):
+            with open(os.path.join(cur_path, child.fs_name), mode="wb") as file:
+                file.write(file_data(child))
         else:
             raise UnreachableError(f"Unknown child of VirFSNode `{type(child).__name__}`")
+
+
+def _read_manifest(root_path: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(root_path, MANIFEST_FILE_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != _MANIFEST_VERSION or not isinstance(manifest.get("files"), dict):
+        return {}
+    return manifest["files"]
+
+
+@dataclass
+class IncrementalWritePlan:
+    root_path: str
+    writes: List[Tuple[str, bytes]] = field(default_factory=list)  # (relative path, data) of new or changed files
+    deletes: List[str] = field(default_factory=list)  # relative paths of files that are no longer generated
+    mkdirs: List[str] = field(default_factory=list)  # relative paths of generated folders missing on disk
+    rmdirs: List[str] = field(default_factory=list)  # relative paths of on-disk folders that are no longer generated
+    unchanged: int = 0
+    file_hashes: Dict[str, str] = field(default_factory=dict)  # relative path -> hash of every generated file
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.writes) == 0 and len(self.deletes) == 0 and len(self.mkdirs) == 0 and len(self.rmdirs) == 0
+
+
+def plan_incremental_write(root: VirFolder, root_path: str) -> IncrementalWritePlan:
+    """Compare the virtual folder `root` with what is already on disk at `root_path` and find the files that need changing
+
+    Files recorded in the manifest are trusted to still hold the recorded hash if their size is unchanged, all other on-disk files are
+    hashed directly.
+    """
+    plan = IncrementalWritePlan(root_path)
+    manifest = _read_manifest(root_path)
+
+    on_disk: Dict[str, str] = {}  # relative path (with `/` separators) -> absolute path
+    on_disk_folders: List[str] = []
+    for dir_path, _, file_names in os.walk(root_path):
+        if dir_path != root_path:
+            on_disk_folders.append(os.path.relpath(dir_path, root_path).replace(os.sep, "/"))
+        for file_name in file_names:
+            abs_path = os.path.join(dir_path, file_name)
+            rel_path = os.path.relpath(abs_path, root_path).replace(os.sep, "/")
+            if rel_path != MANIFEST_FILE_NAME:
+                on_disk[rel_path] = abs_path
+
+    for rel_path_elems, node in _walk_files(root):
+        rel_path = "/".join(rel_path_elems)
+        data = file_data(node)
+        new_hash = _hash(data)
+        plan.file_hashes[rel_path] = new_hash
+        existing_path = on_disk.pop(rel_path, None)
+        if existing_path is not None:
+            old_hash: Optional[str] = manifest.get(rel_path)
+            if old_hash is not None and old_hash == new_hash and os.path.getsize(existing_path) == len(data):
+                plan.unchanged += 1
+                continue
+            with open(existing_path, mode="rb") as existing_file:
+                if _hash(existing_file.read()) == new_hash:
+                    plan.unchanged += 1
+                    continue
+        plan.writes.append((rel_path, data))
+
+    plan.deletes.extend(sorted(on_disk.keys()))
+
+    vir_folders = ["/".join(rel_path) for rel_path in _walk_folders(root)]
+    existing_folders = set(on_disk_folders)
+    plan.mkdirs.extend(folder for folder in vir_folders if folder not in existing_folders)
+    generated_folders = set(vir_folders)
+    plan.rmdirs.extend(sorted((folder for folder in on_disk_folders if folder not in generated_folders), reverse=True))  # Deepest first
+    return plan
+
+
+def apply_incremental_write(plan: IncrementalWritePlan) -> None:
+    """Perform the changes found by `plan_incremental_write` and update the manifest"""
+    for rel_path in plan.deletes:
+        os.remove(os.path.join(plan.root_path, *rel_path.split("/")))
+    for rel_path in plan.rmdirs:
+        os.rmdir(os.path.join(plan.root_path, *rel_path.split("/")))
+    for rel_path in plan.mkdirs:
+        os.makedirs(os.path.join(plan.root_path, *rel_path.split("/")), exist_ok=True)
+    for rel_path, data in plan.writes:
+        with open(os.path.join(plan.root_path, *rel_path.split("/")), mode="wb") as file:
+            file.write(data)
+    with open(os.path.join(plan.root_path, MANIFEST_FILE_NAME), mode="w") as manifest_file:
+        json.dump({"version": _MANIFEST_VERSION, "files": plan.file_hashes}, manifest_file, indent=1, sort_keys=True)
+
+
+def to_zip(root: VirFolder, zip_path: str) -> int:
+    """Stream every file of the virtual folder `root` into a single zip archive at `zip_path` in one pass, returning the number of files written
+
+    The archive is written beside `zip_path` and moved into place once complete so a failed write never leaves a truncated datapack behind.
+    """
+    part_path = zip_path + ".part"
+    file_count = 0
+    try:
+        with zipfile.ZipFile(part_path, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for rel_path_elems, node in _walk_files(root):
+                info = zipfile.ZipInfo("/".join(rel_path_elems), date_time=_ZIP_DATE_TIME)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, file_data(node))
+                file_count += 1
+        os.replace(part_path, zip_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return file_count
+
+
+def is_generated_zip(zip_path: str) -> bool:
+    """True if the archive at `zip_path` contains the markers of a datapack we generated"""
+    try:
+        with zipfile.ZipFile(zip_path, mode="r") as archive:
+            names = set(archive.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
+    return "pack.mcmeta" in names and "generated.txt" in names
+
+
+def nest_zip(zip_path: str, nested_path: str, folder_name: str) -> None:
+    """Copy the archive at `zip_path` to `nested_path` with every entry moved under `folder_name/`
+
+    Minecraft only loads archives with a top level `pack.mcmeta` so the copy cannot be loaded by the game as a datapack.
+    """
+    part_path = nested_path + ".part"
+    try:
+        with zipfile.ZipFile(zip_path, mode="r") as source, zipfile.ZipFile(part_path, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for info in source.infolist():
+                nested_info = zipfile.ZipInfo(folder_name + "/" + info.filename, date_time=info.date_time)
+                nested_info.compress_type = zipfile.ZIP_DEFLATED
+                nested_info.external_attr = info.external_attr
+                archive.writestr(nested_info, source.read(info))
+        os.replace(part_path, nested_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
@@ -1,12 +1,16 @@
 
 from abc import ABC, abstractmethod
-from typing import Callable, List, Optional, Sequence, Tuple, Union
+from itertools import count
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union, overload
 from os import path as os_path
 
 from mchy.errors import VirtualRepError
 from mchy.common.com_cmd import ComCmd
 
 
+_REVISION_COUNTER = count(1)
+
+
 class VirFSNode(ABC):
     """
     Virtual filesystem node - common parent of folders and files
@@ -15,9 +19,22 @@ class VirFSNode(ABC):
     def __init__(self, name: str, parent: Optional['VirFolder'] = None) -> None:
         self._parent: Optional['VirFolder'] = None  # Only set by contining folder
         self._name: str = name
+        self._revision: int = next(_REVISION_COUNTER)
+        self._ns_loc_cache: Optional[str] = None  # Cleared whenever this node or one of its ancestors is re-parented
         if parent is not None:
             self.link_parent(parent)
 
+    @property
+    def revision(self) -> int:
+        """A number that increases whenever this node or anything below it changes"""
+        return self._revision
+
+    def touch(self) -> None:
+        """Mark this node (and so all of its ancestors) as changed"""
+        self._revision = next(_REVISION_COUNTER)
+        if self._parent is not None:
+            self._parent.touch()
+
     def link_parent(self, parent: 'VirFolder') -> None:
         """Add link `parent` to this node and add this node as a child of parent if it is not already
 
@@ -29,31 +46,44 @@ class VirFSNode(ABC):
         """
         if self._parent is not None:
             raise VirtualRepError(f"Attempted to double link parent on `{self._name}`. (`{self._parent.path}` -> `{parent.path}`)")
-        if self not in parent.children:
+        if not parent.has_child(self):
             parent.add_child(self)  # This will re-call this function once self is registered as a child
         else:
             self._parent = parent
+            self._invalidate_ns_loc()
+
+    def _invalidate_ns_loc(self) -> None:
+        self._ns_loc_cache = None
 
     def get_namespace_loc(self) -> str:
         """Get the minecraft namespace-rooted path to this (e.g. ns:generated/extra/example)"""
+        if self._ns_loc_cache is not None:
+            return self._ns_loc_cache
         if self._parent is None:
             raise VirtualRepError(f"Attempted to resolve root folders namespace location -> No namespace authority in virtual filesystem.  Error path: {self.fs_name}")
         try:
-            return self._parent.get_namespace_loc() + "/" + os_path.splitext(self.fs_name)[0]
+            self._ns_loc_cache = self._parent.get_namespace_loc() + "/" + self.ns_name
         except VirtualRepError as e:
             raise VirtualRepError(str(e)+f"/{self.fs_name}").with_traceback(e.__traceback__) from None
+        return self._ns_loc_cache
 
     def delete(self) -> None:
         if self._parent is not None:
-            if self in self._parent.children:
+            if self._parent.has_child(self):
                 self._parent.delete_child(self)  # This will re-call this function once self is unregistered as a child
             else:
                 self._parent = None
+                self._invalidate_ns_loc()
 
     @property
     def fs_name(self) -> str:
         return self._name
 
+    @property
+    def ns_name(self) -> str:
+        """The name of this node as it appears in namespace locations (without file extensions)"""
+        return os_path.splitext(self._name)[0]
+
     @property
     def path(self) -> str:
         if self._parent is None:
@@ -64,33 +94,65 @@ class VirFSNode(ABC):
 class VirFolder(VirFSNode):
 
     def __init__(self, name: str, parent: Optional['VirFolder'] = None, initial_children: Sequence[VirFSNode] = ()) -> None:
+        self._children: Dict[str, VirFSNode] = {}  # fs_name -> child, in insertion order
+        self._ns_children: Dict[str, List[VirFSNode]] = {}  # ns_name -> children (a file and folder may share an ns_name)
+        self._children_cache: Optional[Tuple[VirFSNode, ...]] = None
         super().__init__(name, parent)
-        self._children: List[VirFSNode] = []
         for child in initial_children:
             self.add_child(child)
 
     def add_child(self, child: VirFSNode):
-        self._children.append(child)
+        if (existing := self._children.get(child.fs_name)) is not None:
+            if existing is child:
+                return
+            raise VirtualRepError(f"Attempted to add `{child.fs_name}` to `{self.path}` which already contains a node with that name")
+        self._children[child.fs_name] = child
+        self._ns_children.setdefault(child.ns_name, []).append(child)
+        self._children_cache = None
         child.link_parent(self)
+        self.touch()
 
     def delete_child(self, child: VirFSNode):
-        self._children.remove(child)
+        if not self.has_child(child):
+            raise VirtualRepError(f"Attempted to delete `{child.fs_name}` from `{self.path}` which does not contain it")
+        del self._children[child.fs_name]
+        ns_siblings = self._ns_children[child.ns_name]
+        ns_siblings.remove(child)
+        if len(ns_siblings) == 0:
+            del self._ns_children[child.ns_name]
+        self._children_cache = None
         child.delete()
+        self.touch()
 
     def delete(self) -> None:
         for child in self.children:
             self.delete_child(child)
         super().delete()
 
+    def _invalidate_ns_loc(self) -> None:
+        super()._invalidate_ns_loc()
+        for child in self._children.values():
+            child._invalidate_ns_loc()
+
+    def has_child(self, child: VirFSNode) -> bool:
+        return self._children.get(child.fs_name) is child
+
     @property
     def children(self) -> Tuple[VirFSNode, ...]:
-        return tuple(self._children)
+        # The tuple is cached until the children next change so repeated access is free and callers may mutate while iterating
+        if self._children_cache is None:
+            self._children_cache = tuple(self._children.values())
+        return self._children_cache
 
     def get_child_with_name(self, name: str) -> Optional[VirFSNode]:
-        for child in self._children:
-            if child.fs_name == name:
-                return child
-        return None
+        return self._children.get(name)
+
+    def get_child_with_ns_name(self, ns_name: str) -> Optional[VirFSNode]:
+        """Get the child a namespace location path element refers to (i.e. ignoring file extensions)"""
+        ns_children = self._ns_children.get(ns_name)
+        if ns_children is None:
+            return None
+        return ns_children[0]
 
 
 class VirNSFolder(VirFolder):
@@ -102,6 +164,9 @@ class VirNSFolder(VirFolder):
     def get_namespace_loc(self) -> str:
         return self._ns_loc
 
+    def _invalidate_ns_loc(self) -> None:
+        pass  # The namespace location is fixed so neither this nor any descendants change when re-parented
+
 
 class VirRawFile(VirFSNode):
 
@@ -114,12 +179,38 @@ class VirRawFile(VirFSNode):
         return self._content
 
 
+class VirLinesView(Sequence[ComCmd]):
+    """Read-only view onto the lines of a file, no copy of the lines is made"""
+
+    __slots__ = ("_lines", )
+
+    def __init__(self, lines: List[ComCmd]) -> None:
+        self._lines: List[ComCmd] = lines
+
+    @overload
+    def __getitem__(self, index: int) -> ComCmd:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[ComCmd]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ComCmd, Sequence[ComCmd]]:
+        return self._lines[index]
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __iter__(self) -> Iterator[ComCmd]:
+        return iter(self._lines)
+
+
 class VirBaseMCHYFile(VirFSNode):
     """Base class for MCHY files"""
 
     @property
     @abstractmethod
-    def lines(self) -> Tuple[ComCmd, ...]:
+    def lines(self) -> Sequence[ComCmd]:
         ...
 
     @abstractmethod
@@ -141,31 +232,43 @@ class VirMCHYFile(VirBaseMCHYFile):
         self._lines: List[ComCmd] = list(initial_contents)
 
     @property
-    def lines(self) -> Tuple[ComCmd, ...]:
-        return tuple(self._lines)
+    def lines(self) -> VirLinesView:
+        return VirLinesView(self._lines)
 
     def append(self, line: ComCmd) -> None:
         if not isinstance(line, ComCmd):
             raise VirtualRepError("Attempted to append non-command")
         self._lines.append(line)
+        self.touch()
+
+    def replace_lines(self, lines: Sequence[ComCmd]) -> None:
+        """Replace the entire contents of this file"""
+        for line in lines:
+            if not isinstance(line, ComCmd):
+                raise VirtualRepError("Attempted to add non-command")
+        self._lines = list(lines)
+        self.touch()
 
 
 class VirDynamicMCHYFile(VirBaseMCHYFile):
 
     class _Section:
 
-        def __init__(self, initial_contents: Sequence[ComCmd] = ()) -> None:
+        def __init__(self, owner: 'VirDynamicMCHYFile', initial_contents: Sequence[ComCmd] = ()) -> None:
+            self._owner: 'VirDynamicMCHYFile' = owner
             self._lines: List[ComCmd] = list(initial_contents)
 
         def append(self, line: ComCmd):
             self._lines.append(line)
+            self._owner.touch()
 
         def extend(self, lines: Sequence[ComCmd]) -> None:
             self._lines.extend(lines)
+            self._owner.touch()
 
         @property
-        def lines(self) -> Tuple[ComCmd, ...]:
-            return tuple(self._lines)
+        def lines(self) -> VirLinesView:
+            return VirLinesView(self._lines)
 
     class InsertionCursor:
 
@@ -181,22 +284,34 @@ class VirDynamicMCHYFile(VirBaseMCHYFile):
     def __init__(self, name: str, parent: Optional['VirFolder'] = None, initial_contents: Sequence[ComCmd] = ()) -> None:
         super().__init__(name, parent)
         self._file_sections: List[VirDynamicMCHYFile._Section] = []
+        self._lines_cache: Tuple[int, Tuple[ComCmd, ...]] = (-1, ())  # (revision, lines) of the last request for all lines
         self._active_section = self._new_section(initial_contents)
 
     def _new_section(self, initial_contents: Sequence[ComCmd] = ()) -> _Section:
-        new_section = VirDynamicMCHYFile._Section(initial_contents)
+        new_section = VirDynamicMCHYFile._Section(self, initial_contents)
         self._file_sections.append(new_section)
         return new_section
 
     @property
     def lines(self) -> Tuple[ComCmd, ...]:
-        return tuple(line for section in self._file_sections for line in section.lines)
+        if self._lines_cache[0] != self.revision:
+            self._lines_cache = (self.revision, tuple(line for section in self._file_sections for line in section.lines))
+        return self._lines_cache[1]
 
     def append(self, line: ComCmd) -> None:
         if not isinstance(line, ComCmd):
             raise VirtualRepError("Attempted to append non-command")
         self._active_section.append(line)
 
+    def replace_lines(self, lines: Sequence[ComCmd]) -> None:
+        """Replace the entire contents of this file, any outstanding insertion cursors will no longer affect it"""
+        for line in lines:
+            if not isinstance(line, ComCmd):
+                raise VirtualRepError("Attempted to add non-command")
+        self._file_sections = []
+        self._active_section = self._new_section(lines)
+        self.touch()
+
     def reserve_spot(self) -> InsertionCursor:
         cursor = VirDynamicMCHYFile.InsertionCursor(self._new_section())
         self._active_section = self._new_section()
@@ -1,15 +1,19 @@
 
 import shutil
 import sys
+from typing import TYPE_CHECKING, Dict
 from mchy.common.com_cmd import ComCmd
 from mchy.common.config import Config
 from mchy.stmnt.struct.linker import SmtLinker
 from mchy.virtual.helpers import json_dump
-from mchy.virtual.to_disk import to_disk
+from mchy.virtual.to_disk import apply_incremental_write, is_generated_zip, nest_zip, plan_incremental_write, to_zip
 from mchy.virtual.vir_dirs import VirDynamicMCHYFile, VirFolder, VirMCHYFile, VirNSFolder, VirRawFile
 from os import path as os_path
 import os
 
+if TYPE_CHECKING:
+    from mchy.virtual.optimize import VirOptimisationStats
+
 
 def _make_archive(source, destination):
     # Taken From: https://stackoverflow.com/questions/32640053 -- Make42
@@ -25,6 +29,7 @@ class VirDP:
     def __init__(self, config: Config):
         self._config: Config = config
         self._linker: SmtLinker = SmtLinker(config.project_namespace, config.recursion_limit)
+        self.optimisation_stats: Dict[str, 'VirOptimisationStats'] = {}  # Populated by the optimizer, keyed by optimisation name
 
         # Virtual structure
         self._dp_superroot = VirFolder("datapacks")
@@ -32,11 +37,13 @@ class VirDP:
         self._mcmeta = VirRawFile("pack.mcmeta", self._root, self._get_pack_dot_mcmeta())
         self._generated_proof_file = VirRawFile("generated.txt", self._root, "Datapack generated by the MCHY datapack generator (https://github.com/jacobbox/mchy)")
         self._top_data_fld = VirFolder("data", self._root)
-        fs_fld_functags = VirFolder("functions", VirFolder("tags", VirFolder("minecraft", self._top_data_fld)))
+        # 1.21 renamed the plural datapack folders to singular
+        functions_fld_name = "function" if config.supports(Config.Feature.SINGULAR_FOLDERS) else "functions"
+        fs_fld_functags = VirFolder(functions_fld_name, VirFolder("tags", VirFolder("minecraft", self._top_data_fld)))
         VirRawFile("load.json", fs_fld_functags, json_dump({"values": [f"{config.project_namespace}:generated/internal_root/load_master"]}))
-        VirRawFile("tick.json", fs_fld_functags, json_dump({"values": [f"{config.project_namespace}:generated/internal_root/tick_master"]}))
+        self._tick_tag = VirRawFile("tick.json", fs_fld_functags, json_dump({"values": [f"{config.project_namespace}:generated/internal_root/tick_master"]}))
         self._prj_ns = VirFolder(config.project_namespace, self._top_data_fld)
-        self._generated = VirNSFolder(f"{config.project_namespace}:generated", "generated", VirFolder("functions", self._prj_ns))
+        self._generated = VirNSFolder(f"{config.project_namespace}:generated", "generated", VirFolder(functions_fld_name, self._prj_ns))
         fs_fld_internal_func_root = VirFolder("internal_root", self._generated)
         fs_fld_imported_func_root = VirFolder("imported_root", self._generated)
         self._public_funcs = VirFolder("public", self._generated)
@@ -53,8 +60,13 @@ class VirDP:
         self._extra_frags_import_ns = VirFolder("import_ns", fs_fld_extra_frags)
         self._extra_frags_public = VirFolder("public", fs_fld_extra_frags)
 
+    def unregister_tick_master(self) -> None:
+        """Remove the tick_master file & the `minecraft:tick` function tag running it, for when there is nothing to run each tick"""
+        self._tick_tag.delete()
+        self._tick_master.delete()
+
     def _get_pack_format(self) -> int:
-        return 12  # TODO: update to reflect config target version
+        return self._config.pack_format
 
     def _get_pack_dot_mcmeta(self) -> str:
         return json_dump(
@@ -117,26 +129,68 @@ class VirDP:
     def linker(self) -> SmtLinker:
         return self._linker
 
-    def write_to_disk(self):
-        prj_path = os_path.join(self._config.output_path, self._config.project_name)
-        if os_path.exists(prj_path):
-            self._config.logger.very_verbose("DISK: Output path already exists, checking if we can overwrite")
-            # check file is what we think it is:
-            if os_path.exists(os_path.join(prj_path, "pack.mcmeta")) and os_path.exists(os_path.join(prj_path, "generated.txt")):  # Is a datapack that we generated
-                if self._config.do_backup:
-                    self._config.logger.very_verbose("DISK: We made this, backing up old datapack")
-                    _make_archive(prj_path, prj_path+".zip")
-                    self._config.logger.very_verbose("DISK: Backed up existing datapack")
-                else:
-                    self._config.logger.very_verbose("DISK: We made this, skipping backup due to config")
-                shutil.rmtree(prj_path)
-                self._config.logger.very_verbose("DISK: Deleted old datapack")
-            else:
-                self._config.logger.error(
-                    f"File-Exists: Attempted to write to output file '{prj_path}' however it already exists and was missing generated markers that would imply " +
-                    f"it can safely be overwritten.  Program stopping to prevent damage, please delete/move output folder and try again"
-                )
-                sys.exit(1)
-        self._config.logger.very_verbose("DISK: Writing files to disk")
-        to_disk(self._root, prj_path)
-        self._config.logger.very_verbose("DISK: Done!")
+    @property
+    def root(self) -> VirFolder:
+        return self._root
+
+    def write_to_disk(self) -> int:
+        return write_datapack(self._root, self._config)
+
+
+def write_datapack(root: VirFolder, config: Config) -> int:
+    """Write the datapack folder `root` to the output location given by `config`, returning the number of files written"""
+    prj_path = os_path.join(config.output_path, config.project_name)
+    if config.output_zip:
+        return _write_datapack_zip(root, prj_path + ".zip", config)
+    if os_path.exists(prj_path):
+        config.logger.very_verbose("DISK: Output path already exists, checking if we can overwrite")
+        # check file is what we think it is:
+        if not (os_path.exists(os_path.join(prj_path, "pack.mcmeta")) and os_path.exists(os_path.join(prj_path, "generated.txt"))):  # Not a datapack we generated
+            config.logger.error(
+                f"File-Exists: Attempted to write to output file '{prj_path}' however it already exists and was missing generated markers that would imply " +
+                f"it can safely be overwritten.  Program stopping to prevent damage, please delete/move output folder and try again"
+            )
+            sys.exit(1)
+        plan = plan_incremental_write(root, prj_path)
+        if plan.is_empty:
+            config.logger.very_verbose(f"DISK: Existing datapack is already up to date ({plan.unchanged} files unchanged)")
+            return 0
+        if config.do_backup:
+            config.logger.very_verbose("DISK: We made this, backing up old datapack")
+            _make_archive(prj_path, prj_path+".backup.zip")  # Not `.zip`, that is where zip mode writes the datapack
+            config.logger.very_verbose("DISK: Backed up existing datapack")
+        else:
+            config.logger.very_verbose("DISK: We made this, skipping backup due to config")
+    else:
+        os.makedirs(prj_path)
+        plan = plan_incremental_write(root, prj_path)
+    config.logger.very_verbose(
+        f"DISK: Writing {len(plan.writes)} files, deleting {len(plan.deletes)} files & leaving {plan.unchanged} files unchanged"
+    )
+    apply_incremental_write(plan)
+    config.logger.very_verbose("DISK: Done!")
+    return len(plan.writes)
+
+
+def _write_datapack_zip(root: VirFolder, zip_path: str, config: Config) -> int:
+    if os_path.exists(zip_path):
+        config.logger.very_verbose("DISK: Output archive already exists, checking if we can overwrite")
+        if not is_generated_zip(zip_path):  # Not a datapack we generated
+            config.logger.error(
+                f"File-Exists: Attempted to write to output archive '{zip_path}' however it already exists and was missing generated markers that " +
+                f"would imply it can safely be overwritten.  Program stopping to prevent damage, please delete/move output archive and try again"
+            )
+            sys.exit(1)
+        if config.do_backup:
+            # Nested under `<project>/` like the folder backup, a top level `pack.mcmeta` would make the game load the backup as a datapack
+            backup_path = os_path.splitext(zip_path)[0] + ".backup.zip"
+            nest_zip(zip_path, backup_path, config.project_name)
+            config.logger.very_verbose(f"DISK: We made this, backed up old archive to '{backup_path}'")
+        else:
+            config.logger.very_verbose("DISK: We made this, skipping backup due to config")
+    else:
+        os.makedirs(config.output_path, exist_ok=True)
+    file_count = to_zip(root, zip_path)
+    config.logger.very_verbose(f"DISK: Wrote {file_count} files to archive '{zip_path}'")
+    config.logger.very_verbose("DISK: Done!")
+    return file_count
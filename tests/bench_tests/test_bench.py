@@ -0,0 +1,60 @@
+from benchmarks.generate import ProgramShape, generate_program
+from benchmarks.run import BenchCase, build_cases, compare, run_all
+from typing import Dict, List
+from mchy.cmdln.main import main_by_arg
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.analysis import FuncLiveness
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.stmnt.struct.function import SmtFunc
+import pytest
+
+
+@pytest.mark.parametrize("shape", [
+    ProgramShape(),
+    ProgramShape(functions=0),
+    ProgramShape(functions=3, nesting_depth=0, loops=0, chain_length=0),
+    ProgramShape(functions=2, nesting_depth=5, loops=3, chain_length=6, recursion=True),
+])
+def test_generated_programs_compile(shape: ProgramShape, tmp_path):
+    assert main_by_arg(generate_program(shape), Config(output_path=str(tmp_path))).success
+
+
+def test_case_names_unique():
+    names = [case.name for case in build_cases()]
+    assert len(names) == len(set(names))
+
+
+def test_compare():
+    baseline = {"results": [{"case": "a", "stages": {"parse": 0.1, "write": 0.0001}}]}
+    current = {"results": [{"case": "a", "stages": {"parse": 0.2, "write": 0.0005}}, {"case": "new", "stages": {"parse": 5.0}}]}
+    assert compare(current, baseline, 1.25) == [("a", "parse", 0.1, 0.2)]
+    assert compare(current, baseline, 3) == []
+
+
+def test_run_all():
+    results = run_all([BenchCase("tiny", ProgramShape(functions=1), 4)], repeats=1, verbose=False)
+    assert results["results"][0]["case"] == "tiny"
+    assert set(results["results"][0]["stages"].keys()) == {"parse", "contextual", "statement", "virtual", "write"}
+
+
+@pytest.mark.parametrize("optimisation", [Config.Optimize.O2, Config.Optimize.O3])
+def test_liveness_builds_independent_of_loop_count(optimisation: Config.Optimize, monkeypatch):
+    # The liveness based optimisations used to rebuild liveness for every change they made, so the builds grew with the number of loops
+    builds: Dict[SmtFunc, int] = {}
+    original_init = FuncLiveness.__init__
+
+    def counting_init(self, func, candidates) -> None:
+        builds[func] = builds.get(func, 0) + 1
+        original_init(self, func, candidates)
+
+    monkeypatch.setattr(FuncLiveness, "__init__", counting_init)
+    builds_by_loops: Dict[int, List[int]] = {}
+    for loops in (2, 8):
+        builds.clear()
+        config = Config(optimisation=optimisation)
+        smt_module = conv_cst_smt(conv_ast_cst(mchy_parse(generate_program(ProgramShape(functions=2, loops=loops)), config), config=config), config=config)
+        assert max(builds.values()) <= sum(stats.runs for stats in smt_module.optimisation_stats.values())
+        builds_by_loops[loops] = sorted(builds.values())
+    assert builds_by_loops[2] == builds_by_loops[8]
@@ -34,6 +34,12 @@ def config_diff(observed: Config, expected: Config) -> List[str]:
         diffs.append(("verbosity", str(observed.verbosity.name), str(expected.verbosity.name)))
     if observed.optimisation != expected.optimisation:
         diffs.append(("optimisation", str(observed.optimisation.name), str(expected.optimisation.name)))
+    if observed.output_zip != expected.output_zip:
+        diffs.append(("output zip", str(observed.output_zip), str(expected.output_zip)))
+    if observed.storage_stack != expected.storage_stack:
+        diffs.append(("storage stack", str(observed.storage_stack), str(expected.storage_stack)))
+    if observed.target_version != expected.target_version:
+        diffs.append(("target version", str(observed.target_version), str(expected.target_version)))
 
     diff_str: List[str] = []
     for field, ob, ex in diffs:
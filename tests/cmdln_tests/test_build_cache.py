@@ -0,0 +1,106 @@
+from mchy.cmdln import main as main_module
+from mchy.cmdln.build_cache import BuildCache
+from mchy.cmdln.main import main_by_arg
+from mchy.common.config import Config
+from mchy.stmnt.struct.function import SmtFunc
+from mchy.virtual.to_disk import MANIFEST_FILE_NAME
+import os
+import pytest
+
+
+CODE = """
+var x: int = 5
+def foo() -> int {
+    return x + 1
+}
+print(foo())
+"""
+
+
+def _read_tree(path: str):
+    tree = {}
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            if file_name != MANIFEST_FILE_NAME:
+                with open(os.path.join(dir_path, file_name), "rb") as file:
+                    tree[os.path.relpath(os.path.join(dir_path, file_name), path)] = file.read()
+    return tree
+
+
+def _config(tmp_path, **kwargs) -> Config:
+    return Config(
+        output_path=str(tmp_path / "out"), build_cache_path=str(tmp_path / "cache"), inclusion_path=str(tmp_path), do_backup=False, **kwargs
+    )
+
+
+def _fail_compile(*args, **kwargs):
+    raise AssertionError("Compilation ran on a build cache hit")
+
+
+def test_cache_hit_skips_compilation(tmp_path, monkeypatch):
+    config = _config(tmp_path)
+    main_by_arg(CODE, config)
+    out_path = os.path.join(config.output_path, config.project_name)
+    expected = _read_tree(out_path)
+    assert len(expected) >= 1
+
+    monkeypatch.setattr(main_module, "mchy_parse", _fail_compile)
+    monkeypatch.setattr(main_module, "conv_smt_vir", _fail_compile)
+    main_by_arg(CODE, config)  # Unchanged - should not recompile
+    os.remove(os.path.join(out_path, next(path for path in expected.keys() if path.endswith(".mcfunction"))))
+    main_by_arg(CODE, config)  # Restored from cache
+    assert _read_tree(out_path) == expected
+
+
+def test_cache_miss_on_change(tmp_path):
+    config = _config(tmp_path)
+    key = BuildCache.get_key(CODE, config)
+    assert key is not None
+    assert BuildCache.get_key(CODE, config) == key
+    assert BuildCache.get_key(CODE + "\nprint(1)", config) != key
+    assert BuildCache.get_key(CODE, _config(tmp_path, recursion_limit=5)) != key
+    assert BuildCache.get_key(CODE, _config(tmp_path, optimisation=Config.Optimize.O3)) != key
+    assert BuildCache.get_key(CODE, _config(tmp_path, debug_mode=True)) != key
+    assert BuildCache.get_key(CODE, _config(tmp_path, project_namespace="other")) != key
+
+
+def test_compile_time_uncached(tmp_path):
+    assert BuildCache.get_key('var t: str! = world.meta.compile_time', _config(tmp_path)) is None
+
+
+def test_inclusion_change_invalidates(tmp_path, monkeypatch):
+    with open(tmp_path / "block_tag.json", "w") as file:
+        file.write('{"values": ["minecraft:stone"]}')
+    code = "include 'block_tag.json' at tags.blocks"
+    config = _config(tmp_path)
+    main_by_arg(code, config)
+    out_file = os.path.join(config.output_path, config.project_name, "data", "tags", "blocks", "block_tag.json")
+    with open(out_file) as file:
+        assert "stone" in file.read()
+
+    with open(tmp_path / "block_tag.json", "w") as file:
+        file.write('{"values": ["minecraft:dirt"]}')
+    cache = BuildCache(str(tmp_path / "cache"), config)
+    key = BuildCache.get_key(code, config)
+    assert key is not None
+    assert cache.lookup(key) is None
+    main_by_arg(code, config)
+    with open(out_file) as file:
+        assert "dirt" in file.read()
+
+
+def test_cache_hit_reports_included_files(tmp_path):
+    with open(tmp_path / "block_tag.json", "w") as file:
+        file.write('{"values": ["minecraft:stone"]}')
+    code = "include 'block_tag.json' at tags.blocks"
+    config = _config(tmp_path)
+    assert main_by_arg(code, config).included_files == [str(tmp_path / "block_tag.json")]
+    report = main_by_arg(code, config)
+    assert report.cache_hit
+    assert report.included_files == [str(tmp_path / "block_tag.json")]
+
+
+@pytest.mark.parametrize("key", ["initial", "mchy/foo/world"])
+def test_smt_func_id_stable(key: str):
+    assert SmtFunc(key).id == SmtFunc(key).id
+    assert SmtFunc(key).id != SmtFunc(key + "_").id
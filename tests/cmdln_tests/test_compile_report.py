@@ -0,0 +1,45 @@
+from mchy.cmdln.main import main_by_arg
+from mchy.common.config import Config
+import os
+
+
+CODE = """
+var x: int = 5
+def foo(a: int) -> int {
+    if a > 2 {
+        return a
+    }
+    return x + 1
+}
+print(foo(3))
+"""
+
+
+def test_report_stages_and_counts(tmp_path):
+    config = Config(output_path=str(tmp_path), do_backup=False, optimisation=Config.Optimize.O3)
+    report = main_by_arg(CODE, config)
+    assert report.success
+    assert [stage.name for stage in report.stages] == ["parse", "contextual", "statement", "virtual", "write"]
+    assert all(stage.wall_time >= 0 and stage.cpu_time >= 0 and stage.peak_memory is None for stage in report.stages)
+    assert report.ast_nodes >= 10
+    assert report.ctx_statements >= 4
+    assert report.smt_commands["foo_world"] >= 1
+    assert report.vir_files >= 1 and report.vir_lines >= 1 and report.bytes_generated >= 1
+    assert report.files_written == report.vir_files
+    assert len(report.optimisation_passes) >= 1
+
+    rewrite_report = main_by_arg(CODE, config)
+    assert rewrite_report.files_written == 0
+
+
+def test_report_failure(tmp_path):
+    report = main_by_arg("var x: int = 'hi'", Config(output_path=str(tmp_path)))
+    assert not report.success
+    assert [stage.name for stage in report.stages][-1] == "contextual"
+
+
+def test_report_memory_and_profile(tmp_path):
+    profile_path = os.path.join(tmp_path, "prof")
+    report = main_by_arg(CODE, Config(output_path=str(tmp_path), profile_path=profile_path))
+    assert all(stage.peak_memory is not None and stage.peak_memory > 0 for stage in report.stages)
+    assert sorted(os.listdir(profile_path)) == ["1_parse.pstats", "2_contextual.pstats", "3_statement.pstats", "4_virtual.pstats", "5_write.pstats"]
@@ -24,6 +24,11 @@ TEST_OUP_LOC = os_path.join(TEST_RES_LOC, "oup")
     ("f.mchy", ["-o3", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, optimisation=Config.Optimize.O3)),
     ("f.mchy", ["-o1", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, optimisation=Config.Optimize.O1)),
     ("f.mchy", ["-o0", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, optimisation=Config.Optimize.NOTHING)),
+    ("f.mchy", ["--zip", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, output_zip=True)),
+    ("f.mchy", ["--no-zip", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, output_zip=False)),
+    ("f.mchy", ["--storage-stack", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, storage_stack=True)),
+    ("f.mchy", ["--target-version", "1.20.4", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, target_version=(1, 20, 4))),
+    ("f.mchy", ["--target-version", "1.21", "f.mchy"], Config("F", "f", output_path=TEST_RES_LOC, target_version=(1, 21, 0))),
 ])
 def test_config_generated_correctly(args: List[str], expected_config: Config, expected_filename: str):
     with change_cwd(TEST_RES_LOC):
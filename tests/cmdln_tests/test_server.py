@@ -0,0 +1,100 @@
+from io import StringIO
+from mchy.cmd_modules.name_spaces import Namespace
+from mchy.cmdln.server import serve, watch
+from mchy.common.config import Config
+from mchy.contextual.struct.module import CtxModule
+from mchy.errors import ConversionError
+from tests.helpers.tst_ns import ROOT_TESTING_NAMESPACE
+import json
+import os
+import pytest
+
+
+CODE = "var x: int = 5\nprint(x)\n"
+
+
+def _write_src(tmp_path) -> str:
+    src_path = os.path.join(tmp_path, "prog.mchy")
+    with open(src_path, "w") as file:
+        file.write(CODE)
+    return src_path
+
+
+def test_serve_requests(tmp_path):
+    src_path = _write_src(tmp_path)
+    args = [src_path, "-o", os.path.join(tmp_path, "out"), "-j", os.path.join(tmp_path, "none.json"), "--no-backup"]
+    requests = [json.dumps({"args": args}), json.dumps({"args": args}), "not json", json.dumps({"args": "bad"}), json.dumps({"command": "exit"}), json.dumps({"args": args})]
+    oup = StringIO()
+    serve(StringIO("\n".join(requests) + "\n"), oup)
+    responses = [json.loads(line) for line in oup.getvalue().splitlines()]
+    assert len(responses) == 5, "Request after exit was handled"
+    assert responses[0]["ok"] and responses[1]["ok"]
+    assert set(responses[0]["timings"].keys()) == {"parse", "contextual", "statement", "virtual", "write"}
+    assert not responses[2]["ok"] and not responses[3]["ok"]
+    assert responses[4] == {"ok": True}
+    assert os.path.exists(os.path.join(tmp_path, "out", "Prog", "pack.mcmeta"))
+
+
+def test_watch_rebuilds_on_change(tmp_path, capsys):
+    src_path = _write_src(tmp_path)
+    args = [src_path, "-o", os.path.join(tmp_path, "out"), "-j", os.path.join(tmp_path, "none.json"), "--no-backup"]
+    checks = 0
+
+    def should_stop() -> bool:
+        nonlocal checks
+        checks += 1
+        if checks == 3:
+            with open(src_path, "w") as file:
+                file.write(CODE + "print(x + 1)\n")
+            os.utime(src_path, (0, 0))  # Guarantee the mtime differs
+        return checks > 4
+
+    watch(args, poll_interval=0, should_stop=should_stop)
+    assert capsys.readouterr().out.count("Rebuilt in") == 2
+
+
+def test_watch_rebuilds_on_included_file_change(tmp_path, capsys):
+    src_path = os.path.join(tmp_path, "prog.mchy")
+    with open(src_path, "w") as file:
+        file.write("include 'block_tag.json' at tags.blocks\n")
+    tag_path = os.path.join(tmp_path, "block_tag.json")
+    with open(tag_path, "w") as file:
+        file.write('{"values": ["minecraft:stone"]}')
+    args = [src_path, "-o", os.path.join(tmp_path, "out"), "-j", os.path.join(tmp_path, "none.json"), "--no-backup"]
+    checks = 0
+
+    def should_stop() -> bool:
+        nonlocal checks
+        checks += 1
+        if checks == 3:
+            with open(tag_path, "w") as file:
+                file.write('{"values": ["minecraft:dirt"]}')
+            os.utime(tag_path, (0, 0))  # Guarantee the mtime differs
+        return checks > 4
+
+    watch(args, poll_interval=0, should_stop=should_stop)
+    assert capsys.readouterr().out.count("Rebuilt in") == 2
+    with open(os.path.join(tmp_path, "out", "Prog", "data", "tags", "blocks", "block_tag.json")) as file:
+        assert "dirt" in file.read()
+
+
+def test_import_ns_fast_path_matches():
+    std_ns = Namespace.get_namespace("std")
+    first = CtxModule(Config())
+    first.import_ns(std_ns)
+    second = CtxModule(Config())
+    second.import_ns(std_ns)
+    assert [func.get_name() for func in first.get_import_functions()] == [func.get_name() for func in second.get_import_functions()]
+    assert first.get_struct("Color") is not None and second.get_struct("Color") is not None
+    assert first.get_struct("Color") is not second.get_struct("Color")
+
+
+def test_import_ns_fast_path_rechecks_changed_members():
+    std_funcs = Namespace.get_namespace("std").ifuncs
+    clean_ns = Namespace("clean_cache", ROOT_TESTING_NAMESPACE)
+    clean_ns.ifuncs = [std_funcs[0], std_funcs[1]]
+    CtxModule(Config()).import_ns(clean_ns)
+    clashing_ns = Namespace("clean_cache", ROOT_TESTING_NAMESPACE)  # Same name & member counts as the clean namespace
+    clashing_ns.ifuncs = [std_funcs[0], std_funcs[0]]
+    with pytest.raises(ConversionError):
+        CtxModule(Config()).import_ns(clashing_ns)
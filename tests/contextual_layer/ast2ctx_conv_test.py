@@ -205,6 +205,35 @@ def test_ticking_func_registered():
     assert module.get_ticking_funcs() == [module.get_function_oerr(ExecType(ExecCoreTypes.WORLD, False), "main_tick")]
 
 
+def test_periodic_ticking_func_registered():
+    ast_root = Root(Scope(
+        FunctionDecl("main_tick", TypeNode("world"), TypeNode("null"), Scope(CodeBlock()), [Decorator(ExprLitIdent("ticking"))], ComLoc()),
+        FunctionDecl("slow_tick", TypeNode("world"), TypeNode("null"), Scope(CodeBlock()), [Decorator(ExprLitIdent("ticking_every_20"))], ComLoc()),
+    ))
+
+    module = convert(ast_root, Config())
+
+    main_tick = module.get_function_oerr(ExecType(ExecCoreTypes.WORLD, False), "main_tick")
+    slow_tick = module.get_function_oerr(ExecType(ExecCoreTypes.WORLD, False), "slow_tick")
+    assert module.get_ticking_funcs() == [main_tick, slow_tick]
+    assert module.get_ticking_period(main_tick) == 1
+    assert module.get_ticking_period(slow_tick) == 20
+
+
+def test_time_sliced_func_registered():
+    ast_root = Root(Scope(
+        FunctionDecl("plain", TypeNode("world"), TypeNode("null"), Scope(CodeBlock()), [], ComLoc()),
+        FunctionDecl("sliced", TypeNode("world"), TypeNode("null"), Scope(CodeBlock()), [Decorator(ExprLitIdent("iterations_per_tick_50"))], ComLoc()),
+    ))
+
+    module = convert(ast_root, Config())
+
+    plain = module.get_function_oerr(ExecType(ExecCoreTypes.WORLD, False), "plain")
+    sliced = module.get_function_oerr(ExecType(ExecCoreTypes.WORLD, False), "sliced")
+    assert module.get_iterations_per_tick(plain) is None
+    assert module.get_iterations_per_tick(sliced) == 50
+
+
 def test_public_func_registered():
     ast_root = Root(Scope(
         FunctionDecl("give_apple", TypeNode("world"), TypeNode("null"), Scope(CodeBlock()), [Decorator(ExprLitIdent("public"))], ComLoc()),
@@ -69,6 +69,9 @@ var random_player: Player = world.get_player("random").find()
     ([], """@ticking\ndef foo(nope: int){}""", ["Ticking functions cannot have any parameters", "Consider deleting params"], ComLoc(2, 8, 2, 12)),
     ([], """@public\ndef foo(nope: int){}""", ["Published functions cannot have any parameters", "Consider deleting params"], ComLoc(2, 8, 2, 12)),
     ([], """@ticking\ndef foo() -> int {}""", ["Ticking functions cannot return anything", "Consider deleting return type"], ComLoc(2, 13, 2, 16)),
+    ([], """@ticking_every_0\ndef foo(){}""", ["Ticking functions cannot run every 0 ticks", "@ticking"], ComLoc(1, 1, 1, 16)),
+    ([], """@iterations_per_tick_0\ndef foo(){}""", ["must run at least 1 loop iteration per tick", "@iterations_per_tick_1"], ComLoc(1, 1, 1, 22)),
+    ([], """@iterations_per_tick_5\ndef foo() -> int {return 1}""", ["Time sliced functions cannot return anything"], ComLoc(2, 13, 2, 16)),
     ([], """@made_up_decorator\ndef foo(){}""", ["Unknown decorator", "made_up_decorator", "ticking"], ComLoc(1, 1, 1, 18)),
     # Var assignment & definition
     ([], """var x: int\nvar x: int""", ["x", "already defined in current scope", "var x: int"], ComLoc(2, 4, 2, 5)),
@@ -1,4 +1,9 @@
-
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.errors import ConversionError
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.virtual.generation import convert as conv_smt_vir
 from tests.e2e.targeted.helpers import any_line_matches, conversion_helper, get_file_matching_name, get_folder_matching_name
 
 import pytest
@@ -20,3 +25,98 @@ def test_recursion_factorial():
     """
     ast_root, ctx_module, smt_module, vir_dp = conversion_helper(code)
     # This test passes so long as converting recursive functions does not yield any error
+
+
+def _stack_folders(vir_dp, func_name: str):
+    func_fld = get_folder_matching_name(vir_dp.mchy_func_fld, func_name + r"_.*")
+    return sorted(child.fs_name for child in func_fld.children)
+
+
+def test_non_recursive_functions_have_single_stack_level():
+    code = """
+
+    def leaf(n: int) -> int{
+        return n + 1
+    }
+
+    def middle(n: int) -> int{
+        return leaf(n) * 2
+    }
+
+    print(middle(3))
+
+    """
+    ast_root, ctx_module, smt_module, vir_dp = conversion_helper(code)
+    assert _stack_folders(vir_dp, "middle") == ["s1"]
+    assert _stack_folders(vir_dp, "leaf") == ["s2"]
+    middle_objs = [obj for obj in vir_dp.linker.get_all_sb_objs() if "-middle_" in obj]
+    assert len(middle_objs) >= 1
+    assert all("-r001" in obj for obj in middle_objs)
+
+
+def test_recursive_functions_reach_recursion_limit():
+    code = """
+
+    def recursive_sum(n: int) -> int{
+        if n == 0 {
+            return 0
+        } else {
+            return n + recursive_sum(n - 1)
+        }
+    }
+
+    print(recursive_sum(3))
+
+    """
+    ast_root, ctx_module, smt_module, vir_dp = conversion_helper(code)
+    folders = _stack_folders(vir_dp, "recursive_sum")
+    assert folders == sorted(f"s{rix}" for rix in range(1, 33))
+    error_stub = get_file_matching_name(get_folder_matching_name(get_folder_matching_name(vir_dp.mchy_func_fld, r"recursive_sum_.*"), "s32"), "run.*")
+    assert any_line_matches(error_stub, r"^function .*error_state_begin$")
+
+
+def test_storage_stack_generates_each_function_once():
+    code = """
+
+    def recursive_sum(n: int) -> int{
+        if n == 0 {
+            return 0
+        } else {
+            return n + recursive_sum(n - 1)
+        }
+    }
+
+    print(recursive_sum(3))
+
+    """
+    config = Config(storage_stack=True)
+    vir_dp = conv_smt_vir(conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config), config=config)
+    assert _stack_folders(vir_dp, "recursive_sum") == ["fragments", "recursion_limit.mcfunction", "run.mcfunction"]
+    assert not any("-r0" in obj for obj in vir_dp.linker.get_all_sb_objs())
+    frag_fld = get_folder_matching_name(get_folder_matching_name(vir_dp.mchy_func_fld, r"recursive_sum_.*"), "fragments")
+    recursing_frag = [frag for frag in frag_fld.children if any_line_matches(frag, r"^data modify storage prj_ns:mchy mchy_stack append value \{\}$")]
+    assert len(recursing_frag) == 1
+    assert any_line_matches(recursing_frag[0], r"^execute store result storage prj_ns:mchy mchy_stack\[-1\]\.(var_[0-9]+) int 1 run scoreboard players get \1 .*$")
+    assert any_line_matches(recursing_frag[0], r"^execute store result score (var_[0-9]+) .* run data get storage prj_ns:mchy mchy_stack\[-1\]\.\1$")
+    assert any_line_matches(recursing_frag[0], r"^data remove storage prj_ns:mchy mchy_stack\[-1\]$")
+
+
+def test_storage_stack_rejects_entities_used_after_recursion():
+    code = """
+
+    def recursive_count(n: int) -> int{
+        var p: Player = world.get_player("Steve").find()
+        if n == 0 {
+            return 0
+        }
+        var got: int = recursive_count(n - 1)
+        p.tag_add("counted")
+        return got + 1
+    }
+
+    print(recursive_count(3))
+
+    """
+    config = Config(storage_stack=True)
+    with pytest.raises(ConversionError, match="entity variable"):
+        conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config)
@@ -0,0 +1,156 @@
+from mchy.errors import SimulationError
+from mchy.sim.interpreter import Simulator
+from mchy.sim.nbt import get_path, parse_snbt, remove_path, render_snbt, set_path
+from mchy.sim.selectors import Selector
+from mchy.sim.world import INT_MAX, INT_MIN, SimWorld, wrap_int
+import pytest
+
+
+def _sim(**functions: str) -> Simulator:
+    return Simulator({f"t:{name}": body.strip().splitlines() for name, body in functions.items()}, {"minecraft:load": ["t:load"], "minecraft:tick": ["t:tick"]})
+
+
+@pytest.mark.parametrize("op, lhs, rhs, expected", [
+    ("+=", 7, 3, 10),
+    ("-=", 7, 3, 4),
+    ("*=", INT_MAX, 2, -2),
+    ("/=", -7, 2, -4),
+    ("/=", 7, 0, 7),
+    ("%=", -7, 3, 2),
+    ("%=", 7, -3, -2),
+    ("%=", 7, 0, 7),
+    ("<", 7, 3, 3),
+    (">", 7, 3, 7),
+    ("=", 7, 3, 3),
+    ("/=", INT_MIN, -1, INT_MIN),
+])
+def test_score_operations(op: str, lhs: int, rhs: int, expected: int):
+    sim = _sim(load=f"""
+scoreboard objectives add obj dummy
+scoreboard players set a obj {lhs}
+scoreboard players set b obj {rhs}
+scoreboard players operation a obj {op} b obj
+""")
+    sim.load()
+    assert sim.get_score("a", "obj") == expected
+
+
+def test_wrap_int():
+    assert wrap_int(INT_MAX + 1) == INT_MIN
+    assert wrap_int(INT_MIN - 1) == INT_MAX
+    assert wrap_int(5) == 5
+
+
+def test_execute_store_and_conditions():
+    sim = _sim(load="""
+# comment
+scoreboard objectives add obj dummy
+scoreboard players set x obj 5
+execute store result score a obj run execute if score x obj matches 5..
+execute store result score b obj run execute if score x obj matches ..4
+execute store success score c obj unless score x obj matches 6
+execute store result score d obj run scoreboard players get x obj
+scoreboard players set y obj 5
+execute if score x obj = y obj run scoreboard players add e obj 1
+execute if score x obj > y obj run scoreboard players add e obj 10
+execute store result storage t:s nums.x int 2 run scoreboard players get x obj
+execute store result score f obj run data get storage t:s nums.x
+""")
+    sim.load()
+    assert [sim.get_score(name, "obj") for name in "abcdef"] == [1, 0, 1, 5, 1, 10]
+    assert sim.world.storage["t:s"] == {"nums": {"x": 10}}
+
+
+def test_entities_tags_and_selectors():
+    sim = _sim(load="""
+scoreboard objectives add obj dummy
+summon minecraft:zombie ~ ~ ~ {Tags:["mob","a"]}
+summon minecraft:zombie ~ ~ ~ {Tags:["mob"]}
+summon minecraft:pig
+tag @e[type=zombie,tag=!a] add b
+execute as @e[tag=mob] run scoreboard players add count obj 1
+execute as @e[tag=mob,limit=1] run tag @s add first
+execute store result score mobs obj if entity @e[tag=mob]
+execute store result score players obj if entity @a
+kill @e[type=!minecraft:player,tag=!mob]
+execute as @a[name=Steve] run scoreboard players set @s obj 3
+""")
+    sim.world.add_player("Steve")
+    sim.load()
+    assert sim.get_score("count", "obj") == 2 and sim.get_score("mobs", "obj") == 2 and sim.get_score("players", "obj") == 1
+    assert sim.get_score("Steve", "obj") == 3
+    assert [sorted(entity.tags) for entity in sim.world.entities] == [[], ["a", "first", "mob"], ["b", "mob"]]
+
+
+def test_selector_parsing():
+    selector = Selector.parse("@a[tag=x, limit=1, sort=arbitrary,scores={a=1..,b=..2}]")
+    assert selector.variable == "a"
+    assert selector.arguments == [("tag", "x"), ("limit", "1"), ("sort", "arbitrary"), ("scores", "{a=1..,b=..2}")]
+    world = SimWorld()
+    steve = world.add_player("Steve")
+    world.add_player("Alex")
+    world.set_score("Steve", "a", 1)
+    world.set_score("Steve", "b", 2)
+    assert Selector.parse("@a[scores={a=1..,b=..2}]").select(world, None) == [steve]
+    assert Selector.parse("@s").select(world, None) == []
+    with pytest.raises(SimulationError):
+        Selector.parse("@q")
+
+
+def test_functions_returns_and_macros():
+    sim = _sim(
+        load="""
+scoreboard objectives add obj dummy
+execute store result score r obj run function t:ret
+data modify storage t:s args set value {amount: 4, name: "x"}
+function t:macro with storage t:s args
+function t:macro {amount: 2, name: "y"}
+execute if function t:ret run scoreboard players set passed obj 1
+""",
+        ret="""
+return run scoreboard players set ignored obj 7
+scoreboard players set unreachable obj 1
+""",
+        macro="$scoreboard players set $(name) obj $(amount)",
+    )
+    sim.load()
+    assert sim.get_score("r", "obj") == 7 and sim.get_score("unreachable", "obj") is None
+    assert sim.get_score("x", "obj") == 4 and sim.get_score("y", "obj") == 2 and sim.get_score("passed", "obj") == 1
+    assert sim.stats.function_calls["t:ret"] == 2 and sim.stats.function_calls["t:macro"] == 2
+
+
+def test_command_counts_and_schedule():
+    sim = _sim(
+        load="scoreboard objectives add obj dummy\nschedule function t:later 2t",
+        tick="scoreboard players add ticks obj 1\nfunction t:inner",
+        inner="say hi\nparticle minecraft:flame ~ ~ ~",
+        later="scoreboard players add later obj 1",
+    )
+    sim.load()
+    sim.tick(3)
+    assert sim.stats.load_commands == 2
+    assert sim.stats.tick_commands == [4, 5, 4]
+    assert sim.stats.function_commands["t:inner"] == 6 and sim.stats.function_calls["t:inner"] == 3
+    assert sim.stats.unmodelled_commands["particle"] == 3
+    assert sim.get_score("ticks", "obj") == 3 and sim.get_score("later", "obj") == 1
+    assert sim.world.chat == ["[Server] hi"] * 3
+
+
+def test_chain_limit_and_failures():
+    sim = _sim(load="scoreboard players set x missing 1\nfunction t:loop", loop="function t:loop")
+    sim.max_command_chain_length = 1000
+    sim.load()
+    assert sim.stats.chain_limit_hits == 1 and sim.stats.commands == 1000
+    assert sim.stats.failed_commands["Unknown scoreboard objective `missing`"] == 1
+    with pytest.raises(SimulationError, match="t:load"):
+        _sim(load="function t:nope").load()
+
+
+def test_nbt():
+    value = parse_snbt('{a: 1b, b: [I; 1, 2], "c d": {e: \'s\\\'q\'}, f: 1.5d, g: [{h: -3L}]}')
+    assert value == {"a": 1, "b": [1, 2], "c d": {"e": "s'q"}, "f": 1.5, "g": [{"h": -3}]}
+    assert parse_snbt(render_snbt(value)) == value
+    assert get_path(value, "g[0].h") == [-3]
+    assert get_path(value, "b[]") == [1, 2]
+    assert set_path(value, "x.y.z", 5) == 1 and value["x"] == {"y": {"z": 5}}
+    assert remove_path(value, '"c d".e') == 1 and value["c d"] == {}
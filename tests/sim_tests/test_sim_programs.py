@@ -0,0 +1,281 @@
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.errors import ConversionError
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.sim.interpreter import Simulator
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.virtual.generation import convert as conv_smt_vir
+from mchy.virtual.vir_dp import write_datapack
+import pytest
+
+
+PROGRAM = """
+def recursive_sum(n: int) -> int {
+    if n == 0 {
+        return 0
+    }
+    return n + recursive_sum(n - 1)
+}
+def helper(a: int, b: int = 4) -> int {
+    var i: int = 0
+    while i < a {
+        i += recursive_sum(b)
+    }
+    return i
+}
+var total: int = 0
+def Entity tagged() {
+    this.tag_add("seen")
+    total += 1
+}
+var players: Group[Player] = world.get_players().find()
+players.tagged()
+var a: int = -7
+var b: int = 2
+print(recursive_sum(3), " ", helper(2), " ", total, " ", a / b, " ", a % 3)
+"""
+
+
+def _simulate(code: str, config: Config) -> Simulator:
+    vir_dp = conv_smt_vir(conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config), config=config)
+    simulator = Simulator.from_vir_dp(vir_dp)
+    simulator.world.add_player("Steve")
+    simulator.world.add_player("Alex")
+    simulator.load()
+    return simulator
+
+
+@pytest.mark.parametrize("optimisation", list(Config.Optimize))
+def test_program_results(optimisation: Config.Optimize):
+    simulator = _simulate(PROGRAM, Config(optimisation=optimisation))
+    assert simulator.world.chat == ["6 10 2 -4 2"]
+    assert all("seen" in player.tags for player in simulator.world.entities)
+    assert simulator.stats.chain_limit_hits == 0 and len(simulator.stats.failed_commands) == 0
+    assert simulator.stats.load_commands == simulator.stats.commands
+
+
+def test_recursion_limit_reports_error():
+    code = PROGRAM.replace("print(", "print(recursive_sum(40), ")
+    simulator = _simulate(code, Config(recursion_limit=8))
+    assert simulator.world.chat[0].startswith("Runtime Error: recursion limit (8) reached")
+    assert simulator.stats.chain_limit_hits == 1
+
+
+@pytest.mark.parametrize("optimisation", list(Config.Optimize))
+def test_storage_stack_results(optimisation: Config.Optimize):
+    simulator = _simulate(PROGRAM, Config(optimisation=optimisation, storage_stack=True))
+    assert simulator.world.chat == ["6 10 2 -4 2"]
+    assert simulator.world.storage["prj_ns:mchy"]["mchy_stack"] == []
+    assert simulator.stats.chain_limit_hits == 0 and len(simulator.stats.failed_commands) == 0
+
+
+def test_storage_stack_recursion_limit_reports_error():
+    code = PROGRAM.replace("print(", "print(recursive_sum(40), ")
+    simulator = _simulate(code, Config(recursion_limit=8, storage_stack=True))
+    assert simulator.world.chat[0].startswith("Runtime Error: recursion limit (8) reached in function `recursive_sum`")
+    assert simulator.stats.chain_limit_hits == 1
+
+
+@pytest.mark.parametrize("target_version", [(1, 20, 2), (1, 20, 4), (1, 21, 0)])
+@pytest.mark.parametrize("optimisation", list(Config.Optimize))
+def test_target_version_results(optimisation: Config.Optimize, target_version):
+    simulator = _simulate(PROGRAM, Config(optimisation=optimisation, target_version=target_version))
+    assert simulator.world.chat == ["6 10 2 -4 2"]
+    assert all("seen" in player.tags for player in simulator.world.entities)
+    assert simulator.stats.chain_limit_hits == 0 and len(simulator.stats.failed_commands) == 0
+
+
+def test_return_run_runs_fewer_commands():
+    oldest = _simulate(PROGRAM, Config(optimisation=Config.Optimize.O2))
+    newer = _simulate(PROGRAM, Config(optimisation=Config.Optimize.O2, target_version=(1, 20, 4)))
+    assert newer.world.chat == oldest.world.chat
+    assert newer.stats.commands < oldest.stats.commands
+
+
+@pytest.mark.parametrize("target_version", [(1, 20, 2), (1, 20, 4)])
+def test_macro_recursion_limit_reports_error(target_version):
+    code = PROGRAM.replace("print(", "print(recursive_sum(40), ")
+    simulator = _simulate(code, Config(recursion_limit=8, target_version=target_version))
+    assert simulator.world.chat[0].startswith("Runtime Error: recursion limit (8) reached in function `recursive_sum`")
+    assert simulator.stats.chain_limit_hits == 1
+
+
+def test_simulate_from_disk(tmp_path):
+    config = Config(output_path=str(tmp_path), project_name="Sim")
+    vir_dp = conv_smt_vir(conv_cst_smt(conv_ast_cst(mchy_parse("var x: int = 2\nprint(x * 21)", config), config=config), config=config), config=config)
+    write_datapack(vir_dp.root, config)
+    simulator = Simulator.from_disk(str(tmp_path / "Sim"))
+    simulator.load()
+    simulator.tick(2)
+    assert simulator.world.chat == ["42"]
+    assert len(simulator.stats.tick_commands) == 2
+
+
+def test_short_circuit_results():
+    code = """
+var hits: int = 0
+var i: int = 0
+world.get_players().find().tag_add("p")
+while (i < 6) and world.entity_exists(world.get_player().with_tag("p").find()) {
+    if (i % 2 == 0) or (bool(i - 3) and (i > 2)) {
+        hits += 1
+    }
+    i += 1
+}
+print(hits, " ", i)
+"""
+    unoptimised = _simulate(code, Config(optimisation=Config.Optimize.NOTHING))
+    optimised = _simulate(code, Config(optimisation=Config.Optimize.O2))
+    assert unoptimised.world.chat == optimised.world.chat == ["4 6"]
+    assert optimised.stats.commands < unoptimised.stats.commands
+
+
+def test_loop_invariant_results():
+    code = """
+def f(n: int) -> int {
+    var i: int = 0
+    var s: int = 0
+    while i < n * 2 {
+        s += n * 3
+        i += 1
+    }
+    return s
+}
+var k: int = 0
+while k < 3 {
+    print(f(k + 2))
+    k += 1
+}
+"""
+    unoptimised = _simulate(code, Config(optimisation=Config.Optimize.NOTHING))
+    optimised = _simulate(code, Config(optimisation=Config.Optimize.O2))
+    assert unoptimised.world.chat == optimised.world.chat == ["24", "54", "96"]
+    assert optimised.stats.commands < unoptimised.stats.commands
+
+
+def test_tail_recursion_beyond_recursion_limit():
+    code = """
+def sum_to(n: int, acc: int) -> int {
+    if n <= 0 {
+        return acc
+    }
+    return sum_to(n - 1, acc + n)
+}
+def swap(a: int, b: int, steps: int) -> int {
+    if steps == 0 {
+        return a * 100 + b
+    }
+    return swap(b, a, steps - 1)
+}
+print(sum_to(5, 0), " ", swap(1, 2, 3))
+"""
+    assert _simulate(code, Config(optimisation=Config.Optimize.NOTHING)).world.chat == ["15 201"]
+    optimised = _simulate(code.replace("sum_to(5, 0)", "sum_to(100, 0)"), Config(optimisation=Config.Optimize.O2, recursion_limit=8))
+    assert optimised.world.chat == ["5050 201"]
+    assert optimised.stats.chain_limit_hits == 0
+
+
+@pytest.mark.parametrize("optimisation", list(Config.Optimize))
+def test_periodic_ticking_functions_spread(optimisation: Config.Optimize):
+    code = """
+var runs: int = 0
+var this_tick: int = 0
+var most: int = 0
+def run_once() {
+    runs += 1
+    this_tick += 1
+    if this_tick > most {
+        most = this_tick
+    }
+}
+@ticking_every_4
+def first() {
+    run_once()
+}
+@ticking_every_4
+def second() {
+    run_once()
+}
+@ticking_every_2
+def third() {
+    run_once()
+}
+@ticking
+def end_tick() {
+    this_tick = 0
+}
+@public
+def report() {
+    print(runs, " ", most)
+}
+"""
+    simulator = _simulate(code, Config(optimisation=optimisation))
+    simulator.tick(40)
+    simulator.run_function("prj_ns:generated/public/report")
+    assert simulator.world.chat[-1] == "40 1"
+
+
+def test_nothing_ticking_has_no_tick_tag():
+    simulator = _simulate("var x: int = 2\nprint(x)", Config())
+    assert "minecraft:tick" not in simulator.function_tags
+    simulator.tick(5)
+    assert simulator.stats.tick_commands == [0] * 5
+
+
+TIME_SLICED = """
+var total: int = 0
+var runs: int = 0
+@iterations_per_tick_7
+def crunch(n: int) {
+    var i: int = 0
+    var s: int = 0
+    while i < n {
+        for j in 0..2 {
+            if (i + j) % 3 == 0 {
+                s += j
+            } else {
+                s += 1
+            }
+        }
+        i += 1
+    }
+    total = s
+    runs += 1
+}
+@public
+def report() {
+    print(total, " ", runs)
+}
+crunch(60)
+"""
+
+
+@pytest.mark.parametrize("storage_stack", [False, True])
+@pytest.mark.parametrize("target_version", [(1, 19, 4), (1, 20, 4)])
+@pytest.mark.parametrize("optimisation", list(Config.Optimize))
+def test_time_sliced_loops_continue_on_later_ticks(optimisation: Config.Optimize, target_version, storage_stack: bool):
+    unsliced = _simulate(TIME_SLICED.replace("@iterations_per_tick_7\n", ""), Config(optimisation=optimisation, target_version=target_version))
+    simulator = _simulate(TIME_SLICED, Config(optimisation=optimisation, target_version=target_version, storage_stack=storage_stack))
+    simulator.tick(40)
+    simulator.run_function("prj_ns:generated/public/report")
+    assert simulator.world.chat[-1] == "180 1"
+    # 60 outer & 180 inner iterations at 7 per tick
+    assert len([commands for commands in simulator.stats.tick_commands if commands >= 1]) == 240 // 7
+    assert simulator.stats.load_commands < unsliced.stats.load_commands // 10
+    assert simulator.stats.chain_limit_hits == 0 and len(simulator.stats.failed_commands) == 0
+
+
+def test_time_sliced_call_abandons_unfinished_call():
+    simulator = _simulate(TIME_SLICED.replace("crunch(60)", "crunch(60)\ncrunch(9)"), Config(optimisation=Config.Optimize.O2))
+    simulator.tick(40)
+    simulator.run_function("prj_ns:generated/public/report")
+    assert simulator.world.chat[-1] == "27 1"
+
+
+@pytest.mark.parametrize("code, message", [
+    ("@iterations_per_tick_3\ndef f(n: int) {\n    if n > 0 {\n        f(n - 1)\n    }\n}", "can be called recursively"),
+    ("@iterations_per_tick_3\ndef f() {\n    var p: Group[Player] = world.get_players().find()\n}", "cannot hold entities"),
+])
+def test_time_sliced_function_errors(code: str, message: str):
+    with pytest.raises(ConversionError, match=message):
+        _simulate(code, Config())
@@ -57,6 +57,7 @@ def _cmd_eq(cmd1: SmtCmd, cmd2: SmtCmd) -> bool:
         return (
             cmd1.func_id == cmd2.func_id and
             cmd1.ext_frag.get_frag_name() == cmd2.ext_frag.get_frag_name() and
+            cmd1.returning == cmd2.returning and
             len(cmd1.conditions) == len(cmd2.conditions) and
             all(((cmd1_cond[1] == cmd2_cond[1]) and _atom_eq(cmd1_cond[0], cmd2_cond[0])) for cmd1_cond, cmd2_cond in zip(cmd1.conditions, cmd2.conditions))
         )
@@ -1,10 +1,12 @@
-
+from typing import List
 from mchy.common.com_loc import ComLoc
 from mchy.common.config import Config
 from mchy.contextual.struct import *
+from mchy.contextual.generation import convert as conv_ast_cst
 from mchy.contextual.struct.expr import CtxExprLitWorld
+from mchy.mchy_ast.convert_parse import mchy_parse
 from mchy.stmnt.struct import *
-from mchy.stmnt.generation import convert
+from mchy.stmnt.generation import assign_tick_phases, convert
 from mchy.stmnt.struct.cmds.tag_ops import SmtRawEntitySelector
 from tests.stmnt_layer.helper import diff_cmds_list
 
@@ -72,3 +74,28 @@ class TestMchyFunc1:
             SmtAssignCmd(func.return_var, SmtConstInt(42))
         ])
         assert diff_bool, "Converted function body does not match expected:\n" + explanation
+
+
+@pytest.mark.parametrize("code, lowered", [
+    ("def f(n: int) -> int {\n    if n <= 0 {\n        return 0\n    }\n    return f(n - 1)\n}\nprint(f(3))", True),
+    ("def f(n: int) -> int {\n    if n <= 0 {\n        return 0\n    }\n    return 1 + f(n - 1)\n}\nprint(f(3))", False),
+    ("def f(n: int = 2) -> int {\n    if n <= 0 {\n        return 0\n    }\n    return f()\n}\nprint(f(3))", False),
+])
+def test_self_tail_call_lowered_to_loop(code: str, lowered: bool):
+    config = Config(optimisation=Config.Optimize.O2)
+    smt_module = convert(conv_ast_cst(mchy_parse(code, config), config=config), config=config)
+    func = smt_module.get_smt_mchy_funcs()[0]
+    self_calls = [cmd for frag in func.fragments for cmd in frag.body if isinstance(cmd, SmtInvokeFuncCmd) and cmd.target_func is func]
+    assert (func.tail_call_flag is not None) == lowered
+    assert (len(self_calls) == 0) == lowered
+
+
+@pytest.mark.parametrize("periods, phases", [
+    ([20, 20, 20], [0, 1, 2]),
+    ([1, 5, 1], [0, 0, 0]),
+    ([20, 2, 20], [1, 0, 3]),
+    ([2, 2, 2], [0, 1, 0]),
+    ([4, 6], [0, 1]),
+])
+def test_tick_phases_spread(periods: List[int], phases: List[int]):
+    assert assign_tick_phases(periods) == phases
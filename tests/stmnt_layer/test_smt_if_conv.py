@@ -5,7 +5,9 @@ from mchy.common.com_types import InertCoreTypes, InertType
 from mchy.common.config import Config
 from mchy.contextual import struct as ctxs
 from mchy.contextual.struct.module import CtxModule
+from mchy.contextual.generation import convert as conv_ast_cst
 from mchy.contextual.struct.stmnt import CtxBranch, CtxIfStmnt, MarkerDeclVar
+from mchy.mchy_ast.convert_parse import mchy_parse
 from mchy.stmnt.generation import convert
 from mchy.stmnt.struct import cmds as smt_cmds
 from mchy.stmnt.struct.atoms import SmtConstInt, SmtPublicVar, SmtPseudoVar, SmtWorld
@@ -58,3 +60,52 @@ def test_simple_smt_if_conv():
         smt_cmds.SmtAssignCmd(branch_taken_mock_var, SmtConstInt(1))
     ])
     assert diff_bool, "generated command list does not match expected:\n" + explanation
+
+
+def test_smt_if_conv_with_return_run():
+    module = CtxModule(Config())
+    _int_var_foo = module.global_var_scope.register_new_var("foo", _INT, False, MarkerDeclVar().with_enclosing_function(None), ComLoc())
+    module.exec_body.append(CtxIfStmnt(
+        CtxBranch(
+            ctxs.CtxExprLitBool(True, src_loc=ComLoc()),
+            [ctxs.CtxAssignment(_int_var_foo, ctxs.CtxExprLitInt(11, src_loc=ComLoc()))]
+        ), [], None
+    ))
+
+    smt_module = convert(module, config=Config(target_version=(1, 20, 4)))
+
+    frags: List[SmtFragment] = [smt_module.initial_function.func_frag] + smt_module.initial_function.fragments
+    assert len(frags) == 3  # func_frag, passover, if-taken
+    func_frag, passover, if_taken = frags
+
+    # The branch returns once complete so no branch taken flag is needed
+    diff_bool, explanation = diff_cmds_list(func_frag.body, [
+        smt_cmds.SmtConditionalInvokeFuncCmd([(SmtConstInt(1), True)], smt_module.initial_function, if_taken, SmtWorld(), returning=True),
+        smt_cmds.SmtConditionalInvokeFuncCmd([(SmtConstInt(1), True)], smt_module.initial_function, passover, SmtWorld()),
+    ])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+
+    diff_bool, explanation = diff_cmds_list(if_taken.body, [
+        smt_cmds.SmtAssignCmd(SmtPublicVar("foo", _INT), SmtConstInt(11)),
+        smt_cmds.SmtConditionalInvokeFuncCmd([(SmtConstInt(1), True)], smt_module.initial_function, passover, SmtWorld()),
+    ])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+
+
+def _lazy_frags(code: str, optimisation: Config.Optimize) -> List[SmtFragment]:
+    config = Config(optimisation=optimisation)
+    smt_module = convert(conv_ast_cst(mchy_parse(code, config), config=config), config=config)
+    return [frag for frag in smt_module.initial_function.fragments if frag.route[-1].flavour == RoutingFlavour.LAZY]
+
+
+def test_short_circuit_conditions():
+    code = "var x: int = 0\nwhile x < 2 {\n    x += 1\n}\nvar hit: bool = false\nif (x > 1) and (x < 5) {\n    hit = true\n}"  # x unknown after loop
+    assert len(_lazy_frags(code, Config.Optimize.NOTHING)) == 0
+    lazy_frags = _lazy_frags(code, Config.Optimize.O2)
+    assert len(lazy_frags) == 1
+    assert any(isinstance(cmd, smt_cmds.SmtCompGTCmd) for cmd in lazy_frags[0].body)
+
+
+def test_short_circuit_requires_pure_rhs():
+    code = "def side_effect() -> bool {\n    print(\"called\")\n    return true\n}\nvar x: int = 2\nif (x > 1) or side_effect() {\n    x = 3\n}"
+    assert len(_lazy_frags(code, Config.Optimize.O2)) == 0
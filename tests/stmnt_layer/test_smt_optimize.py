@@ -0,0 +1,338 @@
+from mchy.common.com_types import ExecCoreTypes, ExecType, InertCoreTypes, InertType
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.stmnt.optimize import (
+    EliminateDeadStores, FuseComparisons, MergeFragments, PropagateConstants, PropagateCopies, SharePseudoVarStorage, optimize
+)
+from mchy.stmnt.struct import cmds as smt_cmds
+from mchy.stmnt.struct.atoms import SmtConstInt, SmtWorld
+from mchy.stmnt.struct.cmds.helpers import SmtCompPredicate, resolve_condition_cmd
+from mchy.stmnt.struct.cmds.raw import SmtConditionalRawCmd
+from mchy.stmnt.struct.linker import SmtLinker
+from mchy.stmnt.struct.module import SmtModule
+from mchy.stmnt.struct.smt_frag import RoutingFlavour
+from tests.stmnt_layer.helper import diff_cmds_list
+
+
+_INT = InertType(InertCoreTypes.INT)
+
+
+def _call(module: SmtModule, frag, conditions=None) -> smt_cmds.SmtConditionalInvokeFuncCmd:
+    conditions = [(SmtConstInt(1), True)] if conditions is None else conditions
+    return smt_cmds.SmtConditionalInvokeFuncCmd(conditions, module.initial_function, frag, SmtWorld())
+
+
+def test_merge_single_unconditional_caller():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_pseudo_var(_INT)
+    passover = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    passover.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(2)))
+    func.func_frag.body.extend([smt_cmds.SmtAssignCmd(var, SmtConstInt(1)), _call(module, passover), smt_cmds.SmtAssignCmd(var, SmtConstInt(3))])
+
+    optimize(module, Config(optimisation=Config.Optimize.O1))
+
+    assert func.fragments == []
+    diff_bool, explanation = diff_cmds_list(func.func_frag.body, [
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(1)),
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(2)),
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(3)),
+    ])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+    assert module.optimisation_stats["MergeFragments"].hits == 1
+
+
+def test_conditional_and_shared_fragments_kept():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_pseudo_var(_INT)
+    shared = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    shared.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(2)))
+    cond = func.func_frag.add_fragment(RoutingFlavour.IF)
+    cond.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(5)))
+    func.func_frag.body.extend([_call(module, shared), _call(module, shared), _call(module, cond, [(var, True)])])
+
+    optimize(module, Config(optimisation=Config.Optimize.O1))
+
+    assert func.fragments == [shared, cond]
+    assert len(func.func_frag.body) == 3
+
+
+def test_trampolines_empty_and_unreachable_fragments_removed():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_pseudo_var(_INT)
+    target = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    target.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(2)))
+    trampoline = func.func_frag.add_fragment(RoutingFlavour.IF)
+    trampoline.body.append(_call(module, target))
+    empty = func.func_frag.add_fragment(RoutingFlavour.IF)
+    dead = func.func_frag.add_fragment(RoutingFlavour.DEAD)
+    dead.body.append(_call(module, target))
+    func.func_frag.body.extend([_call(module, trampoline, [(var, True)]), _call(module, empty, [(var, False)]), _call(module, target, [(var, False)])])
+
+    optimize(module, Config(optimisation=Config.Optimize.O1))
+
+    assert func.fragments == [target]
+    diff_bool, explanation = diff_cmds_list(func.func_frag.body, [_call(module, target, [(var, True)]), _call(module, target, [(var, False)])])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+
+
+def test_optimisation_disabled():
+    module = SmtModule()
+    empty = module.initial_function.func_frag.add_fragment(RoutingFlavour.TOP)
+    module.initial_function.func_frag.body.append(_call(module, empty))
+
+    optimize(module, Config(optimisation=Config.Optimize.NOTHING))
+
+    assert module.initial_function.fragments == [empty]
+    assert module.optimisation_stats == {}
+    assert MergeFragments.get().level() == Config.Optimize.O1
+
+
+def test_fold_constant_conditions():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_pseudo_var(_INT)
+    never = func.func_frag.add_fragment(RoutingFlavour.IF)
+    never.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(5)))
+    sometimes = func.func_frag.add_fragment(RoutingFlavour.IF)
+    sometimes.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(6)))
+    func.func_frag.body.extend([
+        _call(module, never, [(var, True), (SmtConstInt(0), True)]),
+        _call(module, sometimes, [(SmtConstInt(1), True), (var, False)]),
+        SmtConditionalRawCmd([(SmtConstInt(0), False)], "say hi"),
+    ])
+
+    optimize(module, Config(optimisation=Config.Optimize.O1))
+
+    assert func.fragments == [sometimes]
+    invoke, raw = func.func_frag.body
+    assert isinstance(invoke, smt_cmds.SmtConditionalInvokeFuncCmd) and invoke.ext_frag is sometimes and invoke.conditions == [(var, False)]
+    assert isinstance(raw, SmtConditionalRawCmd) and raw.virtualize(SmtLinker("ns", 8), 0)[0].cmd == "say hi"
+
+
+def test_fuse_comparison_into_conditions():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_public_var("x", _INT)
+    out = func.new_pseudo_var(InertType(InertCoreTypes.BOOL))
+    on_true = func.func_frag.add_fragment(RoutingFlavour.IF)
+    on_true.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(0)))
+    on_false = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    on_false.body.append(smt_cmds.SmtAssignCmd(func.new_public_var("y", _INT), SmtConstInt(1)))
+    func.func_frag.body.extend([smt_cmds.SmtCompGTECmd(var, SmtConstInt(5), out), _call(module, on_false, [(out, False)]), _call(module, on_true, [(out, True)])])
+
+    optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert len(func.func_frag.body) == 2
+    invoke_false, invoke_true = func.func_frag.body
+    assert isinstance(invoke_false, smt_cmds.SmtConditionalInvokeFuncCmd) and isinstance(invoke_true, smt_cmds.SmtConditionalInvokeFuncCmd)
+    assert isinstance(invoke_true.conditions[0][0], SmtCompPredicate) and invoke_true.conditions[0][0].op == SmtCompPredicate.Op.GTE
+    linker = SmtLinker("ns", 8)
+    linker.add_bland_var(var, ["mchy_glob"], stackless=True)
+    assert resolve_condition_cmd(invoke_false.conditions, linker, 0) == "unless score var_x ns-mchy_glob matches 5.."
+    assert resolve_condition_cmd(invoke_true.conditions, linker, 0) == "if score var_x ns-mchy_glob matches 5.."
+    assert module.optimisation_stats["FuseComparisons"].hits == 1
+
+
+def test_fuse_comparison_blocked_by_operand_write():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_public_var("x", _INT)
+    out = func.new_pseudo_var(InertType(InertCoreTypes.BOOL))
+    on_true = func.func_frag.add_fragment(RoutingFlavour.IF)
+    on_true.body.append(SmtConditionalRawCmd([(SmtConstInt(1), True)], "say hi"))
+    on_false = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    on_false.body.append(smt_cmds.SmtAssignCmd(var, SmtConstInt(9)))  # Would make the comparison pass when re-evaluated
+    comparison = smt_cmds.SmtCompGTECmd(var, SmtConstInt(5), out)
+    func.func_frag.body.extend([comparison, _call(module, on_false, [(out, False)]), _call(module, on_true, [(out, True)])])
+
+    optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert func.func_frag.body[0] is comparison
+    assert all(not isinstance(atom, SmtCompPredicate) for cmd in func.func_frag.body[1:] for atom, _ in cmd.conditions)  # type: ignore
+    assert FuseComparisons.get().level() == Config.Optimize.O2
+
+
+def test_share_pseudo_var_storage():
+    module = SmtModule()
+    func = module.initial_function
+    first, second = func.new_public_var("x", _INT), func.new_public_var("y", _INT)
+    tmp1, tmp2, tmp3 = func.new_pseudo_var(_INT), func.new_pseudo_var(_INT), func.new_pseudo_var(_INT)
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(tmp1, SmtConstInt(1)),
+        smt_cmds.SmtAssignCmd(first, tmp1),
+        smt_cmds.SmtAssignCmd(tmp2, SmtConstInt(2)),
+        smt_cmds.SmtAssignCmd(tmp3, SmtConstInt(3)),
+        smt_cmds.SmtPlusCmd(tmp3, tmp2),
+        smt_cmds.SmtAssignCmd(second, tmp3),
+    ])
+
+    assert SharePseudoVarStorage.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert func.get_shared_pseudo_vars() == {tmp2: tmp1}  # tmp2 is still needed when tmp3 is written
+    assert tmp2 not in func.get_pseudo_vars() and tmp3 in func.get_pseudo_vars()
+    assert SharePseudoVarStorage.get().is_final()
+
+
+def test_share_pseudo_var_storage_across_fragments():
+    module = SmtModule()
+    func = module.initial_function
+    target = func.new_public_var("x", _INT)
+    held, clobbered, unused = func.new_pseudo_var(_INT), func.new_pseudo_var(_INT), func.new_pseudo_var(_INT)
+    frag = func.func_frag.add_fragment(RoutingFlavour.IF)
+    frag.body.extend([smt_cmds.SmtAssignCmd(clobbered, SmtConstInt(2)), smt_cmds.SmtAssignCmd(target, clobbered)])
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(held, SmtConstInt(1)),
+        _call(module, frag, [(target, True)]),
+        smt_cmds.SmtAssignCmd(target, held),
+        smt_cmds.SmtAssignCmd(unused, SmtConstInt(4)),
+    ])
+
+    SharePseudoVarStorage.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert func.get_shared_pseudo_vars() == {unused: held}  # `held` is live while the called fragment writes `clobbered`
+
+
+def test_propagate_copies():
+    module = SmtModule()
+    func = module.initial_function
+    var, other = func.new_public_var("x", _INT), func.new_public_var("y", _INT)
+    tmp1, tmp2 = func.new_pseudo_var(_INT), func.new_pseudo_var(_INT)
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(tmp1, var),
+        smt_cmds.SmtPlusCmd(tmp1, SmtConstInt(1)),
+        smt_cmds.SmtAssignCmd(var, tmp1),
+        smt_cmds.SmtAssignCmd(tmp2, var),
+        smt_cmds.SmtMultCmd(other, tmp2),
+    ])
+
+    optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    diff_bool, explanation = diff_cmds_list(func.func_frag.body, [
+        smt_cmds.SmtPlusCmd(var, SmtConstInt(1)),
+        smt_cmds.SmtMultCmd(other, var),
+    ])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+    assert module.optimisation_stats["PropagateCopies"].hits >= 1 and module.optimisation_stats["EliminateDeadStores"].hits >= 1
+
+
+def test_propagate_copies_blocked_by_observers():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_public_var("x", _INT)
+    tmp1, tmp2 = func.new_pseudo_var(_INT), func.new_pseudo_var(_INT)
+    reader = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    reader.body.append(SmtConditionalRawCmd([(var, True)], "say hi"))
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(tmp1, SmtConstInt(4)),
+        _call(module, reader),  # Would see `x` set early if `tmp1` were computed straight into it
+        smt_cmds.SmtAssignCmd(var, tmp1),
+        smt_cmds.SmtAssignCmd(tmp2, var),
+        smt_cmds.SmtRawCmd("scoreboard players set var_x ns-mchy_glob 9"),
+        smt_cmds.SmtAssignCmd(var, tmp2),
+    ])
+    expected = list(func.func_frag.body)
+
+    PropagateCopies.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+    EliminateDeadStores.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert func.func_frag.body == expected
+
+
+def test_dead_store_kept_when_read_after_fragment_returns():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_public_var("x", _INT)
+    tmp = func.new_pseudo_var(_INT)
+    frag = func.func_frag.add_fragment(RoutingFlavour.IF)
+    frag.body.append(smt_cmds.SmtAssignCmd(tmp, SmtConstInt(3)))
+    func.func_frag.body.extend([smt_cmds.SmtAssignCmd(tmp, SmtConstInt(1)), _call(module, frag, [(var, True)]), smt_cmds.SmtPlusCmd(var, tmp)])
+
+    assert not EliminateDeadStores.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+    assert len(frag.body) == 1 and len(func.func_frag.body) == 3
+
+
+def test_propagate_constants():
+    module = SmtModule()
+    func = module.initial_function
+    var, big, neg = func.new_public_var("x", _INT), func.new_public_var("big", _INT), func.new_public_var("neg", _INT)
+    frag = func.func_frag.add_fragment(RoutingFlavour.IF)
+    frag.body.append(smt_cmds.SmtMultCmd(var, SmtConstInt(3)))
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(5)),
+        smt_cmds.SmtAssignCmd(big, SmtConstInt(2147483647)),
+        smt_cmds.SmtPlusCmd(big, var),
+        smt_cmds.SmtAssignCmd(neg, SmtConstInt(-7)),
+        smt_cmds.SmtDivCmd(neg, SmtConstInt(2)),
+        _call(module, frag, [(big, False)]),
+        SmtConditionalRawCmd([(var, True)], "say hi"),
+    ])
+
+    assert PropagateConstants.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    diff_bool, explanation = diff_cmds_list(func.func_frag.body[:-1], [
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(5)),
+        smt_cmds.SmtAssignCmd(big, SmtConstInt(2147483647)),
+        smt_cmds.SmtAssignCmd(big, SmtConstInt(-2147483644)),  # Wraps
+        smt_cmds.SmtAssignCmd(neg, SmtConstInt(-7)),
+        smt_cmds.SmtAssignCmd(neg, SmtConstInt(-4)),  # Floor division
+        _call(module, frag, [(SmtConstInt(0), False)]),
+    ])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+    raw = func.func_frag.body[-1]
+    assert isinstance(raw, SmtConditionalRawCmd) and raw.conditions == [(var, True)]  # The fragment may have changed `x`
+    diff_bool, explanation = diff_cmds_list(frag.body, [smt_cmds.SmtAssignCmd(var, SmtConstInt(15))])
+    assert diff_bool, "generated command list does not match expected:\n" + explanation
+
+
+def test_propagate_constants_blocked_by_raw_and_entity_calls():
+    module = SmtModule()
+    func = module.initial_function
+    var, entity = func.new_public_var("x", _INT), func.new_pseudo_var(ExecType(ExecCoreTypes.ENTITY, False))
+    per_entity = func.func_frag.add_fragment(RoutingFlavour.TOP)
+    per_entity.body.append(smt_cmds.SmtPlusCmd(var, SmtConstInt(1)))
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(1)),
+        smt_cmds.SmtConditionalInvokeFuncCmd([(SmtConstInt(1), True)], func, per_entity, entity),
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(1)),
+        smt_cmds.SmtRawCmd("scoreboard players add var_x ns-mchy_glob 1"),
+        smt_cmds.SmtMinusCmd(var, SmtConstInt(1)),
+    ])
+    expected = list(func.func_frag.body)
+
+    assert not PropagateConstants.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert func.func_frag.body == expected and len(per_entity.body) == 1 and isinstance(per_entity.body[0], smt_cmds.SmtPlusCmd)
+
+
+def test_overwritten_store_removed():
+    module = SmtModule()
+    func = module.initial_function
+    var = func.new_public_var("x", _INT)
+    func.func_frag.body.extend([
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(1)),
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(2)),
+        SmtConditionalRawCmd([(SmtConstInt(1), True)], "say hi"),  # Could read `x`
+        smt_cmds.SmtAssignCmd(var, SmtConstInt(3)),
+    ])
+
+    assert EliminateDeadStores.get().optimize(module, Config(optimisation=Config.Optimize.O2))
+
+    assert [cmd.value.value for cmd in func.func_frag.body if isinstance(cmd, smt_cmds.SmtAssignCmd)] == [2, 3]  # type: ignore
+
+
+def test_hoist_loop_invariants():
+    code = "def f(n: int) -> int {\n    var i: int = 0\n    var s: int = 0\n    while i < n * 2 {\n        s += n * 3\n        i += 1\n    }\n    return s\n}\nprint(f(4))"
+    config = Config(optimisation=Config.Optimize.O2)
+    module = conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config)
+    func = module.get_smt_mchy_funcs()[0]
+
+    loop_frags = [frag for frag in func.fragments if frag.route[-1].flavour in (RoutingFlavour.COND, RoutingFlavour.LOOP)]
+    assert len(loop_frags) == 2
+    assert not any(isinstance(cmd, smt_cmds.SmtMultCmd) for frag in loop_frags for cmd in frag.body)
+    assert sum(isinstance(cmd, smt_cmds.SmtMultCmd) for cmd in func.func_frag.body) == 2
+    assert module.optimisation_stats["HoistLoopInvariants"].hits >= 1
@@ -78,3 +78,41 @@ def test_nullable_int_var_assign_to_nullable_int_var():
     assert len(lines) > 0, f"No lines generated?  Full-text of load file is:\n\n" + load_text
     assert re.match(r"data.*storage.*var_nulla\.value.*storage.*var_nullb\.value", lines[0]) is not None, f"Line 1 doesn't set value? ({lines[0]})"
     assert re.match(r"data.*storage.*var_nulla\.is_null.*storage.*var_nullb\.is_null", lines[1]) is not None, f"Line 2 doesn't set null-ness? ({lines[1]})"
+
+
+@pytest.mark.parametrize("target_version, pack_format, functions_folder", [
+    ((1, 19, 4), 12, "functions"),
+    ((1, 20, 4), 26, "functions"),
+    ((1, 20, 6), 41, "functions"),
+    ((1, 21, 0), 48, "function"),
+    ((1, 21, 1), 48, "function"),
+])
+def test_target_version_pack_layout(target_version, pack_format, functions_folder):
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    virtual_dp = convert(module, config=Config(target_version=target_version))
+    assert f'"pack_format": {pack_format},' in virtual_dp.root.get_child_with_name("pack.mcmeta").content  # type: ignore
+    assert virtual_dp.generated_root.path.endswith(f"/data/prj_ns/{functions_folder}/generated")
+    assert virtual_dp.top_data_fld.get_child_with_name("minecraft").get_child_with_name("tags").get_child_with_name(functions_folder) is not None  # type: ignore
+
+
+def test_target_version_parsing():
+    assert Config.parse_target_version("1.20.4") == (1, 20, 4)
+    assert Config.parse_target_version("1.21") == (1, 21, 0)
+    with pytest.raises(ValueError):
+        Config.parse_target_version("1.19.2")
+    with pytest.raises(ValueError):
+        Config.parse_target_version("latest")
+
+
+@pytest.mark.parametrize("ticking", [False, True])
+def test_tick_master_only_registered_when_ticking(ticking: bool):
+    module = SmtModule()
+    if ticking:
+        module.ticking_function.func_frag.body.append(SmtPlusCmd(module.initial_function.new_public_var("foo", InertType(InertCoreTypes.INT)), SmtConstInt(1)))
+    module.create_all_lazy_variables()
+    virtual_dp = convert(module, config=Config())
+    tags_folder = virtual_dp.top_data_fld.get_child_with_name("minecraft").get_child_with_name("tags").get_child_with_name("functions")  # type: ignore
+    assert (tags_folder.get_child_with_name("tick.json") is not None) == ticking  # type: ignore
+    assert (tags_folder.get_child_with_name("load.json") is not None)  # type: ignore
+    assert (virtual_dp.tick_master_file.path.startswith(virtual_dp.root.path)) == ticking
@@ -1,6 +1,7 @@
-
-
-from mchy.virtual.vir_dirs import VirFolder, VirRawFile
+from mchy.common.com_cmd import ComCmd
+from mchy.errors import VirtualRepError
+from mchy.virtual.vir_dirs import VirFolder, VirMCHYFile, VirNSFolder, VirRawFile
+import pytest
 
 
 def test_add_child():
@@ -80,3 +81,59 @@ def test_delete_nested_children():
     assert b._parent is None
     assert c._parent is None
     assert bar._parent is None
+
+
+def test_revision_propagates_to_ancestors():
+    foo = VirFolder("foo", None)
+    bar = VirFolder("bar", foo)
+    foo_rev, bar_rev = foo.revision, bar.revision
+    VirRawFile("baz.raw", bar)
+    assert bar.revision > bar_rev
+    assert foo.revision > foo_rev
+
+
+def test_revision_changes_on_append():
+    foo = VirFolder("foo", None)
+    bar = VirMCHYFile("bar.mcfunction", foo)
+    foo_rev, bar_rev = foo.revision, bar.revision
+    bar.append(ComCmd("say hi"))
+    assert bar.revision > bar_rev
+    assert foo.revision > foo_rev
+
+
+def test_get_child_with_name():
+    foo = VirFolder("foo", None)
+    bar = VirMCHYFile("bar.mcfunction", foo)
+    baz = VirFolder("baz", foo)
+    assert foo.get_child_with_name("bar.mcfunction") is bar
+    assert foo.get_child_with_name("baz") is baz
+    assert foo.get_child_with_name("bar") is None
+    assert foo.get_child_with_ns_name("bar") is bar
+    foo.delete_child(bar)
+    assert foo.get_child_with_name("bar.mcfunction") is None
+    assert foo.get_child_with_ns_name("bar") is None
+
+
+def test_duplicate_child_name():
+    foo = VirFolder("foo", None)
+    VirRawFile("bar.raw", foo)
+    with pytest.raises(VirtualRepError):
+        VirRawFile("bar.raw", foo)
+
+
+def test_namespace_loc_follows_reparenting():
+    ns_a = VirNSFolder("ns:a", "a")
+    ns_b = VirNSFolder("ns:b", "b")
+    bar = VirMCHYFile("bar.mcfunction", VirFolder("foo", ns_a))
+    assert bar.get_namespace_loc() == "ns:a/foo/bar"
+    bar.delete()
+    VirFolder("foo", ns_b).add_child(bar)
+    assert bar.get_namespace_loc() == "ns:b/foo/bar"
+
+
+def test_lines_view_is_live():
+    foo = VirMCHYFile("foo.mcfunction")
+    lines = foo.lines
+    foo.append(ComCmd("say hi"))
+    assert len(lines) == 1
+    assert lines[0].cmd == "say hi"
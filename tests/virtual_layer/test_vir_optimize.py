@@ -0,0 +1,83 @@
+from typing import List
+from mchy.common.config import Config
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.stmnt.struct import SmtModule
+from mchy.virtual.generation import convert
+from mchy.virtual.vir_dirs import VirBaseMCHYFile, VirFolder
+from mchy.virtual.vir_dp import VirDP
+
+
+def _empty_module() -> SmtModule:
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    return module
+
+
+def test_optimizer_records_stats():
+    virtual_dp = convert(_empty_module(), config=Config(optimisation=Config.Optimize.O2))
+    stats = virtual_dp.optimisation_stats
+    assert set(stats.keys()) == {"CallableFilesOnly", "DeleteEmptyFolders"}
+    for opt_stats in stats.values():
+        assert opt_stats.runs >= 1
+        assert opt_stats.hits <= opt_stats.runs
+        assert opt_stats.runtime >= 0
+
+
+def test_optimizer_stops_once_clean():
+    virtual_dp = convert(_empty_module(), config=Config(optimisation=Config.Optimize.O2))
+    stats = virtual_dp.optimisation_stats
+    total_hits = sum(opt_stats.hits for opt_stats in stats.values())
+    for opt_stats in stats.values():
+        # Each optimisation runs once and only re-runs after something it reads changed
+        assert opt_stats.hits <= opt_stats.runs <= total_hits + 1
+
+
+def test_optimizer_skips_unrelated_passes():
+    stats = convert(_empty_module(), config=Config(optimisation=Config.Optimize.O2)).optimisation_stats
+    assert stats["CallableFilesOnly"].hits == 1 and stats["DeleteEmptyFolders"].hits == 2
+    # Deleting unreachable files empties more folders, deleting empty folders cannot make a file unreachable
+    assert stats["CallableFilesOnly"].runs == 1
+    assert stats["DeleteEmptyFolders"].runs == 2
+
+
+def test_optimizer_disabled():
+    virtual_dp = convert(_empty_module(), config=Config(optimisation=Config.Optimize.NOTHING))
+    assert virtual_dp.optimisation_stats == {}
+
+
+def _compile(code: str, optimisation: Config.Optimize) -> VirDP:
+    config = Config(optimisation=optimisation)
+    return convert(conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config), config=config)
+
+
+def _all_lines(virtual_dp: VirDP) -> List[str]:
+    lines: List[str] = []
+    folders: List[VirFolder] = [virtual_dp.generated_root]
+    while folders:
+        for child in folders.pop().children:
+            if isinstance(child, VirFolder):
+                folders.append(child)
+            elif isinstance(child, VirBaseMCHYFile):
+                lines.extend(line.cmd for line in child.lines)
+    return lines
+
+
+def test_inline_small_files_runs_at_o3():
+    virtual_dp = _compile("var x: int = 2\nif x > 1 {\n    x = 5\n}", Config.Optimize.O3)
+    assert virtual_dp.optimisation_stats["InlineSmallFiles"].hits >= 1
+    assert "InlineSmallFiles" not in _compile("var x: int = 2", Config.Optimize.O2).optimisation_stats
+
+
+def test_inline_small_files_drops_empty_fragments():
+    code = "var x: int = 2\nif x > 1 {\n    x = 5\n}"
+    assert any("/frag_tops1" in line for line in _all_lines(_compile(code, Config.Optimize.NOTHING)))
+    assert not any("/frag_tops1" in line for line in _all_lines(_compile(code, Config.Optimize.O3)))
+
+
+def test_inline_small_files_keeps_recursion():
+    code = "var i: int = 0\nwhile i < 5 {\n    i += 1\n}\nprint(i)"
+    inlined = _all_lines(_compile(code, Config.Optimize.O3))
+    assert any(line.endswith("/frag_loop1") for line in inlined)
+    assert any(line.endswith("/frag_cond1") for line in inlined)
@@ -0,0 +1,87 @@
+from mchy.common.com_types import InertCoreTypes, InertType
+from mchy.common.config import Config
+from mchy.stmnt.struct import SmtModule
+from mchy.stmnt.struct.atoms import SmtConstInt
+from mchy.stmnt.struct import SmtCmd
+from mchy.stmnt.struct.cmds import SmtAssignCmd, SmtPlusCmd
+from mchy.stmnt.struct.linker import SmtLinker, SmtStackSlot, SmtStackSlotMisuse
+from mchy.contextual.generation import convert as conv_ast_cst
+from mchy.mchy_ast.convert_parse import mchy_parse
+from mchy.stmnt.generation import convert as conv_cst_smt
+from mchy.virtual.generation import convert as conv_smt_vir, convert_smtcmds, convert_smtcmds_templated
+from mchy.virtual.vir_dirs import VirFolder, VirMCHYFile
+from mchy.common.com_cmd import ComCmd
+from typing import List
+import pytest
+
+
+class _LevelDependantCmd(SmtCmd):
+    """Uses the stack level directly and so cannot be templated"""
+
+    def virtualize(self, linker: SmtLinker, stack_level: int) -> List[ComCmd]:
+        return [ComCmd(f"say level {stack_level}")]
+
+
+class _BrokenCmd(SmtCmd):
+    """Has a bug unrelated to stack slots"""
+
+    def virtualize(self, linker: SmtLinker, stack_level: int) -> List[ComCmd]:
+        return [ComCmd("say " + len(linker))]  # type: ignore
+
+
+def _build_linker():
+    module = SmtModule()
+    var = module.initial_function.new_pseudo_var(InertType(InertCoreTypes.INT))
+    linker = SmtLinker("prj_ns", 5)
+    linker.add_bland_var(var, ["example"], stackless=False)
+    return linker, var
+
+
+@pytest.mark.parametrize("stack_levels", [[0], [1, 2, 3], [4]])
+def test_templated_matches_direct(stack_levels: List[int]):
+    linker, var = _build_linker()
+    cmds = [SmtAssignCmd(var, SmtConstInt(3)), SmtPlusCmd(var, SmtConstInt(7)), _LevelDependantCmd()]
+    templated = convert_smtcmds_templated(cmds, linker, stack_levels, Config())
+    for rix in stack_levels:
+        direct = convert_smtcmds(cmds, linker, rix, Config())
+        assert [cmd.cmd for cmd in templated[rix]] == [cmd.cmd for cmd in direct]
+
+
+def test_stack_slot_offsets_render():
+    linker, var = _build_linker()
+    template = linker.compile_template(linker.lookup_var(var).get_store_path(SmtStackSlot() + 1))  # type: ignore
+    assert linker.instantiate(template, 3) == "example.r4I"
+
+
+def test_stack_slot_rejects_concrete_use():
+    with pytest.raises(SmtStackSlotMisuse):
+        str(SmtStackSlot())
+    with pytest.raises(SmtStackSlotMisuse):
+        _ = SmtStackSlot() == 0
+    with pytest.raises(SmtStackSlotMisuse):
+        _ = -SmtStackSlot()
+    with pytest.raises(SmtStackSlotMisuse):
+        _ = SmtStackSlot() // 2
+
+
+def test_templating_does_not_hide_bugs():
+    linker, _ = _build_linker()
+    with pytest.raises(TypeError):
+        convert_smtcmds_templated([_BrokenCmd()], linker, [0, 1], Config())
+
+
+def test_macro_function_generated_once():
+    code = "def count(n: int) -> int {\n    if n <= 0 {\n        return 0\n    }\n    return 1 + count(n - 1)\n}\nprint(count(3))"
+    config = Config(recursion_limit=5, target_version=(1, 20, 4))
+    vir_dp = conv_smt_vir(conv_cst_smt(conv_ast_cst(mchy_parse(code, config), config=config), config=config), config=config)
+    func_fld = vir_dp.mchy_func_fld.get_child_with_name("count_world")
+    assert isinstance(func_fld, VirFolder)
+    assert {child.fs_name for child in func_fld.children} == {"fragments", "run.mcfunction", "recursion_limit.mcfunction"}
+    run_file = func_fld.get_child_with_name("run.mcfunction")
+    assert isinstance(run_file, VirMCHYFile)
+    assert run_file.lines[0].cmd.startswith("$execute if data storage prj_ns:mchy mchy_levels[$(p0)].limit run return run function ")
+    frags_fld = func_fld.get_child_with_name("fragments")
+    assert isinstance(frags_fld, VirFolder)
+    lines = [line.cmd for file in [run_file] + list(frags_fld.children) if isinstance(file, VirMCHYFile) for line in file.lines]
+    assert any(line.startswith("$function ") and line.endswith("/count_world/run with storage prj_ns:mchy mchy_levels[$(p1)]") for line in lines)
+    assert any(line.cmd.startswith("data modify storage prj_ns:mchy mchy_levels set value [{p0:\"0\",z0:\"000\"") for line in vir_dp.load_master_file.lines)
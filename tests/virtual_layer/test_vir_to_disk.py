@@ -0,0 +1,147 @@
+from mchy.common.com_cmd import ComCmd
+from mchy.common.config import Config
+from mchy.stmnt.struct import SmtModule
+from mchy.virtual.generation import convert
+from mchy.virtual.to_disk import MANIFEST_FILE_NAME, apply_incremental_write, plan_incremental_write, to_zip
+from mchy.virtual.vir_dirs import VirFolder, VirMCHYFile, VirRawFile
+import os
+import pytest
+import zipfile
+
+
+def _build_tree() -> VirFolder:
+    root = VirFolder("root")
+    VirRawFile("pack.mcmeta", root, "{}")
+    fld = VirFolder("fld", root)
+    VirMCHYFile("a.mcfunction", fld, [ComCmd("say a")])
+    VirMCHYFile("b.mcfunction", fld, [ComCmd("say b")])
+    return root
+
+
+def test_fresh_write(tmp_path):
+    plan = plan_incremental_write(_build_tree(), str(tmp_path))
+    assert len(plan.writes) == 3
+    apply_incremental_write(plan)
+    with open(os.path.join(tmp_path, "fld", "a.mcfunction")) as file:
+        assert file.read() == "say a\n"
+    assert os.path.exists(os.path.join(tmp_path, MANIFEST_FILE_NAME))
+
+
+def test_unchanged_rewrite_is_empty(tmp_path):
+    apply_incremental_write(plan_incremental_write(_build_tree(), str(tmp_path)))
+    plan = plan_incremental_write(_build_tree(), str(tmp_path))
+    assert plan.is_empty
+    assert plan.unchanged == 3
+
+
+def test_only_changes_written(tmp_path):
+    apply_incremental_write(plan_incremental_write(_build_tree(), str(tmp_path)))
+    new_tree = _build_tree()
+    fld = new_tree.get_child_with_name("fld")
+    assert isinstance(fld, VirFolder)
+    fld.delete_child(fld.get_child_with_name("b.mcfunction"))  # type: ignore
+    VirMCHYFile("c.mcfunction", VirFolder("new", new_tree), [ComCmd("say c")])
+    a_file = fld.get_child_with_name("a.mcfunction")
+    assert isinstance(a_file, VirMCHYFile)
+    a_file.append(ComCmd("say a2"))
+
+    plan = plan_incremental_write(new_tree, str(tmp_path))
+    assert sorted(path for path, _ in plan.writes) == ["fld/a.mcfunction", "new/c.mcfunction"]
+    assert plan.deletes == ["fld/b.mcfunction"]
+    assert plan.unchanged == 1
+    apply_incremental_write(plan)
+    assert not os.path.exists(os.path.join(tmp_path, "fld", "b.mcfunction"))
+    assert plan_incremental_write(new_tree, str(tmp_path)).is_empty
+
+
+def test_stale_folders_removed(tmp_path):
+    apply_incremental_write(plan_incremental_write(_build_tree(), str(tmp_path)))
+    root = VirFolder("root")
+    VirRawFile("pack.mcmeta", root, "{}")
+    plan = plan_incremental_write(root, str(tmp_path))
+    assert plan.rmdirs == ["fld"]
+    apply_incremental_write(plan)
+    assert not os.path.exists(os.path.join(tmp_path, "fld"))
+
+
+def test_hand_edited_file_rewritten(tmp_path):
+    apply_incremental_write(plan_incremental_write(_build_tree(), str(tmp_path)))
+    with open(os.path.join(tmp_path, "fld", "a.mcfunction"), "w") as file:
+        file.write("say edited\n")
+    plan = plan_incremental_write(_build_tree(), str(tmp_path))
+    assert [path for path, _ in plan.writes] == ["fld/a.mcfunction"]
+
+
+def test_vir_dp_write_to_disk_twice(tmp_path):
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    config = Config(output_path=str(tmp_path), do_backup=True)
+    convert(module, config=config).write_to_disk()
+    prj_path = os.path.join(tmp_path, config.project_name)
+    assert os.path.exists(os.path.join(prj_path, "generated.txt"))
+    convert(module, config=config).write_to_disk()
+    assert not os.path.exists(prj_path + ".backup.zip"), "Backup made even though nothing changed"
+
+
+def test_to_zip(tmp_path):
+    zip_path = os.path.join(tmp_path, "dp.zip")
+    assert to_zip(_build_tree(), zip_path) == 3
+    with zipfile.ZipFile(zip_path) as archive:
+        assert sorted(archive.namelist()) == ["fld/a.mcfunction", "fld/b.mcfunction", "pack.mcmeta"]
+        assert archive.read("fld/a.mcfunction") == b"say a\n"
+    assert os.listdir(tmp_path) == ["dp.zip"]
+
+
+def test_to_zip_deterministic(tmp_path):
+    to_zip(_build_tree(), os.path.join(tmp_path, "a.zip"))
+    to_zip(_build_tree(), os.path.join(tmp_path, "b.zip"))
+    with open(os.path.join(tmp_path, "a.zip"), "rb") as file_a, open(os.path.join(tmp_path, "b.zip"), "rb") as file_b:
+        assert file_a.read() == file_b.read()
+
+
+def test_vir_dp_write_zip(tmp_path):
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    config = Config(output_path=str(tmp_path), do_backup=True, output_zip=True)
+    convert(module, config=config).write_to_disk()
+    zip_path = os.path.join(tmp_path, config.project_name + ".zip")
+    with zipfile.ZipFile(zip_path) as archive:
+        assert "pack.mcmeta" in archive.namelist()
+        assert "generated.txt" in archive.namelist()
+    assert not os.path.exists(os.path.join(tmp_path, config.project_name)), "Folder tree written in zip mode"
+    convert(module, config=config).write_to_disk()
+    with zipfile.ZipFile(os.path.join(tmp_path, config.project_name + ".backup.zip")) as archive:
+        assert "pack.mcmeta" not in archive.namelist(), "Backup would be loaded as a second datapack"
+        assert config.project_name + "/pack.mcmeta" in archive.namelist()
+        assert config.project_name + "/generated.txt" in archive.namelist()
+
+
+def test_vir_dp_switch_zip_and_folder_output(tmp_path):
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    zip_config = Config(output_path=str(tmp_path), do_backup=True, output_zip=True)
+    folder_config = Config(output_path=str(tmp_path), do_backup=True, output_zip=False)
+    zip_path = os.path.join(tmp_path, zip_config.project_name + ".zip")
+    convert(module, config=zip_config).write_to_disk()
+    with open(zip_path, "rb") as file:
+        shipped = file.read()
+    convert(module, config=folder_config).write_to_disk()
+    with open(os.path.join(tmp_path, folder_config.project_name, "generated.txt"), "a") as file:
+        file.write("edited\n")  # Forces a rewrite, so the folder is backed up
+    convert(module, config=folder_config).write_to_disk()
+    with open(zip_path, "rb") as file:
+        assert file.read() == shipped, "Folder backup overwrote the zip output"
+    assert os.path.exists(os.path.join(tmp_path, folder_config.project_name + ".backup.zip"))
+    convert(module, config=zip_config).write_to_disk()
+    with zipfile.ZipFile(zip_path) as archive:
+        assert "pack.mcmeta" in archive.namelist()
+
+
+def test_vir_dp_write_zip_refuses_foreign_archive(tmp_path):
+    config = Config(output_path=str(tmp_path), output_zip=True)
+    with zipfile.ZipFile(os.path.join(tmp_path, config.project_name + ".zip"), mode="w") as archive:
+        archive.writestr("important.txt", "data")
+    module = SmtModule()
+    module.create_all_lazy_variables()
+    with pytest.raises(SystemExit):
+        convert(module, config=config).write_to_disk()